@@ -0,0 +1,157 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark the time authenticated commands spend getting an AAD token, once the token
+selected with cluster select is about to expire. Tokens are acquired through adal on each
+session as before, and through the token manager, which refreshes them in the background.
+
+Each command is run as a new sfctl process would, parsing the configuration again and
+starting with no token in memory. A refresh started in the background is waited for before
+the next command, as a process exiting does. The token endpoint is a local HTTPS server
+which answers after a fixed latency. Reports the time per command spent waiting for a token,
+and the number of token requests.
+
+The configuration is written to a temporary folder, so that the user's sfctl configuration
+is not touched.
+
+Usage: python scripts/benchmarks/aad_token.py [--commands N] [--latency S]
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import ssl
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import adal
+from adal.token_cache import TokenCache
+from mock import patch
+import sfctl.config as sf_config
+from sfctl import aad_token
+from sfctl.auth import AdalAuthentication
+from sfctl.tests.helpers import write_self_signed_cert
+
+RESOURCE = 'https://cluster.contoso.com'
+CLIENT_ID = 'client-id'
+
+
+class TokenHandler(BaseHTTPRequestHandler):
+    """Stand in for the AAD token endpoint, redeeming refresh tokens after the latency"""
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0
+    requests = 0
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a token request"""
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(TokenHandler.latency)
+        TokenHandler.requests += 1
+        body = json.dumps({'token_type': 'Bearer', 'expires_in': 3600, 'resource': RESOURCE,
+                           'access_token': 'access', 'refresh_token': 'refresh'})
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """Handle each request on its own thread"""
+    daemon_threads = True
+
+
+def signed_session_before():
+    """Acquire the token through adal, as AdalAuthentication.signed_session did"""
+    authority_uri, cluster_id, client_id = sf_config.aad_metadata()
+    existing_token, existing_cache = sf_config.aad_cache()
+    context = adal.AuthenticationContext(authority_uri, cache=existing_cache)
+    context.acquire_token(cluster_id, existing_token['userId'], client_id)
+
+
+def signed_session_after():
+    """Create a session with the token manager"""
+    AdalAuthentication().signed_session()
+
+
+def select(authority, expires_in):
+    """Save a token expiring in the given number of seconds, as cluster select does"""
+    token = {'tokenType': 'Bearer', 'expiresIn': 3600, 'resource': RESOURCE,
+             'accessToken': 'access', 'refreshToken': 'refresh', 'userId': 'user',
+             'isMRRT': True, '_clientId': CLIENT_ID, '_authority': authority,
+             'expiresOn': str(datetime.now() + timedelta(seconds=expires_in))}
+    sf_config.set_auth(aad=True)
+    sf_config.set_aad_metadata(authority, RESOURCE, CLIENT_ID)
+    sf_config.set_aad_cache(token, TokenCache(json.dumps([token])))
+    sf_config.flush_snapshots()
+
+
+def main():
+    """Run the AAD token benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--commands', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parsed_args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    sf_config.SF_CLI_CONFIG_DIR = temp_dir
+    cert_path, key_path = write_self_signed_cert(temp_dir)
+
+    TokenHandler.latency = parsed_args.latency
+    server = ThreadingHTTPServer(('localhost', 0), TokenHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    authority = 'https://localhost:{0}/tenant'.format(server.server_address[1])
+
+    os.environ['REQUESTS_CA_BUNDLE'] = cert_path
+    # The stand in endpoint is not a known AAD instance
+    discovery = patch('adal.authority.Authority._validate_via_instance_discovery',
+                      new=lambda _: None)
+    discovery.start()
+
+    try:
+        for name, signed_session in (('adal on each session', signed_session_before),
+                                     ('token manager', signed_session_after)):
+            # Expires within the clock buffer of adal, so that it is refreshed
+            select(authority, expires_in=200)
+            TokenHandler.requests = 0
+            waited = 0
+            for _ in range(parsed_args.commands):
+                sf_config.clear_snapshots()
+                aad_token.clear_token_managers()
+
+                start = time.perf_counter()
+                signed_session()
+                waited += time.perf_counter() - start
+
+                # A process waits for the background refresh before it exits
+                refresh_thread = aad_token.get_token_manager().refresh_thread
+                if refresh_thread is not None:
+                    refresh_thread.join()
+
+            print('{0:22} {1:8.1f} ms per command {2:4d} token requests'.format(
+                name, waited * 1000 / parsed_args.commands, TokenHandler.requests))
+    finally:
+        discovery.stop()
+        server.shutdown()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
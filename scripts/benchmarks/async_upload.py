@@ -0,0 +1,104 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark uploading a package of many small files to the native image store with the
+thread pool and with the asyncio transport, at increasing concurrency.
+
+Runs a mock gateway on an asyncio event loop in a background thread, so that it can hold
+thousands of requests open at once. Each image store upload is answered after a fixed
+latency, to stand in for the round trip to a remote cluster. Requires aiohttp.
+
+Usage: python scripts/benchmarks/async_upload.py [--files N] [--latency S]
+"""
+
+from __future__ import print_function
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+from sfctl.async_transport import AsyncGatewayClient
+from sfctl.custom_app import create_upload_session, upload_to_native_imagestore
+from sfctl.upload_async import upload_to_native_imagestore_async
+
+
+def start_mock_gateway(latency):
+    """Start the mock gateway on a free port, and return its endpoint"""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    endpoint = []
+
+    async def upload(request):
+        await request.read()
+        await asyncio.sleep(latency)
+        return web.Response()
+
+    async def start():
+        app = web.Application()
+        app.router.add_put('/ImageStore/{path:.*}', upload)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, 'localhost', 0, backlog=1024)
+        await site.start()
+        endpoint.append('http://localhost:{0}'.format(
+            site._server.sockets[0].getsockname()[1]))  # pylint: disable=protected-access
+        started.set()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(start())
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return endpoint[0]
+
+
+def main():
+    """Run the async upload benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parsed_args = parser.parse_args()
+
+    endpoint = start_mock_gateway(parsed_args.latency)
+
+    # 10 files in each folder
+    temp_dir = tempfile.mkdtemp()
+    package = os.path.join(temp_dir, 'AsyncBenchmark')
+    for index in range(parsed_args.files):
+        folder = os.path.join(package, 'folder{0}'.format(index // 10))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(os.path.join(folder, 'file{0}.txt'.format(index)), 'wb') as small_file:
+            small_file.write(os.urandom(1024))
+    uploads = parsed_args.files + sum(1 for _ in os.walk(package))
+
+    try:
+        for concurrency in (10, 100, 500):
+            for transport in ('threads', 'asyncio'):
+                with create_upload_session(concurrency) as sesh:
+                    start = time.time()
+                    if transport == 'threads':
+                        upload_to_native_imagestore(sesh, endpoint, package, 'AsyncBenchmark',
+                                                    False, 3600, concurrency=concurrency)
+                    else:
+                        asyncio.run(upload_to_native_imagestore_async(
+                            AsyncGatewayClient(sesh, concurrency), endpoint, package,
+                            'AsyncBenchmark', False, 3600, concurrency=concurrency))
+                    elapsed = time.time() - start
+                print('{0:8} concurrency {1:<4} {2:8.2f} s {3:8.1f} uploads/s'.format(
+                    transport, concurrency, elapsed, uploads / elapsed))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
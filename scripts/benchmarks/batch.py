@@ -0,0 +1,77 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark running many commands with sfctl batch against a shell style loop.
+
+Starts the test mock server, selects it as the cluster, and runs the same number of
+partition health commands, first as one sfctl process per command, then as a single
+sfctl batch. The home directory is pointed at a temporary folder so that the user's
+sfctl configuration is not touched.
+
+Usage: python scripts/benchmarks/batch.py [--commands N] [--concurrency N]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from sfctl.tests.mock_server import (MockServer, find_localhost_free_port,
+                                     start_mock_server)
+
+LAUNCH = 'import sys; from sfctl import launch; sys.argv = ["sfctl"] + sys.argv[1:]; sys.exit(launch())'
+
+
+def run_sfctl(args, env, stdin=None):
+    """Run sfctl and return the wall time in seconds"""
+    start = time.time()
+    subprocess.run([sys.executable, '-c', LAUNCH] + args, env=env, input=stdin, check=False,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.time() - start
+
+
+def main():
+    """Run the batch benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--commands', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parsed_args = parser.parse_args()
+
+    # Keep the request log of the mock server out of the results
+    MockServer.log_message = lambda *_: None
+    port = find_localhost_free_port()
+    start_mock_server(port)
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['USERPROFILE'] = home
+
+    commands = [['partition', 'health', '--partition-id', str(i)]
+                for i in range(parsed_args.commands)]
+
+    try:
+        run_sfctl(['cluster', 'select', '--endpoint', 'http://localhost:{0}'.format(port)], env)
+        # Build the command index, so both scenarios measure steady state latency
+        run_sfctl(commands[0], env)
+
+        loop_time = sum(run_sfctl(command, env) for command in commands)
+        print('{0} commands, one process each: {1:8.2f} s'.format(len(commands), loop_time))
+
+        batch_input = '\n'.join(' '.join(command) for command in commands).encode('utf-8')
+        batch_time = run_sfctl(['batch', '--concurrency', str(parsed_args.concurrency)],
+                               env, stdin=batch_input)
+        print('{0} commands, sfctl batch:      {1:8.2f} s'.format(len(commands), batch_time))
+    finally:
+        shutil.rmtree(home)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark running node list on a fleet of clusters, one cluster at a time by selecting
+each cluster before the command, as before, and on all clusters at once with
+--all-clusters.
+
+Each cluster is a local HTTP server, which answers every request after a latency drawn
+between --min-latency and --max-latency, the same for both scenarios. Commands run in
+this process. Reports the total time of each scenario, and the latency of the slowest
+cluster.
+
+The home directory is pointed at a temporary folder, so that the user's sfctl configuration
+is not touched.
+
+Usage: python scripts/benchmarks/cluster_fanout.py [--clusters N] [--min-latency S]
+    [--max-latency S]
+"""
+
+from __future__ import print_function
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class ClusterHandler(BaseHTTPRequestHandler):
+    """Answer node list with a single node, after the latency of the cluster"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer after the latency"""
+        time.sleep(self.server.latency)
+        body = json.dumps({'ContinuationToken': '',
+                           'Items': [{'Name': '_Node_0'}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """Handle each request on its own thread"""
+    daemon_threads = True
+
+
+def main():
+    """Run the cluster fan out benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clusters', type=int, default=20)
+    parser.add_argument('--min-latency', type=float, default=0.05)
+    parser.add_argument('--max-latency', type=float, default=0.3)
+    parsed_args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    os.environ['HOME'] = home
+    os.environ['SFCTL_SERVICEFABRIC_USE_TELEMETRY'] = 'false'
+
+    # Imported once the home directory is set, since the config directory is found on import
+    import sfctl.config as sf_config
+    from sfctl.entry import run_command
+
+    servers = []
+    for index in range(parsed_args.clusters):
+        server = ThreadingHTTPServer(('localhost', 0), ClusterHandler)
+        server.latency = random.uniform(parsed_args.min_latency, parsed_args.max_latency)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+        with sf_config.using_profile('cluster-{0}'.format(index)):
+            sf_config.set_cluster_endpoint('http://localhost:{0}'.format(server.server_address[1]))
+            sf_config.set_no_verify(False)
+            sf_config.set_ca_cert(None)
+            sf_config.set_auth()
+    sf_config.flush_snapshots()
+
+    def select_each():
+        # cluster select also sends a request to the cluster, so it is timed as well
+        for server in servers:
+            run_command(['cluster', 'select', '--endpoint',
+                         'http://localhost:{0}'.format(server.server_address[1])],
+                        out_file=io.StringIO())
+            run_command(['node', 'list'], out_file=io.StringIO())
+
+    def fan_out():
+        run_command(['node', 'list', '--all-clusters'], out_file=io.StringIO())
+
+    stderr = sys.stderr
+    try:
+        # Load the command index and import the SDK before timing
+        run_command(['cluster', 'profile', 'list'], out_file=io.StringIO())
+
+        for name, scenario in (('select each cluster', select_each),
+                               ('--all-clusters', fan_out)):
+            sys.stderr = io.StringIO()
+            start = time.time()
+            try:
+                scenario()
+            finally:
+                sys.stderr = stderr
+            print('{0:20} {1:8.1f} ms'.format(name, (time.time() - start) * 1000))
+
+        print('{0:20} {1:8.1f} ms'.format('slowest cluster',
+                                          max(server.latency for server in servers) * 1000))
+    finally:
+        sys.stderr = stderr
+        for server in servers:
+            server.shutdown()
+        shutil.rmtree(home)
+
+
+if __name__ == '__main__':
+    main()
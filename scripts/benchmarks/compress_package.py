@@ -0,0 +1,100 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark compressing an application package with several services, with one process
+and with one process per CPU, at several compression levels, and again with the compression
+cache after the config of one service changed.
+
+The package is generated with one code and one config package per service. Half of each
+code package is made of text, which compresses well, and half of random bytes, which stands
+in for binaries which are already compressed.
+
+Usage: python scripts/benchmarks/compress_package.py [--services N] [--size MB]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from sfctl.compression_cache import CompressionCache, get_compression_cache_dir
+from sfctl.package_compression import compress_package
+from sfctl.upload_util import get_cpu_count
+
+
+def create_package(app_dir, services, size):
+    """Create an application package with the given number of services of size bytes"""
+    imports = ''.join('<ServiceManifestImport><ServiceManifestRef ServiceManifestName='
+                      '"Svc{0}Pkg" ServiceManifestVersion="1.0"/></ServiceManifestImport>'
+                      .format(index) for index in range(services))
+    os.makedirs(app_dir)
+    with open(os.path.join(app_dir, 'ApplicationManifest.xml'), 'w') as app_manifest:
+        app_manifest.write('<ApplicationManifest>{0}</ApplicationManifest>'.format(imports))
+
+    text = b''.join(b'line %d of a log file or of source code\n' % line
+                    for line in range(size // 80))
+    for index in range(services):
+        code_dir = os.path.join(app_dir, 'Svc{0}Pkg'.format(index), 'Code')
+        os.makedirs(code_dir)
+        with open(os.path.join(code_dir, '..', 'ServiceManifest.xml'), 'w') as manifest:
+            manifest.write('<ServiceManifest><CodePackage Name="Code" Version="1.0"/>'
+                           '<ConfigPackage Name="Config" Version="1.0"/></ServiceManifest>')
+        os.makedirs(os.path.join(code_dir, '..', 'Config'))
+        with open(os.path.join(code_dir, '..', 'Config', 'Settings.xml'), 'w') as settings:
+            settings.write('<Settings/>')
+        with open(os.path.join(code_dir, 'readme.txt'), 'wb') as text_file:
+            text_file.write(text)
+        with open(os.path.join(code_dir, 'service.bin'), 'wb') as binary_file:
+            binary_file.write(os.urandom(size // 2))
+
+
+def main():
+    """Run the compression benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--services', type=int, default=8)
+    parser.add_argument('--size', type=int, default=32)
+    parsed_args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    app_dir = os.path.join(temp_dir, 'App')
+    create_package(app_dir, parsed_args.services, parsed_args.size * 1024 * 1024)
+    print('{0} services of {1} MB, {2} CPUs'.format(parsed_args.services, parsed_args.size,
+                                                   get_cpu_count()))
+
+    try:
+        for compression_level in (0, 1, None, 9):
+            for jobs in sorted({1, get_cpu_count()}):
+                output_dir = os.path.join(temp_dir, 'output')
+                start = time.time()
+                compress_package(app_dir, output_dir, link_files=True,
+                                 compression_level=compression_level, jobs=jobs)
+                elapsed = time.time() - start
+                size = sum(os.path.getsize(os.path.join(root, single_file))
+                           for root, _, files in os.walk(output_dir) for single_file in files)
+                shutil.rmtree(output_dir)
+                print('level {0:7} jobs {1:<3} {2:8.2f} s {3:8.1f} MB'.format(
+                    str(compression_level), jobs, elapsed, size / 1024.0 / 1024))
+
+        output_dir = os.path.join(temp_dir, 'output')
+        cache = CompressionCache(get_compression_cache_dir(output_dir), 1024 * 1024 * 1024,
+                                 link_files=True)
+        for name in ('cache, first build', 'cache, config changed'):
+            if name != 'cache, first build':
+                with open(os.path.join(app_dir, 'Svc0Pkg', 'Config', 'Settings.xml'),
+                          'w') as settings:
+                    settings.write('<Settings><Section Name="Changed"/></Settings>')
+            start = time.time()
+            compress_package(app_dir, output_dir, link_files=True, cache=cache)
+            print('{0:24} {1:8.2f} s'.format(name, time.time() - start))
+            shutil.rmtree(os.path.join(output_dir, 'App'))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark the setup cost of apiclient.create, with each setting read from a newly
+parsed configuration file as before, and from the snapshot parsed once per process.
+
+apiclient.create is timed creating a new client for each call, and reusing the client of
+the first call, as commands run in the same process do. Each call reads all the settings it
+needs either way. Also times the settings read and written by cluster select, and
+counts the configuration files opened by each scenario.
+
+The configuration is written to a temporary folder, so that the user's sfctl
+configuration is not touched.
+
+Usage: python scripts/benchmarks/config_snapshot.py [--calls N] [--runs N]
+"""
+
+from __future__ import print_function
+import argparse
+import builtins
+import os
+import shutil
+import tempfile
+import time
+
+import sfctl.config as sf_config
+from sfctl import apiclient
+from sfctl.config import CLIConfig
+
+
+def create_reused():
+    """Create a client, reusing the client of an earlier call"""
+    os.environ['SFCTL_SERVICEFABRIC_CLIENT_MAX_IDLE'] = '300'
+    try:
+        apiclient.create(None)
+    finally:
+        del os.environ['SFCTL_SERVICEFABRIC_CLIENT_MAX_IDLE']
+
+
+def select_cluster():
+    """Write and read the settings as sfctl cluster select and the cluster version check
+    following it do"""
+    sf_config.set_cluster_endpoint('http://localhost:19080')
+    sf_config.set_no_verify(False)
+    sf_config.set_ca_cert(None)
+    sf_config.set_auth()
+    sf_config.get_cluster_auth()
+
+
+def main():
+    """Run the config snapshot benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=5)
+    parsed_args = parser.parse_args()
+
+    config_dir = tempfile.mkdtemp()
+    sf_config.SF_CLI_CONFIG_DIR = config_dir
+    sf_config.set_cluster_endpoint('http://localhost:19080')
+    sf_config.set_auth()
+    # Create a new client for each call
+    sf_config.set_config_value('client_max_idle', '0')
+    sf_config.clear_snapshots()
+
+    def parse_every_time():
+        # As each getter and setter did before, writing each setting as it is set
+        return CLIConfig(config_dir, sf_config.SF_CLI_ENV_VAR_PREFIX)
+
+    snapshot_of_process = sf_config._get_config_snapshot  # pylint: disable=protected-access
+
+    scenarios = [('apiclient.create', lambda: apiclient.create(None)),
+                 ('apiclient.create, reused', create_reused),
+                 ('cluster select settings', select_cluster)]
+
+    opened = []
+    builtin_open = builtins.open
+
+    def counting_open(file, *args, **kwargs):
+        if str(file).startswith(config_dir):
+            opened.append(file)
+        return builtin_open(file, *args, **kwargs)
+
+    try:
+        for name, call in scenarios:
+            for label, get_snapshot in (('parse every time', parse_every_time),
+                                        ('snapshot', snapshot_of_process)):
+                sf_config._get_config_snapshot = get_snapshot  # pylint: disable=protected-access
+                best = None
+                for _ in range(parsed_args.runs):
+                    sf_config.clear_snapshots()
+                    del opened[:]
+                    builtins.open = counting_open
+                    start = time.perf_counter()
+                    for _ in range(parsed_args.calls):
+                        call()
+                        # Settings are written once the command completes
+                        sf_config.flush_snapshots()
+                    elapsed = time.perf_counter() - start
+                    builtins.open = builtin_open
+                    if best is None or elapsed < best:
+                        best = elapsed
+                print('{0:26} {1:17} {2:8.3f} ms {3:6.1f} files opened per call'.format(
+                    name, label, best * 1000 / parsed_args.calls,
+                    len(opened) / float(parsed_args.calls)))
+    finally:
+        builtins.open = builtin_open
+        shutil.rmtree(config_dir)
+
+
+if __name__ == '__main__':
+    main()
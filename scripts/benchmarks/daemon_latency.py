@@ -0,0 +1,85 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark per command latency with and without the sfctl daemon.
+
+Starts the test mock server, selects it as the cluster, and runs the same command
+repeatedly, first in a new sfctl process each time, then forwarded to the daemon.
+The home directory is pointed at a temporary folder so that the user's sfctl
+configuration and daemon are not touched.
+
+Usage: python scripts/benchmarks/daemon_latency.py [--runs N]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from sfctl.tests.mock_server import (MockServer, find_localhost_free_port,
+                                     start_mock_server)
+
+COMMAND = ['node', 'info', '--node-name', 'node1']
+
+
+def run_sfctl(args, env):
+    """Run sfctl through its console script entry point and return the wall time in seconds"""
+    code = 'import sys; from sfctl import launch; sys.argv = {0!r}; sys.exit(launch())'.format(
+        ['sfctl'] + args)
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', code], env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.time() - start
+
+
+def summarize(name, samples):
+    """Print the min and median of the given samples in milliseconds"""
+    samples = sorted(samples)
+    median = samples[len(samples) // 2]
+    print('{0:<45} min {1:8.1f} ms   median {2:8.1f} ms'.format(
+        name, samples[0] * 1000, median * 1000))
+
+
+def main():
+    """Run the daemon latency benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=20)
+    runs = parser.parse_args().runs
+
+    # Keep the request log of the mock server out of the results
+    MockServer.log_message = lambda *_: None
+    port = find_localhost_free_port()
+    start_mock_server(port)
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['USERPROFILE'] = home
+
+    try:
+        run_sfctl(['cluster', 'select', '--endpoint', 'http://localhost:{0}'.format(port)], env)
+        # Build the command index, so both scenarios measure steady state latency
+        run_sfctl(COMMAND, env)
+
+        summarize('node info, new process per command',
+                  [run_sfctl(COMMAND, env) for _ in range(runs)])
+
+        run_sfctl(['daemon', 'start'], env)
+        try:
+            summarize('node info, forwarded to daemon',
+                      [run_sfctl(COMMAND, env) for _ in range(runs)])
+        finally:
+            run_sfctl(['daemon', 'stop'], env)
+    finally:
+        shutil.rmtree(home)
+
+
+if __name__ == '__main__':
+    main()
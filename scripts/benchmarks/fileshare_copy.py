@@ -0,0 +1,77 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark copying a package with many files to a file share image store, with increasing
+concurrency, then again with the files already copied, and with hard links.
+
+Opening and closing files on a network file share costs a round trip each, which a local
+folder does not. To stand in for it, each copy waits for a fixed latency first, which the
+threads of the copy wait for at the same time. Pass --dest to copy to a mounted share
+instead, with --latency 0.
+
+Usage: python scripts/benchmarks/fileshare_copy.py [--files N] [--size KB] [--latency S]
+                                                   [--dest PATH]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import sfctl.custom_app as sf_c
+
+
+def main():
+    """Run the file share copy benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=400)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--dest', default=None)
+    parsed_args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    source = os.path.join(temp_dir, 'App')
+    for index in range(parsed_args.files):
+        folder = os.path.join(source, 'Svc{0}Pkg'.format(index % 20), 'Code')
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(os.path.join(folder, 'file{0}.dll'.format(index)), 'wb') as package_file:
+            package_file.write(os.urandom(parsed_args.size * 1024))
+    dest = os.path.join(parsed_args.dest or temp_dir, 'Store', 'App')
+
+    copy_file_range = sf_c._copy_file_range  # pylint: disable=protected-access
+
+    def copy_with_latency(src, dst):
+        time.sleep(parsed_args.latency)
+        copy_file_range(src, dst)
+
+    sf_c._copy_file_range = copy_with_latency  # pylint: disable=protected-access
+
+    scenarios = [('concurrency {0}'.format(concurrency), concurrency, False, True)
+                 for concurrency in (1, 4, 16)]
+    scenarios += [('already copied', 16, False, False), ('hard links', 16, True, True)]
+
+    try:
+        for name, concurrency, link_files, clean in scenarios:
+            if clean:
+                shutil.rmtree(dest, ignore_errors=True)
+            start = time.time()
+            sf_c.upload_to_fileshare(source, dest, False, concurrency=concurrency,
+                                     link_files=link_files)
+            elapsed = time.time() - start
+            print('{0:16} {1:8.2f} s {2:8.1f} files/s'.format(name, elapsed,
+                                                             parsed_args.files / elapsed))
+    finally:
+        shutil.rmtree(temp_dir)
+        if parsed_args.dest:
+            shutil.rmtree(dest, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
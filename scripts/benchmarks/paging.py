@@ -0,0 +1,51 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark writing all pages of a list command, with and without prefetching.
+
+Pages are served by a fake list operation which waits for a fixed latency before
+returning each page, and are written to /dev/null the same way as 'sfctl node list --all'.
+
+Usage: python scripts/benchmarks/paging.py [--pages N] [--page-size N] [--latency S]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import time
+
+from azure.servicefabric.models import PagedNodeInfoList, NodeInfo
+from sfctl.custom_paging import prefetch_pages, write_pages
+
+
+def main():
+    """Run the paging benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parsed_args = parser.parse_args()
+
+    items = [NodeInfo(name='node{0}'.format(i), ip_address_or_fqdn='10.0.0.1',
+                      type='NodeType0', code_version='7.1.409.9590', health_state='Ok')
+             for i in range(parsed_args.page_size)]
+
+    def get_page(token):
+        """Return the page after the given token, after waiting for the latency"""
+        time.sleep(parsed_args.latency)
+        index = int(token or 0) + 1
+        next_token = str(index) if index < parsed_args.pages else ''
+        return PagedNodeInfoList(continuation_token=next_token, items=items)
+
+    with open(os.devnull, 'w') as out_file:
+        for depth in (0, 1, 2, 4):
+            start = time.time()
+            write_pages(prefetch_pages(get_page, depth=depth), out_file)
+            print('prefetch depth {0}: {1:6.2f} s'.format(depth, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
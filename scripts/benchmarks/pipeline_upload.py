@@ -0,0 +1,94 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark compressing and uploading an application package with several services to the
+native image store, one stage after the other, and pipelined as by upload --pipeline.
+
+The package is generated as by compress_package.py. Starts the test mock server with
+concurrent request handling. Each request is read at a limited bandwidth and answered after
+a fixed latency, to stand in for the throughput of one connection to a remote cluster.
+Since the bandwidth is per connection, the upload concurrency stands in for the total
+bandwidth of the link to the cluster.
+
+Usage: python scripts/benchmarks/pipeline_upload.py [--services N] [--size MB]
+                                                    [--bandwidth MB/S] [--latency S]
+                                                    [--concurrency N]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from compress_package import create_package
+from sfctl.custom_app import create_upload_session, upload_to_native_imagestore
+from sfctl.package_compression import (compress_package, largest_folders_first,
+                                       prepare_compressed_package, zip_folder)
+from sfctl.tests.mock_server import MockServer, find_localhost_free_port, start_mock_server
+from sfctl.upload_util import get_cpu_count
+
+
+def main():
+    """Run the pipelined upload benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--services', type=int, default=8)
+    parser.add_argument('--size', type=int, default=16)
+    parser.add_argument('--bandwidth', type=float, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parsed_args = parser.parse_args()
+    concurrency = parsed_args.concurrency
+
+    # Keep the request log of the mock server out of the results
+    MockServer.log_message = lambda *_: None
+    MockServer.upload_latency = parsed_args.latency
+    MockServer.upload_bandwidth = parsed_args.bandwidth * 1024 * 1024
+    port = find_localhost_free_port()
+    start_mock_server(port, threaded=True)
+    endpoint = 'http://localhost:{0}'.format(port)
+
+    temp_dir = tempfile.mkdtemp()
+    app_dir = os.path.join(temp_dir, 'App')
+    output_dir = os.path.join(temp_dir, 'output')
+    package = os.path.join(output_dir, 'App')
+    create_package(app_dir, parsed_args.services, parsed_args.size * 1024 * 1024)
+    print('{0} services of {1} MB, {2} CPUs'.format(parsed_args.services, parsed_args.size,
+                                                   get_cpu_count()))
+
+    try:
+        for pipeline in (False, True):
+            start = time.time()
+            with create_upload_session(concurrency) as sesh:
+                if pipeline:
+                    pairs = prepare_compressed_package(app_dir, output_dir, link_files=True)
+                    with ProcessPoolExecutor(max_workers=get_cpu_count()) as executor:
+                        pending_files = dict(
+                            (zip_path, executor.submit(zip_folder, folder, zip_path))
+                            for folder, zip_path in largest_folders_first(pairs))
+                        upload_to_native_imagestore(sesh, endpoint, package, 'Benchmark',
+                                                    False, 3600, concurrency=concurrency,
+                                                    pending_files=pending_files)
+                else:
+                    compress_package(app_dir, output_dir, link_files=True)
+                    compressed = time.time() - start
+                    upload_to_native_imagestore(sesh, endpoint, package, 'Benchmark', False,
+                                                3600, concurrency=concurrency)
+            elapsed = time.time() - start
+            shutil.rmtree(output_dir)
+            if pipeline:
+                print('pipelined          {0:8.2f} s'.format(elapsed))
+            else:
+                print('one stage at once  {0:8.2f} s ({1:.2f} s compressing)'.format(
+                    elapsed, compressed))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark sfctl startup time.
+
+Compares the import cost of the modules sfctl used to import eagerly (all help modules
+and the Service Fabric SDK) against the lazy imports of the current entry point, and
+compares a full command table load against a load from the command index.
+
+Each scenario runs in a fresh interpreter, with the home directory pointed at a
+temporary folder so that the user's sfctl configuration is not touched.
+
+Usage: python scripts/benchmarks/startup.py [--runs N]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+EAGER_IMPORTS = ('import sfctl.entry, azure.servicefabric, adal, pkg_resources, '
+                 'sfctl.helps.app, sfctl.helps.settings, sfctl.helps.main, '
+                 'sfctl.helps.health, sfctl.helps.cluster_upgrade, sfctl.helps.compose, '
+                 'sfctl.helps.container, sfctl.helps.property, sfctl.helps.app_type, '
+                 'sfctl.helps.chaos, sfctl.helps.infrastructure, sfctl.helps.node')
+
+LAZY_IMPORTS = 'import sfctl.entry'
+
+RUN_COMMAND = ('import sys; from sfctl.entry import launch; '
+               'sys.argv = ["sfctl", "cluster", "show-connection"]; sys.exit(launch())')
+
+
+def time_python(code, env, before_each=None):
+    """Run python code in a new interpreter and return the wall time in seconds"""
+    if before_each is not None:
+        before_each()
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', code], env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.time() - start
+
+
+def summarize(name, samples):
+    """Print the min and median of the given samples in milliseconds"""
+    samples = sorted(samples)
+    median = samples[len(samples) // 2]
+    print('{0:<45} min {1:8.1f} ms   median {2:8.1f} ms'.format(
+        name, samples[0] * 1000, median * 1000))
+
+
+def main():
+    """Run the startup benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    runs = parser.parse_args().runs
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['USERPROFILE'] = home
+    index_path = os.path.join(home, '.sfctl', 'command_index.json')
+
+    def remove_index():
+        """Force a full command table load on the next run"""
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+    try:
+        summarize('import, eager (previous behavior)',
+                  [time_python(EAGER_IMPORTS, env) for _ in range(runs)])
+        summarize('import, lazy',
+                  [time_python(LAZY_IMPORTS, env) for _ in range(runs)])
+        summarize('cluster show-connection, no command index',
+                  [time_python(RUN_COMMAND, env, remove_index) for _ in range(runs)])
+        summarize('cluster show-connection, command index',
+                  [time_python(RUN_COMMAND, env) for _ in range(runs)])
+    finally:
+        shutil.rmtree(home)
+
+
+if __name__ == '__main__':
+    main()
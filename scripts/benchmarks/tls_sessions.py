@@ -0,0 +1,139 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark the TLS handshakes of client certificate authenticated connections, with the
+certificate paths handed to urllib3 for each connection as before, and with the SSL context
+shared by all connections of the process, which resumes TLS sessions.
+
+Each command creates a new session signed by ClientCertAuthentication, as a command run in
+the daemon or by a batch does once its idle connections were closed, and sends requests from
+a number of threads. The server is a local HTTPS server requiring a client certificate,
+which closes each connection after answering, so every request opens a new connection.
+Reports the time per request, and the number of full and resumed handshakes seen by the
+server.
+
+The certificates are written to a temporary folder.
+
+Usage: python scripts/benchmarks/tls_sessions.py [--commands N] [--requests N] [--threads N]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import ssl
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from requests.adapters import HTTPAdapter
+from sfctl import tls
+from sfctl.auth import ClientCertAuthentication
+from sfctl.tests.helpers import write_self_signed_cert
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    """Answer every request, closing the connection afterwards"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer with an empty list"""
+        body = b'{"Items": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        pass
+
+
+class GatewayServer(ThreadingMixIn, HTTPServer):
+    """HTTPS server requiring a client certificate, counting full and resumed handshakes"""
+    daemon_threads = True
+
+    def __init__(self, cert_path, key_path, client_ca):
+        HTTPServer.__init__(self, ('localhost', 0), GatewayHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        context.load_verify_locations(cafile=client_ca)
+        context.verify_mode = ssl.CERT_REQUIRED
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.full = 0
+        self.resumed = 0
+
+    def finish_request(self, request, client_address):
+        if request.session_reused:
+            self.resumed += 1
+        else:
+            self.full += 1
+        HTTPServer.finish_request(self, request, client_address)
+
+
+def run_commands(parsed_args, adapter_class, auth, endpoint):
+    """Run the commands, each with a new session, returning the total time taken"""
+
+    elapsed = 0
+    for _ in range(parsed_args.commands):
+        session = auth.signed_session()
+        session.mount('https://', adapter_class(pool_maxsize=parsed_args.threads))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=parsed_args.threads) as executor:
+            for response in executor.map(lambda _: session.get(endpoint),
+                                         range(parsed_args.requests)):
+                response.raise_for_status()
+        elapsed += time.perf_counter() - start
+        session.close()
+
+    return elapsed
+
+
+def main():
+    """Run the TLS session benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--commands', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=4)
+    parsed_args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    for name in ('server', 'client'):
+        os.mkdir(os.path.join(temp_dir, name))
+    server_cert, server_key = write_self_signed_cert(os.path.join(temp_dir, 'server'))
+    client_cert = write_self_signed_cert(os.path.join(temp_dir, 'client'), host='sfctl-client')
+
+    server = GatewayServer(server_cert, server_key, client_cert[0])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = 'https://localhost:{0}/Nodes'.format(server.server_address[1])
+
+    # requests would verify against these bundles rather than the CA of the session
+    for name in ('REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE'):
+        os.environ.pop(name, None)
+    auth = ClientCertAuthentication(client_cert, server_cert)
+
+    try:
+        for name, adapter_class in (('paths per connection', HTTPAdapter),
+                                    ('shared context', tls.SharedContextAdapter)):
+            server.full = server.resumed = 0
+            elapsed = run_commands(parsed_args, adapter_class, auth, endpoint)
+            total = parsed_args.commands * parsed_args.requests
+
+            print('{0:22} {1:6.2f} ms per request {2:5d} full handshakes {3:5d} resumed'.format(
+                name, elapsed * 1000 / total, server.full, server.resumed))
+    finally:
+        server.shutdown()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark the CPU time spent sending a large file as the body of one PUT request, read
+from a file object as before, and mapped in memory by open_upload_body, in a single request
+and in chunks.
+
+The request is sent to a local HTTP server in another process, which discards the body, so
+that only the CPU time of the client is measured.
+
+Usage: python scripts/benchmarks/upload_body.py [--size MB] [--chunk-size MB] [--runs N]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing import Process
+
+import requests
+from sfctl.tests.mock_server import find_localhost_free_port
+from sfctl.upload_body import open_upload_body
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    """Read and discard the body of each request"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Discard the body"""
+        left = int(self.headers['Content-Length'])
+        buffer = memoryview(bytearray(1024 * 1024))
+        while left > 0:
+            left -= self.rfile.readinto(buffer[:min(left, len(buffer))])
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        pass
+
+
+def serve(port):
+    """Run the sink server"""
+    HTTPServer(('localhost', port), SinkHandler).serve_forever()
+
+
+def main():
+    """Run the upload body benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--chunk-size', type=int, default=64)
+    parser.add_argument('--runs', type=int, default=3)
+    parsed_args = parser.parse_args()
+
+    port = find_localhost_free_port()
+    server = Process(target=serve, args=(port,))
+    server.daemon = True
+    server.start()
+    url = 'http://localhost:{0}/upload'.format(port)
+
+    temp_dir = tempfile.mkdtemp()
+    file_path = os.path.join(temp_dir, 'package.bin')
+    size = parsed_args.size * 1024 * 1024
+    chunk_size = parsed_args.chunk_size * 1024 * 1024
+    with open(file_path, 'wb') as package_file:
+        package_file.write(os.urandom(size))
+
+    def file_object(sesh):
+        with open(file_path, 'rb') as file_opened:
+            sesh.put(url, data=file_opened).raise_for_status()
+
+    def chunks_read(sesh):
+        with open(file_path, 'rb') as file_opened:
+            for first in range(0, size, chunk_size):
+                file_opened.seek(first)
+                sesh.put(url, data=file_opened.read(chunk_size)).raise_for_status()
+
+    def mapped(sesh):
+        with open_upload_body(file_path) as body:
+            sesh.put(url, data=body).raise_for_status()
+
+    def chunks_mapped(sesh):
+        for first in range(0, size, chunk_size):
+            with open_upload_body(file_path, first, min(chunk_size, size - first)) as body:
+                sesh.put(url, data=body).raise_for_status()
+
+    scenarios = [('file object', file_object), ('mapped', mapped),
+                 ('chunks, read', chunks_read), ('chunks, mapped', chunks_mapped)]
+
+    try:
+        time.sleep(0.5)
+        with requests.Session() as sesh:
+            for name, send in scenarios:
+                best = None
+                for _ in range(parsed_args.runs):
+                    start, start_cpu = time.time(), time.process_time()
+                    send(sesh)
+                    elapsed, cpu = time.time() - start, time.process_time() - start_cpu
+                    if best is None or cpu < best[1]:
+                        best = (elapsed, cpu)
+                print('{0:16} {1:8.2f} s {2:8.2f} s CPU {3:8.1f} MB/s'.format(
+                    name, best[0], best[1], parsed_args.size / best[0]))
+    finally:
+        server.terminate()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
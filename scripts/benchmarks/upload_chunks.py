@@ -0,0 +1,74 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark uploading one large file to the native image store, in a single request and
+in chunks with increasing concurrency.
+
+Starts the test mock server with concurrent request handling. Each request is read at a
+limited bandwidth and answered after a fixed latency, to stand in for the throughput of one
+connection to a remote cluster and the round trip to it.
+
+Usage: python scripts/benchmarks/upload_chunks.py [--size MB] [--chunk-size MB]
+                                                  [--bandwidth MB/S] [--latency S]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import requests
+from sfctl.custom_app import upload_single_file_native_imagestore
+from sfctl.tests.mock_server import (MockServer, COMMITTED_UPLOADS, find_localhost_free_port,
+                                     start_mock_server)
+
+
+def main():
+    """Run the chunked upload benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--chunk-size', type=int, default=8)
+    parser.add_argument('--bandwidth', type=float, default=20)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parsed_args = parser.parse_args()
+
+    # Keep the request log of the mock server out of the results
+    MockServer.log_message = lambda *_: None
+    MockServer.upload_latency = parsed_args.latency
+    MockServer.upload_bandwidth = parsed_args.bandwidth * 1024 * 1024
+    port = find_localhost_free_port()
+    start_mock_server(port, threaded=True)
+    endpoint = 'http://localhost:{0}'.format(port)
+
+    temp_dir = tempfile.mkdtemp()
+    size = parsed_args.size * 1024 * 1024
+    with open(os.path.join(temp_dir, 'package.bin'), 'wb') as package_file:
+        package_file.write(os.urandom(size))
+
+    scenarios = [('single request', None, 1)] + \
+        [('chunks, concurrency {0}'.format(concurrency),
+          parsed_args.chunk_size * 1024 * 1024, concurrency) for concurrency in (1, 4, 8, 16)]
+
+    try:
+        for name, chunk_size, concurrency in scenarios:
+            COMMITTED_UPLOADS.clear()
+            with requests.Session() as sesh:
+                start = time.time()
+                upload_single_file_native_imagestore(sesh, endpoint, 'Benchmark', '.',
+                                                     'package.bin', temp_dir,
+                                                     int(time.time()) + 3600,
+                                                     chunk_size, concurrency)
+                elapsed = time.time() - start
+            print('{0:24} {1:8.2f} s {2:8.1f} MB/s'.format(name, elapsed,
+                                                          parsed_args.size / elapsed))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
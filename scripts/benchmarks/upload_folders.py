@@ -0,0 +1,84 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark uploading a package with many small folders to the native image store, with
+increasing upload concurrency, and with the default pool of 10 connections or a pool sized
+for the concurrency.
+
+The package is made of copies of the sample_nested_folders test fixture. Starts the test
+mock server with concurrent request handling, answering each image store upload after a
+fixed latency, to stand in for the round trip to a remote cluster. Also reports the number
+of connections opened, each of which costs a TLS handshake with a secure cluster.
+
+Usage: python scripts/benchmarks/upload_folders.py [--copies N] [--latency S]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import sfctl.tests
+from sfctl.custom_app import create_upload_session, upload_to_native_imagestore
+from sfctl.tests.mock_server import MockServer, find_localhost_free_port, start_mock_server
+
+
+def main():
+    """Run the folder upload benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--copies', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parsed_args = parser.parse_args()
+
+    # Keep the request log of the mock server out of the results
+    MockServer.log_message = lambda *_: None
+    MockServer.upload_latency = parsed_args.latency
+    # Keep connections open between requests, as a cluster gateway does
+    MockServer.protocol_version = 'HTTP/1.1'
+    connections = [0]
+    setup = MockServer.setup
+
+    def count_connection(handler):
+        connections[0] += 1
+        setup(handler)
+
+    MockServer.setup = count_connection
+    port = find_localhost_free_port()
+    start_mock_server(port, threaded=True)
+    endpoint = 'http://localhost:{0}'.format(port)
+
+    # The mock server delays uploads to paths containing sample_nested_folders by 3 seconds,
+    # so the copies are uploaded under another name
+    fixture = os.path.join(os.path.dirname(sfctl.tests.__file__), 'sample_nested_folders')
+    temp_dir = tempfile.mkdtemp()
+    package = os.path.join(temp_dir, 'NestedBenchmark')
+    for copy in range(parsed_args.copies):
+        shutil.copytree(fixture, os.path.join(package, 'copy{0}'.format(copy)))
+
+    folders = sum(1 for _ in os.walk(package))
+    files = sum(len(walk_files) for _, _, walk_files in os.walk(package))
+    print('{0} files in {1} folders'.format(files, folders))
+
+    try:
+        for concurrency, pool_size in ((1, 10), (4, 10), (10, 10), (32, 10), (32, 32),
+                                       (64, 10), (64, 64)):
+            connections[0] = 0
+            with create_upload_session(pool_size) as sesh:
+                start = time.time()
+                upload_to_native_imagestore(sesh, endpoint, package, 'NestedBenchmark', False,
+                                            3600, concurrency=concurrency)
+                elapsed = time.time() - start
+            print('concurrency {0:<4} pool {1:<4} {2:8.2f} s {3:8.1f} uploads/s '
+                  '{4:6} connections'.format(concurrency, pool_size, elapsed,
+                                             (files + folders) / elapsed, connections[0]))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark the cost of tracking upload progress in bytes, and the accuracy of its ETA.
+
+Uploads a package of files of mixed sizes to the native image store without progress, with
+the progress bar, and with JSON progress lines, and reports the wall and CPU time of each.
+For the JSON progress lines, the ETA of each line is compared with the time the upload
+actually took to complete from then on.
+
+Starts the test mock server with concurrent request handling. Each request is read at a
+limited bandwidth and answered after a fixed latency, to stand in for the throughput of one
+connection to a remote cluster.
+
+Usage: python scripts/benchmarks/upload_progress.py [--files N] [--size MB]
+                                                    [--bandwidth MB/S] [--latency S]
+                                                    [--concurrency N]
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stderr
+from io import StringIO
+
+from sfctl.custom_app import create_upload_session, upload_to_native_imagestore
+from sfctl.tests.mock_server import MockServer, find_localhost_free_port, start_mock_server
+
+
+def main():
+    """Run the upload progress benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=40)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--bandwidth', type=float, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parsed_args = parser.parse_args()
+
+    # Keep the request log of the mock server out of the results
+    MockServer.log_message = lambda *_: None
+    MockServer.upload_latency = parsed_args.latency
+    MockServer.upload_bandwidth = parsed_args.bandwidth * 1024 * 1024
+    port = find_localhost_free_port()
+    start_mock_server(port, threaded=True)
+    endpoint = 'http://localhost:{0}'.format(port)
+
+    # Sizes from 1 / files to 2 times the average, so that the ETA cannot count files
+    temp_dir = tempfile.mkdtemp()
+    package = os.path.join(temp_dir, 'App')
+    folder = os.path.join(package, 'ServicePkg', 'Code')
+    os.makedirs(folder)
+    average = parsed_args.size * 1024 * 1024 // parsed_args.files
+    for index in range(parsed_args.files):
+        with open(os.path.join(folder, 'file{0}.dll'.format(index)), 'wb') as package_file:
+            package_file.write(os.urandom(2 * average * (index + 1) // parsed_args.files))
+
+    scenarios = [('no progress', False, False), ('progress bar', True, False),
+                 ('JSON progress', False, True)]
+
+    try:
+        for name, show_progress, progress_json in scenarios:
+            stderr = StringIO()
+            start, start_cpu = time.time(), time.process_time()
+            with create_upload_session(parsed_args.concurrency) as sesh, \
+                    redirect_stderr(stderr):
+                upload_to_native_imagestore(sesh, endpoint, package, 'Benchmark',
+                                            show_progress, 3600,
+                                            concurrency=parsed_args.concurrency,
+                                            progress_json=progress_json)
+            elapsed, cpu = time.time() - start, time.process_time() - start_cpu
+            print('{0:14} {1:8.2f} s {2:8.2f} s CPU'.format(name, elapsed, cpu))
+
+            if progress_json:
+                lines = [json.loads(line) for line in stderr.getvalue().splitlines()]
+                errors = [abs(line['eta'] - (elapsed - line['elapsed'])) for line in lines
+                          if line['event'] == 'progress' and line['eta'] is not None]
+                print('{0} JSON lines, ETA off by {1:.2f} s on average, {2:.2f} s at '
+                      'most'.format(len(lines), sum(errors) / max(len(errors), 1),
+                                    max(errors or [0])))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Benchmark a script retrying a failing command in a loop, with the cluster version checked
+after each failure before the command exits, as before, and deferred to a background
+process.
+
+Commands run in this process against a local HTTP server, which answers every request after
+a fixed latency, with an error except for the cluster version. Reports the time per
+command, and the number of cluster version requests the server received, including those of
+the background checks.
+
+The home directory is pointed at a temporary folder, so that the user's sfctl configuration
+is not touched.
+
+Usage: python scripts/benchmarks/version_check.py [--commands N] [--latency S]
+"""
+
+from __future__ import print_function
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+VERSION_REQUESTS = []
+
+
+class ClusterHandler(BaseHTTPRequestHandler):
+    """Answer the cluster version, and fail every other request"""
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer after the latency"""
+        time.sleep(ClusterHandler.latency)
+        if self.path.startswith('/$/GetClusterVersion'):
+            VERSION_REQUESTS.append(time.time())
+            self.respond(200, b'{"Version": "8.0.0.0"}')
+        else:
+            self.respond(500, b'{"Error": {"Code": "FABRIC_E_COMMUNICATION_ERROR", '
+                              b'"Message": "Unavailable"}}')
+
+    def respond(self, status, body):
+        """Send a JSON response"""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """Handle each request on its own thread"""
+    daemon_threads = True
+
+
+def main():
+    """Run the version check benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--commands', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parsed_args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    os.environ['HOME'] = home
+    os.environ['SFCTL_SERVICEFABRIC_USE_TELEMETRY'] = 'false'
+
+    # Imported once the home directory is set, since the config directory is found on import
+    import sfctl.config as sf_config
+    import sfctl.entry as sf_entry
+    from sfctl.custom_cluster import check_cluster_version
+
+    ClusterHandler.latency = parsed_args.latency
+    server = ThreadingHTTPServer(('localhost', 0), ClusterHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    sf_config.set_cluster_endpoint('http://localhost:{0}'.format(server.server_address[1]))
+    sf_config.set_auth()
+    sf_config.flush_snapshots()
+
+    deferred = sf_entry.check_cluster_version_deferred
+    scenarios = [('before command exit',
+                  lambda on_failure_or_connection: check_cluster_version(
+                      on_failure_or_connection)),
+                 ('deferred', deferred)]
+
+    try:
+        for name, check in scenarios:
+            sf_entry.check_cluster_version_deferred = check
+            sf_config.clear_snapshots()
+            state_path = os.path.join(home, '.sfctl', 'state')
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            del VERSION_REQUESTS[:]
+
+            stderr = sys.stderr
+            sys.stderr = io.StringIO()
+            start = time.time()
+            try:
+                for _ in range(parsed_args.commands):
+                    sf_entry.run_command(['node', 'list'], out_file=io.StringIO())
+            finally:
+                sys.stderr = stderr
+            elapsed = time.time() - start
+
+            # Wait for the background checks to complete
+            time.sleep(5)
+            print('{0:20} {1:8.1f} ms per command {2:4d} version requests'.format(
+                name, elapsed * 1000 / parsed_args.commands, len(VERSION_REQUESTS)))
+    finally:
+        sf_entry.check_cluster_version_deferred = deferred
+        server.shutdown()
+        shutil.rmtree(home)
+
+
+if __name__ == '__main__':
+    main()
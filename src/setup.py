@@ -54,7 +54,6 @@ setup(
         'psutil',
         'portalocker',
         'six',
-        "joblib==1.4.2",
         "tqdm"
     ],
     extras_require={
@@ -65,6 +64,9 @@ setup(
             'vcrpy',
             'mock',
             'contextlib2',
+        ],
+        'async': [
+            'aiohttp>=3.7'
         ]
     },
     entry_points={
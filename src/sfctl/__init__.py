@@ -13,4 +13,19 @@ launch -- main entry point for the command line environment
 from pkgutil import extend_path
 __path__ = extend_path(__path__, __name__)
 
-from sfctl.entry import launch
+
+def launch():
+    """Entry point for the sfctl command.
+
+    Forwards the command to the sfctl daemon when it is running. Otherwise, runs the
+    command in this process. The CLI is only imported when the command runs locally."""
+
+    import sys
+    from sfctl.daemon import forward_command
+
+    exit_code = forward_command(sys.argv[1:])
+    if exit_code is not None:
+        return exit_code
+
+    from sfctl.entry import launch as launch_local
+    return launch_local()
@@ -0,0 +1,193 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Keep the AAD access token of each cluster connection in memory, and refresh it ahead of
+its expiry on a background thread.
+
+adal refreshes a cached token once it expires within its clock buffer of a few minutes. The
+token is refreshed on a background thread from REFRESH_MARGIN seconds before that, while
+commands keep using the current token. Only a token which has expired, or is about to, is
+refreshed while a command waits. Refreshed tokens are written to the sfctl configuration
+right away, together with the adal token cache, so that other sfctl processes use them as
+well."""
+
+import json
+import threading
+import time
+from knack.log import get_logger
+
+# Seconds before its expiry at which a token is refreshed on a background thread. This is
+# just inside the clock buffer of adal, which only refreshes tokens expiring within it.
+REFRESH_MARGIN = 5 * 60 - 10
+
+# Seconds before its expiry after which a token is no longer used, and the command waits for
+# a new token instead
+EXPIRY_BUFFER = 60
+
+# Token managers of this process, keyed by the connection profile. See get_token_manager.
+_MANAGERS = {}
+_MANAGERS_LOCK = threading.Lock()
+
+logger = get_logger(__name__)  # pylint: disable=invalid-name
+
+
+def parse_expires_on(token):
+    """
+    Return the expiry time of an adal token in seconds since the epoch.
+
+    :param token: dict with the "expiresOn" key, as returned by adal
+    :return: float
+    """
+
+    from dateutil import parser
+
+    # adal writes the local time of expiry, without a time zone
+    return parser.parse(token['expiresOn']).timestamp()
+
+
+class AadTokenManager:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    The AAD token of one cluster connection, read from the sfctl configuration once, and
+    refreshed ahead of its expiry on a background thread.
+
+    :param profile: (str) The connection profile of the token, or None for the selected
+        cluster
+    :param clock: Function returning the current time in seconds since the epoch
+    """
+
+    def __init__(self, profile=None, clock=time.time):
+        self.profile = profile
+        self.clock = clock
+        # Guards the token. Refreshes are serialized by refresh_lock, and do not hold this
+        # lock while waiting for AAD, so that commands can keep using the current token.
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.token = None
+        self.expires_on = 0
+        # The aad_token setting which token was read from or written to
+        self.persisted = None
+        self.refresh_thread = None
+
+    def _load(self):
+        """Read the token again if the setting changed, for example because another sfctl
+        process selected a cluster. Must be called with lock held."""
+
+        from sfctl.config import get_config_value, using_profile
+
+        with using_profile(self.profile):
+            persisted = get_config_value('aad_token', fallback=None)
+
+        if persisted != self.persisted:
+            self.persisted = persisted
+            self.token = json.loads(persisted) if persisted else None
+            self.expires_on = parse_expires_on(self.token) if self.token else 0
+
+    def _usable_token(self):
+        """Return the current token if it is not about to expire, or None. Starts a background
+        refresh if one is due."""
+
+        with self.lock:
+            self._load()
+            if self.token is None:
+                return None
+
+            remaining = self.expires_on - self.clock()
+            if remaining <= EXPIRY_BUFFER:
+                return None
+
+            if remaining <= REFRESH_MARGIN and self.refresh_thread is None:
+                # Not a daemon thread, so that a command exiting in the meantime waits for
+                # the refreshed token to be written
+                self.refresh_thread = threading.Thread(target=self._refresh_in_background,
+                                                       name='sfctl-aad-token-refresh')
+                self.refresh_thread.start()
+
+            return self.token
+
+    def get_access_token(self):
+        """
+        Return an access token which is valid for at least EXPIRY_BUFFER seconds. Only
+        waits for AAD if the current token expires within that time.
+
+        :return: str
+        """
+
+        token = self._usable_token()
+        if token is None:
+            with self.refresh_lock:
+                # Another thread may have refreshed the token in the meantime
+                token = self._usable_token()
+                if token is None:
+                    token = self._refresh()
+
+        return token['accessToken']
+
+    def _refresh_in_background(self):
+        """Refresh the token, unless another thread refreshed it first. Failures are logged,
+        since the current token is still valid, and the refresh is tried again later."""
+
+        try:
+            with self.refresh_lock:
+                with self.lock:
+                    due = self.expires_on - self.clock() <= REFRESH_MARGIN
+                if due:
+                    self._refresh()
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.info('Refreshing the AAD token failed: %s', ex)
+        finally:
+            with self.lock:
+                self.refresh_thread = None
+
+    def _refresh(self):
+        """
+        Get a new token from AAD using the refresh token in the adal cache, and write both
+        to the sfctl configuration. Must be called with refresh_lock held.
+
+        :return: dict, the new token
+        """
+
+        import adal
+        from sfctl.config import (aad_metadata, aad_cache, set_aad_cache, flush_snapshots,
+                                  using_profile)
+
+        with using_profile(self.profile):
+            authority_uri, cluster_id, client_id = aad_metadata()
+            existing_token, existing_cache = aad_cache()
+
+        context = adal.AuthenticationContext(authority_uri, cache=existing_cache)
+        new_token = context.acquire_token(cluster_id, existing_token['userId'], client_id)
+
+        with self.lock:
+            with using_profile(self.profile):
+                set_aad_cache(new_token, context.cache)
+                self._load()
+
+        # Written now rather than once the command completes, since a long running
+        # process may not complete a command for some time
+        flush_snapshots()
+        return new_token
+
+
+def get_token_manager(profile=None):
+    """
+    Return the token manager of a cluster connection, creating it on first use.
+
+    :param profile: (str) The connection profile, or None for the selected cluster
+    :return: AadTokenManager
+    """
+
+    with _MANAGERS_LOCK:
+        manager = _MANAGERS.get(profile)
+        if manager is None:
+            manager = _MANAGERS[profile] = AadTokenManager(profile)
+        return manager
+
+
+def clear_token_managers():
+    """Forget the tokens kept by this process"""
+
+    with _MANAGERS_LOCK:
+        _MANAGERS.clear()
@@ -6,15 +6,82 @@
 
 """Azure Service Fabric API client factory"""
 
+import time
+import threading
 from knack.util import CLIError
 from azure.servicefabric import ServiceFabricClientAPIs
 
 from sfctl.auth import (ClientCertAuthentication, AdalAuthentication)
+from sfctl.tls import SharedContextAdapter
 from sfctl.config import (security_type, ca_cert_info, cert_info,
-                          client_endpoint, no_verify_setting)
+                          client_endpoint, no_verify_setting,
+                          connection_pool_settings, client_max_idle, current_profile)
+
+# Clients kept alive between commands run in this process, keyed by endpoint and auth
+# settings. Each value is a list of [client, time last used]. Reusing a client reuses
+# its open connections, so later commands to the same cluster skip the TLS handshake.
+_CLIENT_CACHE = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+
+
+def _close_client(client):
+    """Close the connections of a client"""
+    try:
+        client.close()
+    except Exception:  # pylint: disable=broad-except
+        # Closing is best effort. The connections are closed when collected regardless.
+        pass
+
+
+def clear_clients():
+    """Close and forget all clients kept alive by this process."""
+
+    with _CLIENT_CACHE_LOCK:
+        clients = [client for client, _ in _CLIENT_CACHE.values()]
+        _CLIENT_CACHE.clear()
+
+    for client in clients:
+        _close_client(client)
+
+
+def _evict_idle_clients(max_idle, now):
+    """Close the clients which have not been used for more than max_idle seconds.
+    Must be called with _CLIENT_CACHE_LOCK held."""
+
+    idle_keys = [key for key, (_, last_used) in _CLIENT_CACHE.items()
+                 if now - last_used > max_idle]
+
+    for key in idle_keys:
+        client, _ = _CLIENT_CACHE.pop(key)
+        _close_client(client)
+
+
+def pooled_session_callback(pool_connections, pool_maxsize):
+    """
+    Create a msrest session configuration callback which mounts HTTP adapters with the
+    given pool sizes, once for each requests session. The adapters connect with the SSL
+    context shared by all sessions with the same certificates, see sfctl.tls.
+
+    :param pool_connections: (int) The number of connection pools to cache
+    :param pool_maxsize: (int) The maximum number of connections to keep in each pool
+    :return: function
+    """
+
+    def configure_session(session, global_config, _, **kwargs):
+        if not getattr(session, 'sfctl_pooled', False):
+            for protocol in ('http://', 'https://'):
+                session.mount(protocol, SharedContextAdapter(
+                    pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                    max_retries=global_config.retry_policy()))
+            session.sfctl_pooled = True
+        return kwargs
+
+    return configure_session
+
 
 def create(_):
-    """Create a client for Service Fabric APIs."""
+    """Create a client for Service Fabric APIs, or reuse the client created for an
+    earlier command to the same cluster with the same auth settings."""
 
     endpoint = client_endpoint()
 
@@ -29,10 +96,26 @@ def create(_):
 
     if security_type() == 'aad':
         auth = AdalAuthentication(no_verify)
+        # The token belongs to the connection profile, so profiles connecting to the same
+        # endpoint do not share a client
+        cache_key = (endpoint, 'aad', current_profile(), no_verify)
     else:
         cert = cert_info()
         ca_cert = ca_cert_info()
         auth = ClientCertAuthentication(cert, ca_cert, no_verify)
+        cache_key = (endpoint, cert, ca_cert, no_verify)
+
+    pool_connections, pool_maxsize = connection_pool_settings()
+    cache_key += (pool_connections, pool_maxsize)
+    max_idle = client_max_idle()
+    now = time.time()
+
+    with _CLIENT_CACHE_LOCK:
+        _evict_idle_clients(max_idle, now)
+
+        if cache_key in _CLIENT_CACHE:
+            _CLIENT_CACHE[cache_key][1] = now
+            return _CLIENT_CACHE[cache_key][0]
 
     client = ServiceFabricClientAPIs(auth, base_url=endpoint)
 
@@ -45,4 +128,11 @@ def create(_):
     # which is passed to urllib3.util.retry.Retry
     client.config.retry_policy.policy.status_forcelist = None
 
+    client.config.session_configuration_callback = pooled_session_callback(pool_connections,
+                                                                           pool_maxsize)
+
+    if max_idle > 0:
+        with _CLIENT_CACHE_LOCK:
+            _CLIENT_CACHE[cache_key] = [client, now]
+
     return client
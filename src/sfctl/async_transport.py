@@ -0,0 +1,87 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Send requests to the cluster HTTP gateway from an asyncio event loop.
+
+This is an optional alternative to the requests sessions used elsewhere, for commands which
+keep many requests in flight at once. A single thread runs the event loop, and the number
+of requests in flight is bounded by a connection limit rather than by a pool of threads.
+It requires aiohttp, which is installed by pip install sfctl[async].
+
+Requests are authenticated the same way as by the SDK client. The client is created from the
+requests session of the command, and takes its certificate verification, client certificate
+and, for clusters secured with AAD, the Authorization header of the AAD token from it."""
+
+from knack.util import CLIError
+
+
+def import_aiohttp():
+    """Import aiohttp, or raise a CLIError explaining how to install it"""
+
+    try:
+        import aiohttp
+    except ImportError:
+        raise CLIError('The asyncio transport requires aiohttp. '
+                       'Install it with: pip install sfctl[async]')
+    return aiohttp
+
+
+class AsyncGatewayClient:
+    """
+    An aiohttp client session for the cluster HTTP gateway, used as an async context manager.
+
+    :param session: A signed requests.Session. Its verify, cert and Authorization header
+        are used for every request.
+    :param limit: (int) Maximum number of connections open at the same time.
+    """
+
+    def __init__(self, session, limit):
+        from sfctl.tls import get_ssl_context
+
+        # The same context as the requests sessions, so the certificates are loaded once
+        self.ssl_context = get_ssl_context(session.verify, session.cert)
+        self.headers = {}
+        if 'Authorization' in session.headers:
+            self.headers['Authorization'] = session.headers['Authorization']
+        self.limit = limit
+        self.session = None
+
+    async def __aenter__(self):
+        aiohttp = import_aiohttp()
+        connector = aiohttp.TCPConnector(limit=self.limit, ssl=self.ssl_context)
+        self.session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    async def request(self, method, url, data=None, headers=None, timeout=None,  # pylint: disable=too-many-arguments
+                      raise_for_status=True):
+        """
+        Send a request and read the whole response.
+
+        :param method: (str) HTTP method
+        :param url: (str) The full URL of the request
+        :param data: The body, as bytes or a file object
+        :param headers: dict of additional headers
+        :param timeout: (int) Seconds after which the request fails. Connecting is limited to
+            60 seconds of that.
+        :param raise_for_status: (bool) Raise aiohttp.ClientResponseError if the response has
+            an error status code.
+        :return: (int, bytes) The status code and body of the response
+        """
+
+        aiohttp = import_aiohttp()
+        client_timeout = aiohttp.ClientTimeout(total=timeout,
+                                               connect=min(60, timeout) if timeout else None)
+
+        async with self.session.request(method, url, data=data, headers=headers,
+                                        timeout=client_timeout) as response:
+            body = await response.read()
+            if raise_for_status:
+                response.raise_for_status()
+            return response.status, body
@@ -6,7 +6,6 @@
 
 """Client certificate authentication for Service Fabric API clients"""
 
-import adal
 from msrest.authentication import Authentication
 
 # pylint: disable=too-few-public-methods
@@ -43,7 +42,12 @@ class AdalAuthentication(Authentication):
     """Azure Active Directory authentication for Service Fabric clusters"""
 
     def __init__(self, no_verify=False):
+        from sfctl.config import current_profile
+
         self.no_verify = no_verify
+        # Sessions may be created on other threads, such as those prefetching pages, so the
+        # token is always read from the profile in use when the client was created
+        self.profile = current_profile()
 
     def signed_session(self, session=None):
         """Create requests session with AAD auth headers
@@ -51,7 +55,7 @@ class AdalAuthentication(Authentication):
         :rtype: requests.Session.
         """
 
-        from sfctl.config import (aad_metadata, aad_cache)
+        from sfctl.aad_token import get_token_manager
 
         if session:
             session = super(AdalAuthentication, self).signed_session(session)
@@ -61,12 +65,8 @@ class AdalAuthentication(Authentication):
         if self.no_verify:
             session.verify = False
 
-        authority_uri, cluster_id, client_id = aad_metadata()
-        existing_token, existing_cache = aad_cache()
-        context = adal.AuthenticationContext(authority_uri,
-                                             cache=existing_cache)
-        new_token = context.acquire_token(cluster_id,
-                                          existing_token['userId'], client_id)
-        header = "{} {}".format("Bearer", new_token['accessToken'])
+        # The token is kept in memory, and refreshed ahead of its expiry in the background
+        access_token = get_token_manager(self.profile).get_access_token()
+        header = "{} {}".format("Bearer", access_token)
         session.headers['Authorization'] = header
         return session
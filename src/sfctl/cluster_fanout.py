@@ -0,0 +1,159 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Run a command against many clusters at once, using saved connection profiles.
+
+A command given --clusters a,b,c or --all-clusters is parsed once, and its operation is then
+run for each profile, each on its own thread with the connection settings of that profile,
+so that no cluster needs to be selected first. Clients from apiclient.create are keyed by
+endpoint and auth settings, so each cluster gets its own pooled client. The results are
+merged into a single list, tagged with the name of the profile, so the command takes as long
+as the slowest cluster rather than the sum of all of them."""
+
+from concurrent.futures import ThreadPoolExecutor
+from knack.log import get_logger
+from knack.util import CLIError, todict
+
+FANOUT_OPTIONS = ('--clusters', '--all-clusters')
+
+logger = get_logger(__name__)  # pylint: disable=invalid-name
+
+
+def split_fanout_args(args):
+    """
+    Remove --clusters and --all-clusters from the arguments of a command.
+
+    :param args: a list of strings representing the command
+    :return: (list of str, list of str), the profile names given by --clusters, or all
+        profile names for --all-clusters, or None if neither is given, and the remaining
+        arguments
+    """
+
+    if not any(arg.split('=', 1)[0] in FANOUT_OPTIONS for arg in args):
+        return None, args
+
+    names = None
+    all_clusters = False
+    remaining = []
+    args = iter(args)
+    for arg in args:
+        option, separator, value = arg.partition('=')
+        if option == '--all-clusters' and not separator:
+            all_clusters = True
+        elif option == '--clusters':
+            if not separator:
+                value = next(args, None)
+                if value is None or value.startswith('-'):
+                    raise CLIError('--clusters requires a comma separated list of profile names')
+            names = (names or []) + [name.strip() for name in value.split(',') if name.strip()]
+        else:
+            remaining.append(arg)
+
+    if all_clusters and names is not None:
+        raise CLIError('Use either --clusters or --all-clusters, not both')
+
+    return get_profiles(names), remaining
+
+
+def get_profiles(names=None):
+    """
+    Return the profiles to run a command on, in the order given and without duplicates.
+
+    :param names: list of str, or None for all saved profiles
+    :return: list of str
+    """
+
+    from sfctl.config import profile_names
+
+    saved = profile_names()
+    if names is None:
+        if not saved:
+            raise CLIError('No connection profiles found. '
+                           'Add one using the "sfctl cluster profile add" command.')
+        return saved
+
+    profiles = []
+    for name in names:
+        if name not in profiles:
+            profiles.append(name)
+
+    unknown = [name for name in profiles if name not in saved]
+    if unknown:
+        raise CLIError('Connection profile(s) not found: {0}. Saved profiles: {1}'.format(
+            ', '.join(unknown), ', '.join(saved) or 'none'))
+    if not profiles:
+        raise CLIError('--clusters requires a comma separated list of profile names')
+
+    return profiles
+
+
+def run_on_cluster(handler, command_args, profile):
+    """
+    Run the operation of a command with the connection settings of a profile.
+
+    :return: dict, the result or error of the operation, tagged with the profile name
+    """
+
+    from sfctl.config import using_profile
+    from sfctl.custom_paging import collecting_pages
+
+    outcome = {'cluster': profile}
+
+    try:
+        # List commands given --all return the items of all pages, rather than writing them
+        # to the output interleaved with those of the other clusters
+        with using_profile(profile), collecting_pages():
+            # Operations may change their arguments, so each cluster gets its own copy
+            outcome['result'] = todict(handler(dict(command_args)))
+    except Exception as ex:  # pylint: disable=broad-except
+        outcome['error'] = str(ex) or type(ex).__name__
+
+    return outcome
+
+
+def fanout_handler(cli_ctx, handler):
+    """
+    Wrap the handler of a command which uses a Service Fabric client, so that it runs on
+    each of the clusters given by the invocation data 'clusters', if any.
+
+    The names of the clusters on which the command failed are added to the invocation
+    data under 'failed_clusters'.
+
+    :param cli_ctx: The CLI the command belongs to
+    :param handler: The knack command handler, taking the dict of command arguments
+    :return: function
+    """
+
+    def run_handler(command_args):
+        from sfctl.config import cluster_fanout_concurrency
+
+        profiles = cli_ctx.invocation.data.get('clusters')
+        if profiles is None:
+            return handler(command_args)
+
+        concurrency = cluster_fanout_concurrency()
+        if concurrency < 1:
+            raise CLIError('The sfctl setting cluster_fanout_concurrency must be at least 1')
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(profiles))) as executor:
+            outcomes = list(executor.map(
+                lambda profile: run_on_cluster(handler, command_args, profile), profiles))
+
+        cli_ctx.invocation.data['failed_clusters'] = [
+            outcome['cluster'] for outcome in outcomes if 'error' in outcome]
+        return outcomes
+
+    return run_handler
+
+
+def report_failed_clusters(invocation_data, cmd_result):
+    """Fail the command if it failed on any cluster, and log which clusters it failed on"""
+
+    failed = invocation_data.get('failed_clusters')
+    if failed:
+        logger.error('The command failed on %d of %d clusters: %s', len(failed),
+                     len(invocation_data['clusters']), ', '.join(failed))
+        cmd_result.exit_code = 1
@@ -0,0 +1,34 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""A script which checks the version of a cluster in the background as a new process.
+
+Started by check_cluster_version_deferred once a command completes, with the endpoint of the
+cluster as its only argument. The cluster version is recorded in the sfctl state, and a
+mismatch with the sfctl version is reported by the next command run against the cluster."""
+
+import sys
+from sfctl.config import client_endpoint
+from sfctl.custom_cluster import check_cluster_version
+
+
+def main(endpoint):
+    """Check the version of the cluster, unless another cluster was selected meanwhile"""
+
+    if client_endpoint() != endpoint:
+        return
+
+    check_cluster_version(on_failure_or_connection=True)
+
+
+# pylint: disable=invalid-name
+if __name__ == '__main__':
+
+    try:
+        main(sys.argv[1])
+    except:  # pylint: disable=bare-except
+        # Nothing can be reported from the background. The next due check tries again.
+        pass
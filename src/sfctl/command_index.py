@@ -0,0 +1,122 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Read and write the precomputed command index of the CLI.
+
+The command index maps every command name to the operation which handles it.
+It allows the command loader to register only the command group being invoked,
+rather than building the entire command table on every run. The index is keyed by
+the sfctl version, and is rebuilt whenever the installed version changes, or when the
+command definitions in commands.py are modified (for development installs)."""
+
+import os
+import json
+from knack.log import get_logger
+from sfctl.config import SF_CLI_CONFIG_DIR, get_cli_version_from_pkg
+
+COMMAND_INDEX_FILE_NAME = 'command_index.json'
+
+logger = get_logger(__name__)  # pylint: disable=invalid-name
+
+# Index loaded by this process, so that repeated invocations within one process
+# (for example from the batch executor or the daemon) only read the file once.
+_LOADED_INDEX = {}
+
+
+def get_command_index_path():
+    """
+    Returns the path of where the command index of sfctl is stored.
+    :return: str
+    """
+    return os.path.join(SF_CLI_CONFIG_DIR, COMMAND_INDEX_FILE_NAME)
+
+
+def get_index_key():
+    """
+    Returns the key which an index on disk must match in order to be used.
+    :return: str
+    """
+    commands_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'commands.py')
+    try:
+        commands_mtime = int(os.path.getmtime(commands_path))
+    except OSError:
+        commands_mtime = 0
+
+    return '{0}-{1}'.format(get_cli_version_from_pkg(), commands_mtime)
+
+
+def load_command_index():
+    """
+    Read the command index for the installed sfctl version.
+
+    :return: dict mapping command names to a list of [operation, uses_client], or None
+        if there is no index, or the index does not match the current index key.
+    """
+
+    index_key = get_index_key()
+
+    if _LOADED_INDEX.get('key') == index_key:
+        return _LOADED_INDEX['commands']
+
+    try:
+        with open(get_command_index_path(), 'r') as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(index, dict) or index.get('key') != index_key:
+        return None
+
+    commands = index.get('commands')
+    if not isinstance(commands, dict):
+        return None
+
+    _LOADED_INDEX['key'] = index_key
+    _LOADED_INDEX['commands'] = commands
+    return commands
+
+
+def save_command_index(command_entries):
+    """
+    Write the command index for the installed sfctl version. The index is written to a
+    temporary file first and then renamed, so that concurrent sfctl processes never read
+    a partially written index. Failures are logged and otherwise ignored, since the index
+    is only an optimization.
+
+    :param command_entries: dict mapping command names to a list of
+        [operation, uses_client]
+    :return: None
+    """
+
+    index_key = get_index_key()
+    index_path = get_command_index_path()
+    temp_path = '{0}.{1}.tmp'.format(index_path, os.getpid())
+
+    try:
+        if not os.path.isdir(SF_CLI_CONFIG_DIR):
+            os.makedirs(SF_CLI_CONFIG_DIR)
+        with open(temp_path, 'w') as index_file:
+            json.dump({'key': index_key, 'commands': command_entries}, index_file)
+        os.replace(temp_path, index_path)
+    except OSError as ex:
+        logger.debug('Unable to write command index to %s: %s', index_path, str(ex))
+        return
+
+    _LOADED_INDEX['key'] = index_key
+    _LOADED_INDEX['commands'] = command_entries
+
+
+def get_group_entries(index, group_name):
+    """
+    Return the index entries of all commands under a top level command group.
+
+    :param index: dict returned by load_command_index
+    :param group_name: (str) The top level group, for example 'node'
+    :return: dict mapping command names to a list of [operation, uses_client]. Empty
+        if the group does not exist.
+    """
+    return dict((name, entry) for name, entry in index.items()
+                if name.split()[0] == group_name)
@@ -11,27 +11,68 @@ python function.
 """
 
 from collections import OrderedDict
+from importlib import import_module
 from knack.commands import CLICommandsLoader, CommandGroup
 from knack.help import CLIHelp
-from sfctl.apiclient import create as client_create
-
-# Need to import so global help dict gets updated
-import sfctl.helps.app  # pylint: disable=unused-import
-import sfctl.helps.settings  # pylint: disable=unused-import
-import sfctl.helps.main  # pylint: disable=unused-import
-import sfctl.helps.health  # pylint: disable=unused-import
-import sfctl.helps.cluster_upgrade  # pylint: disable=unused-import
-import sfctl.helps.compose  # pylint: disable=unused-import
-import sfctl.helps.container  # pylint: disable=unused-import
-import sfctl.helps.property  # pylint: disable=unused-import
-import sfctl.helps.app_type  # pylint: disable=unused-import
-import sfctl.helps.chaos  # pylint: disable=unused-import
-import sfctl.helps.infrastructure  # pylint: disable=unused-import
-import sfctl.helps.node # pylint: disable=unused-import
+from knack.util import CLIError
+from sfctl.cluster_fanout import fanout_handler
+from sfctl.command_index import (load_command_index, save_command_index,
+                                 get_group_entries)
+from sfctl.util import is_help_command
+
+# Modules which update the global help dict when imported. These are only imported when
+# help text is about to be displayed.
+HELP_MODULES = ['app', 'settings', 'main', 'health', 'cluster_upgrade', 'compose',
+                'container', 'property', 'app_type', 'chaos', 'infrastructure', 'node',
+                'daemon', 'batch']
 
 EXCLUDED_PARAMS = ['self', 'raw', 'custom_headers', 'operation_config',
                    'content_version', 'kwargs', 'client']
 
+def load_help_files():
+    """Import all help modules so the global help dict gets updated"""
+    for help_module in HELP_MODULES:
+        import_module('sfctl.helps.' + help_module)
+
+
+def client_create(cli_args):
+    """Create a client for Service Fabric APIs.
+
+    The SDK is imported here rather than at module load, since importing it is only
+    required once a command which talks to the cluster actually runs."""
+    from sfctl.apiclient import create
+
+    return create(cli_args)
+
+
+def output_handler(cli_ctx, handler):
+    """Wrap the handler of a command which uses a Service Fabric client, so that list commands
+    given --all write their pages to the output file of the invocation."""
+
+    def run_handler(command_args):
+        from sfctl.custom_paging import writing_pages
+
+        with writing_pages(cli_ctx.invocation.data['out_file']):
+            return handler(command_args)
+
+    return run_handler
+
+
+def get_invoked_group(args):
+    """
+    Return the top level command group of the given command, for example 'node' for
+    ['node', 'list']. Return None if the command does not start with a group name.
+
+    :param args: a list of strings representing the command
+    :return: str or None
+    """
+
+    if not args or args[0].startswith('-'):
+        return None
+
+    return args[0]
+
+
 class SFCommandHelp(CLIHelp):
     """Service Fabric CLI help loader"""
 
@@ -49,8 +90,67 @@ class SFCommandLoader(CLICommandsLoader):
             *args,
             excluded_command_handler_args=EXCLUDED_PARAMS,
             **kwargs)
+        # Maps command names to (operation, uses client factory) of each created command
+        self.command_operations = dict()
 
-    def load_command_table(self, args):  # pylint: disable=too-many-statements
+    def load_command_table(self, args):
+        """Load the Service Fabric commands required for this invocation.
+
+        When the command index for this sfctl version exists, only the command group being
+        invoked is registered. Otherwise, all commands are loaded and the index is written
+        for the next run. Help text is only loaded when help is going to be displayed."""
+
+        group_name = get_invoked_group(args)
+
+        if group_name is None or is_help_command(args):
+            load_help_files()
+
+        index = load_command_index()
+        group_entries = None
+        if index is not None and group_name is not None:
+            group_entries = get_group_entries(index, group_name)
+
+        if group_entries:
+            self.load_indexed_commands(group_entries)
+        else:
+            # Typos in the group name fall through here as well, so that the error
+            # shown to the user still lists all valid command groups.
+            self.load_all_commands()
+            if index is None:
+                save_command_index(self.get_command_entries())
+
+        return OrderedDict(self.command_table)
+
+    def load_indexed_commands(self, command_entries):
+        """Register commands from entries of the command index"""
+
+        for command_name, (operation, uses_client) in command_entries.items():
+            # pylint: disable=protected-access
+            self._populate_command_group_table_with_subgroups(
+                ' '.join(command_name.split()[:-1]))
+            client_factory = client_create if uses_client else None
+            self.command_table[command_name] = self.create_command(
+                command_name, operation, client_factory=client_factory)
+
+    def get_command_entries(self):
+        """Return the command index entries describing the loaded command table"""
+
+        return dict((command_name, list(self.command_operations[command_name]))
+                    for command_name in self.command_table)
+
+    def create_command(self, name, operation, **kwargs):
+        """Create a command, and record its operation for the command index. Commands
+        which use a client can be run on many clusters at once."""
+
+        uses_client = kwargs.get('client_factory') is not None
+        self.command_operations[' '.join(name.split())] = (operation, uses_client)
+        command = super(SFCommandLoader, self).create_command(name, operation, **kwargs)
+        if uses_client:
+            command.handler = fanout_handler(self.cli_ctx,
+                                             output_handler(self.cli_ctx, command.handler))
+        return command
+
+    def load_all_commands(self):  # pylint: disable=too-many-statements
         """Load all Service Fabric commands"""
 
         # -----------------
@@ -74,11 +174,6 @@ class SFCommandLoader(CLICommandsLoader):
         with CommandGroup(self, 'cluster', client_func_path,
                           client_factory=client_create) as group:
             group.command('health', 'get_cluster_health')
-            group.command('manifest', 'get_cluster_manifest')
-            group.command(
-                'code-versions',
-                'get_provisioned_fabric_code_version_info_list'
-            )
             group.command(
                 'config-versions',
                 'get_provisioned_fabric_config_version_info_list'
@@ -94,7 +189,6 @@ class SFCommandLoader(CLICommandsLoader):
 
         with CommandGroup(self, 'node', client_func_path,
                           client_factory=client_create) as group:
-            group.command('list', 'get_node_info_list')
             group.command('info', 'get_node_info')
             group.command('health', 'get_node_health')
             group.command('load', 'get_node_load_info')
@@ -122,11 +216,9 @@ class SFCommandLoader(CLICommandsLoader):
 
         with CommandGroup(self, 'application', client_func_path,
                           client_factory=client_create) as group:
-            group.command('type-list', 'get_application_type_info_list')
             group.command('type', 'get_application_type_info_list_by_name')
             group.command('unprovision', 'unprovision_application_type')
             group.command('delete', 'delete_application')
-            group.command('list', 'get_application_info_list')
             group.command('info', 'get_application_info')
             group.command('health', 'get_application_health')
             group.command('upgrade-status', 'get_application_upgrade')
@@ -144,13 +236,10 @@ class SFCommandLoader(CLICommandsLoader):
                 'deployed-health',
                 'get_deployed_application_health'
             )
-            group.command('manifest', 'get_application_manifest')
             group.command('load', 'get_application_load_info')
 
         with CommandGroup(self, 'service', client_func_path,
                           client_factory=client_create) as group:
-            group.command('type-list', 'get_service_type_info_list')
-            group.command('manifest', 'get_service_manifest')
             group.command(
                 'deployed-type-list',
                 'get_deployed_service_type_info_list'
@@ -159,7 +248,6 @@ class SFCommandLoader(CLICommandsLoader):
                 'deployed-type',
                 'get_deployed_service_type_info_by_name'
             )
-            group.command('list', 'get_service_info_list')
             group.command('info', 'get_service_info')
             group.command('app-name', 'get_application_name_info')
             group.command('delete', 'delete_service')
@@ -190,7 +278,6 @@ class SFCommandLoader(CLICommandsLoader):
 
         with CommandGroup(self, 'partition', client_func_path,
                           client_factory=client_create) as group:
-            group.command('list', 'get_partition_info_list')
             group.command('info', 'get_partition_info')
             group.command('svc-name', 'get_service_name_info')
             group.command('health', 'get_partition_health')
@@ -226,7 +313,6 @@ class SFCommandLoader(CLICommandsLoader):
 
         with CommandGroup(self, 'replica', client_func_path,
                           client_factory=client_create) as group:
-            group.command('list', 'get_replica_info_list')
             group.command('info', 'get_replica_info')
             group.command('health', 'get_replica_health')
             group.command(
@@ -321,6 +407,56 @@ class SFCommandLoader(CLICommandsLoader):
             group.command('select', 'select')
             group.command('show-connection', 'show_connection')
 
+        with CommandGroup(self, 'cluster profile', 'sfctl.custom_cluster#{}') as group:
+            group.command('add', 'profile_add')
+            group.command('list', 'profile_list')
+            group.command('remove', 'profile_remove')
+
+        with CommandGroup(self, 'cluster', 'sfctl.custom_snapshot#{}',
+                          client_factory=client_create) as group:
+            group.command('snapshot', 'snapshot')
+
+        # Query commands whose responses may be cached
+        client_func_path_cache = 'sfctl.custom_cache#{}'
+
+        with CommandGroup(self, 'cluster', client_func_path_cache,
+                          client_factory=client_create) as group:
+            group.command('manifest', 'cluster_manifest')
+            group.command('code-versions', 'code_versions')
+
+        with CommandGroup(self, 'application', client_func_path_cache,
+                          client_factory=client_create) as group:
+            group.command('manifest', 'application_manifest')
+
+        with CommandGroup(self, 'service', client_func_path_cache,
+                          client_factory=client_create) as group:
+            group.command('type-list', 'service_type_list')
+            group.command('manifest', 'service_manifest')
+
+        # List commands which can follow continuation tokens with --all
+        client_func_path_paging = 'sfctl.custom_paging#{}'
+
+        with CommandGroup(self, 'node', client_func_path_paging,
+                          client_factory=client_create) as group:
+            group.command('list', 'list_nodes')
+
+        with CommandGroup(self, 'application', client_func_path_paging,
+                          client_factory=client_create) as group:
+            group.command('list', 'list_applications')
+            group.command('type-list', 'list_application_types')
+
+        with CommandGroup(self, 'service', client_func_path_paging,
+                          client_factory=client_create) as group:
+            group.command('list', 'list_services')
+
+        with CommandGroup(self, 'partition', client_func_path_paging,
+                          client_factory=client_create) as group:
+            group.command('list', 'list_partitions')
+
+        with CommandGroup(self, 'replica', client_func_path_paging,
+                          client_factory=client_create) as group:
+            group.command('list', 'list_replicas')
+
         with CommandGroup(self, 'chaos', 'sfctl.custom_chaos#{}',
                           client_factory=client_create) as group:
             group.command('start', 'start')
@@ -386,12 +522,31 @@ class SFCommandLoader(CLICommandsLoader):
         with CommandGroup(self, 'settings telemetry', 'sfctl.custom_settings#{}') as group:
             group.command('set-telemetry', 'set_telemetry')
 
-        return OrderedDict(self.command_table)
+        # ---------------
+        # Batch
+        # ---------------
+
+        with CommandGroup(self, '', 'sfctl.custom_batch#{}') as group:
+            group.command('batch', 'run')
+
+        # ---------------
+        # Daemon
+        # ---------------
+
+        with CommandGroup(self, 'daemon', 'sfctl.custom_daemon#{}') as group:
+            group.command('start', 'start')
+            group.command('stop', 'stop')
+            group.command('status', 'status')
 
     def load_arguments(self, command):
         """Load specialized arguments for commands"""
         from sfctl.params import custom_arguments
 
+        if (self.cli_ctx.invocation.data.get('clusters') is not None
+                and not self.command_operations.get(command, (None, True))[1]):
+            raise CLIError('"sfctl {0}" cannot be run with --clusters or '
+                           '--all-clusters'.format(command))
+
         custom_arguments(self, command)
 
         super(SFCommandLoader, self).load_arguments(command)
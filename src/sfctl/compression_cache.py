@@ -0,0 +1,190 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Reuse the zip files of code, config and data packages which did not change.
+
+The cache is used by application upload --compress --compression-cache. It is a folder next
+to the compressed package, so that zip files are hard linked into and out of it rather than
+copied. Each zip file is keyed by the names, sizes and modification times of the files of
+the folder it was written from, and the compression level. With the
+compression_cache_hash_content setting, the content of the files is hashed instead of the
+modification times, so that equal folders in other packages share a zip file. The least
+recently used zip files are removed once the cache grows beyond compression_cache_max_size
+bytes."""
+
+import os
+import json
+import shutil
+import hashlib
+import time
+from knack.log import get_logger
+from sfctl.upload_manifest import hash_file
+
+COMPRESSION_CACHE_DIR_NAME = 'sfctl_compression_cache'
+
+logger = get_logger(__name__)  # pylint: disable=invalid-name
+
+
+def get_compression_cache_dir(compressed_location):
+    """
+    Returns the path of the cache used when compressing packages into the given location.
+
+    :param compressed_location: (str) The folder the compressed package is written to
+    :return: str
+    """
+    return os.path.join(compressed_location, COMPRESSION_CACHE_DIR_NAME)
+
+
+def get_folder_key(folder, compression_level=None, hash_content=False):
+    """
+    Returns the key of the zip file of a folder.
+
+    :param folder: (str) The folder to compress
+    :param compression_level: (int) As passed to zip_folder
+    :param hash_content: (bool) Key on the content of the files rather than on their path
+        and modification time
+    :return: (str) hex digest
+    """
+
+    files = []
+    for root, dirs, file_names in os.walk(folder):
+        dirs.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(root, file_name)
+            stat = os.stat(file_path)
+            rel_file_path = os.path.relpath(file_path, folder).replace(os.sep, '/')
+            files.append([rel_file_path, stat.st_size,
+                          hash_file(file_path) if hash_content else stat.st_mtime_ns])
+
+    # Without content hashes, two folders may only differ by their content, so the key
+    # also includes where the folder is
+    key = [None if hash_content else os.path.abspath(folder), compression_level, files]
+    return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+
+def _link_or_copy(src, dst, link):
+    """Hard link src to dst if link is set and the file system allows it, else copy it"""
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+class CompressionCache:
+    """
+    The zip files written for earlier packages, kept in one folder.
+
+    :param cache_dir: (str) Path returned by get_compression_cache_dir
+    :param max_size: (int) Maximum total size of the cache in bytes
+    :param hash_content: (bool) As passed to get_folder_key
+    :param link_files: (bool) Hard link zip files into and out of the cache rather than
+        copying them, where the file system allows it. A linked zip file is the same file
+        as in the cache, so only set this when the compressed package is not modified.
+    """
+
+    def __init__(self, cache_dir, max_size, hash_content=False, link_files=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hash_content = hash_content
+        self.link_files = link_files
+        # The keys of the folders to compress, computed before they are compressed
+        self.keys = {}
+
+    def _get_entry_path(self, key):
+        """Return the path of the zip file with the given key"""
+        return os.path.join(self.cache_dir, key + '.zip')
+
+    def restore(self, folders_and_zip_paths, compression_level=None):
+        """
+        Write the zip files found in the cache, and return the ones left to compress.
+
+        :param folders_and_zip_paths: list of (folder, zip path) pairs, as passed to
+            zip_folders
+        :param compression_level: (int) As passed to zip_folders
+        :return: list of the (folder, zip path) pairs which were not in the cache
+        """
+
+        not_found = []
+        now = time.time()
+
+        for folder, zip_path in folders_and_zip_paths:
+            key = get_folder_key(folder, compression_level, self.hash_content)
+            entry_path = self._get_entry_path(key)
+            try:
+                _link_or_copy(entry_path, zip_path, self.link_files)
+                # The modification time orders zip files for least recently used eviction
+                os.utime(entry_path, (now, now))
+                logger.info('Reused the compressed %s from %s', folder, entry_path)
+            except OSError:
+                self.keys[zip_path] = key
+                not_found.append((folder, zip_path))
+
+        return not_found
+
+    def store(self, zip_paths):
+        """
+        Add zip files written by restore's caller to the cache, then evict the least recently
+        used ones if the cache is larger than max_size bytes. Each zip file is added under a
+        temporary name first and then renamed, so that concurrent sfctl processes never read
+        a partial zip file. Failures are logged and otherwise ignored, since the cache is
+        only an optimization.
+
+        :param zip_paths: list of the zip paths returned by restore, once written
+        :return: None
+        """
+
+        for zip_path in zip_paths:
+            entry_path = self._get_entry_path(self.keys[zip_path])
+            temp_path = '{0}.{1}.tmp'.format(entry_path, os.getpid())
+
+            try:
+                if not os.path.isdir(self.cache_dir):
+                    os.makedirs(self.cache_dir)
+                _link_or_copy(zip_path, temp_path, self.link_files)
+                os.replace(temp_path, entry_path)
+            except OSError as ex:
+                logger.debug('Unable to add %s to the compression cache: %s', zip_path, str(ex))
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used zip files until the cache is no larger than
+        max_size bytes."""
+
+        entries = []
+
+        try:
+            file_names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+
+        for file_name in file_names:
+            if not file_name.endswith('.zip'):
+                continue
+            entry_path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                return
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            total_size -= size
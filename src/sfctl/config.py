@@ -4,13 +4,23 @@
 # license information.
 # -----------------------------------------------------------------------------
 
-"""Read and modify configuration settings related to the CLI"""
+"""Read and modify configuration settings related to the CLI
+
+Each configuration file is parsed into a ConfigSnapshot, and only parsed again once its
+modification time or size changes. Settings set by a command are kept in the snapshot and
+written to the file together once the command completes, or when the process exits."""
 
 import os
 import json
+import atexit
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from configparser import ConfigParser
 from knack.config import CLIConfig
 from knack import CLI
-from adal.token_cache import TokenCache
+from knack.log import get_logger
+from knack.util import CLIError
 
 # Default names
 SF_CLI_NAME = 'sfctl'
@@ -20,29 +30,316 @@ SF_CLI_ENV_VAR_PREFIX = SF_CLI_NAME
 # How often to check sfctl version and cluster version for compatibility with each other (in hours).
 SF_CLI_VERSION_CHECK_INTERVAL = 24
 
+# Minimum time between two checks of the version of the same cluster on command failure or on
+# connection (in minutes), so that commands retried in a loop do not each start a check.
+SF_CLI_VERSION_RECHECK_INTERVAL = 10
+
+# Snapshots of the configuration files parsed by this process. See get_snapshot.
+_SNAPSHOTS = {}
+_SNAPSHOTS_LOCK = threading.Lock()
+
+# Settings which describe the connection to a cluster. While a connection profile is in use,
+# they are read from and written to the section of the profile instead. See using_profile.
+CONNECTION_SETTINGS = ('endpoint', 'security', 'no_verify', 'use_ca', 'ca_path', 'pem_path',
+                       'cert_path', 'key_path', 'authority_uri', 'aad_resource', 'aad_client',
+                       'aad_token', 'aad_cache')
+PROFILE_SECTION_PREFIX = 'profile '
+
+# The connection profile in use by the current thread
+_PROFILE = threading.local()
+
+logger = get_logger(__name__)  # pylint: disable=invalid-name
+
+
+def _get_file_signature(path):
+    """Return the modification time and size of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ConfigSnapshot:
+    """
+    The settings of one configuration file, shared by the whole process. The file is parsed
+    on first use, and parsed again when its modification time or size changed since, for
+    example because another process wrote it.
+
+    Settings which are set are kept in memory, and returned by later reads, until flush
+    writes them to the file. The file is read again first, so that settings written by
+    other processes in the meantime are kept, and then replaced at once by renaming a new
+    file over it. Settings from environment variables still take precedence.
+
+    :param create_cli_config: Function returning the knack.config.CLIConfig of the file.
+        It is called again to parse the file once more after each flush.
+    """
+
+    def __init__(self, create_cli_config):
+        self.create_cli_config = create_cli_config
+        self.lock = threading.RLock()
+        self.cli_config = None
+        # (section, option) to the value set by this process and not yet written
+        self.pending = {}
+        # Sections removed by this process, and not yet removed from the file
+        self.removed = set()
+        # Modification time and size of the file when it was parsed
+        self.signature = None
+
+    def get_cli_config(self):
+        """Return the parsed file, parsing it on first use and again once it changed"""
+        with self.lock:
+            signature = None
+            if self.cli_config is not None:
+                signature = _get_file_signature(self.cli_config.config_path)
+                if signature != self.signature:
+                    self.cli_config = None
+            if self.cli_config is None:
+                self.cli_config = self.create_cli_config()
+                # A file changed again while it is parsed is parsed again on next use
+                self.signature = signature if signature is not None else \
+                    _get_file_signature(self.cli_config.config_path)
+            return self.cli_config
+
+    @property
+    def config_path(self):
+        """Path of the configuration file"""
+        return self.get_cli_config().config_path
+
+    def _get_pending(self, section, option):
+        """Return the value set by this process, or None if there is none or an
+        environment variable overrides it"""
+        cli_config = self.get_cli_config()
+        with self.lock:
+            value = self.pending.get((section, option))
+        if value is None or cli_config.env_var_name(section, option) in os.environ:
+            return None
+        return value
+
+    def get(self, section, option, fallback=None):
+        """Get a setting, or fallback if it is not set"""
+        value = self._get_pending(section, option)
+        if value is None:
+            if section in self.removed:
+                return fallback
+            return self.get_cli_config().get(section, option, fallback)
+        return value
+
+    def getboolean(self, section, option, fallback=False):
+        """Get a setting as a bool, or fallback if it is not set"""
+        value = self._get_pending(section, option)
+        if value is None:
+            if section in self.removed:
+                return fallback
+            return self.get_cli_config().getboolean(section, option, fallback)
+        return value.lower() in ('1', 'yes', 'true', 'on')
+
+    def set_value(self, section, option, value):
+        """Set a setting, written to the file by the next flush"""
+        with self.lock:
+            self.pending[(section, option)] = value
+
+    def remove_section(self, section):
+        """Remove a section and the settings set in it, removed from the file by the next
+        flush"""
+        with self.lock:
+            self.removed.add(section)
+            self.pending = dict((key, value) for key, value in self.pending.items()
+                                if key[0] != section)
+
+    def sections(self):
+        """Return the names of the sections in the file, with the changes made by this
+        process"""
+        parser = ConfigParser()
+        parser.read(self.config_path)
+        with self.lock:
+            names = set(parser.sections()) - self.removed
+            names.update(section for section, _ in self.pending)
+        return sorted(names)
+
+    def flush(self):
+        """Write the settings set since the last flush to the file"""
+        with self.lock:
+            if not self.pending and not self.removed:
+                return
+
+            # The file is read below, so it is not parsed again if it changed
+            config_path = self.cli_config.config_path if self.cli_config is not None else \
+                self.config_path
+            parser = ConfigParser()
+            parser.read(config_path)
+            for section in self.removed:
+                parser.remove_section(section)
+            for (section, option), value in self.pending.items():
+                if not parser.has_section(section):
+                    parser.add_section(section)
+                parser.set(section, option, value)
+
+            # The file may hold credentials, so only the current user may read it
+            temp_path = '{0}.{1}.tmp'.format(config_path, os.getpid())
+            config_dir = os.path.dirname(config_path)
+            if not os.path.isdir(config_dir):
+                os.makedirs(config_dir)
+            with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+                           'w') as config_file:
+                parser.write(config_file)
+            os.replace(temp_path, config_path)
+
+            self.pending = {}
+            self.removed = set()
+            self.cli_config = None
+
+
+def get_snapshot(name, create_cli_config):
+    """
+    Return the snapshot of a configuration file, creating it on first use.
+
+    :param name: Key of the file, such as 'config' or 'state'
+    :param create_cli_config: Function returning the knack.config.CLIConfig of the file
+    :return: ConfigSnapshot
+    """
+
+    with _SNAPSHOTS_LOCK:
+        snapshot = _SNAPSHOTS.get(name)
+        if snapshot is None:
+            snapshot = _SNAPSHOTS[name] = ConfigSnapshot(create_cli_config)
+        return snapshot
+
+
+def flush_snapshots():
+    """Write the settings set by this process to their files. Failures are logged, since
+    this runs once the command has completed."""
+
+    with _SNAPSHOTS_LOCK:
+        snapshots = list(_SNAPSHOTS.values())
+
+    for snapshot in snapshots:
+        try:
+            snapshot.flush()
+        except (OSError, IOError) as ex:
+            logger.warning('Unable to write sfctl settings to %s: %s', snapshot.config_path,
+                           str(ex))
+
+
+def clear_snapshots():
+    """Write the settings set by this process, and forget all snapshots, so that the files
+    are parsed again on next use. Used between the commands of a long running process."""
+
+    flush_snapshots()
+    with _SNAPSHOTS_LOCK:
+        _SNAPSHOTS.clear()
+
+
+atexit.register(flush_snapshots)
+
+
+def _get_config_snapshot():
+    """Return the snapshot of the sfctl configuration file"""
+
+    # Keyed on CLIConfig as well, so that tests which replace it read through the replacement
+    return get_snapshot(('config', CLIConfig),
+                        lambda: CLIConfig(SF_CLI_CONFIG_DIR, SF_CLI_ENV_VAR_PREFIX))
+
+
+def _get_section(name):
+    """Return the section of the config file holding the setting with the given name"""
+
+    profile = current_profile()
+    if profile is not None and name in CONNECTION_SETTINGS:
+        return PROFILE_SECTION_PREFIX + profile
+    return 'servicefabric'
+
 
 def get_config_value(name, fallback=None):
     """Gets a config by name.
 
     In the case where the config name is not found, will use fallback value."""
 
-    cli_config = CLIConfig(SF_CLI_CONFIG_DIR, SF_CLI_ENV_VAR_PREFIX)
-
-    return cli_config.get('servicefabric', name, fallback)
+    return _get_config_snapshot().get(_get_section(name), name, fallback)
 
 
 def get_config_bool(name, fallback=False):
     """Checks if a config value is set to a valid bool value."""
 
-    cli_config = CLIConfig(SF_CLI_CONFIG_DIR, SF_CLI_ENV_VAR_PREFIX)
-    return cli_config.getboolean('servicefabric', name, fallback)
+    return _get_config_snapshot().getboolean(_get_section(name), name, fallback)
+
+
+def get_config_int(name, fallback):
+    """Gets a config by name as a non negative integer.
+
+    In the case where the config name is not found, will use fallback value."""
+
+    value = get_config_value(name, fallback=None)
+    if value is None:
+        return fallback
+
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise CLIError('The sfctl setting {0} must be an integer, not {1}'.format(name, value))
+
+    if value < 0:
+        raise CLIError('The sfctl setting {0} must not be negative'.format(name))
+
+    return value
 
 
 def set_config_value(name, value):
     """Set a config by name to a value."""
 
-    cli_config = CLIConfig(SF_CLI_CONFIG_DIR, SF_CLI_ENV_VAR_PREFIX)
-    cli_config.set_value('servicefabric', name, value)
+    _get_config_snapshot().set_value(_get_section(name), name, value)
+
+
+def set_config_values(values):
+    """Set many configs at once, so that they are always written to the file together.
+
+    :param values: dict of config names to values"""
+
+    snapshot = _get_config_snapshot()
+    with snapshot.lock:
+        for name, value in values.items():
+            snapshot.set_value(_get_section(name), name, value)
+
+
+def current_profile():
+    """The name of the connection profile in use by the current thread, or None if the
+    selected cluster is used."""
+
+    return getattr(_PROFILE, 'name', None)
+
+
+@contextmanager
+def using_profile(name):
+    """
+    Read and write the connection settings of the named profile, rather than those of the
+    selected cluster, on the current thread until the context exits.
+
+    :param name: (str) The profile name, or None for the selected cluster
+    """
+
+    previous = current_profile()
+    _PROFILE.name = name
+    try:
+        yield
+    finally:
+        _PROFILE.name = previous
+
+
+def profile_names():
+    """
+    Return the names of the saved connection profiles, in order.
+    :return: list of str
+    """
+
+    return [section[len(PROFILE_SECTION_PREFIX):]
+            for section in _get_config_snapshot().sections()
+            if section.startswith(PROFILE_SECTION_PREFIX)]
+
+
+def remove_profile(name):
+    """Remove a connection profile and all of its settings"""
+
+    _get_config_snapshot().remove_section(PROFILE_SECTION_PREFIX + name)
 
 
 def client_endpoint():
@@ -76,6 +373,67 @@ def set_no_verify(no_verify):
         set_config_value('no_verify', 'false')
 
 
+def connection_pool_settings():
+    """Number of connection pools, and the maximum number of connections in each pool,
+    kept open by each Service Fabric client."""
+
+    return (get_config_int('pool_connections', fallback=10),
+            get_config_int('pool_maxsize', fallback=10))
+
+
+def client_max_idle():
+    """Seconds after which a client which has not been used is closed, rather than reused
+    by the next command run in the same process."""
+
+    return get_config_int('client_max_idle', fallback=300)
+
+
+def cluster_fanout_concurrency():
+    """Maximum number of clusters which a command run with --clusters or --all-clusters is
+    sent to at the same time."""
+
+    return get_config_int('cluster_fanout_concurrency', fallback=32)
+
+
+def paging_prefetch_depth():
+    """Maximum number of pages fetched ahead of the page being written, when list
+    commands follow continuation tokens."""
+
+    return get_config_int('paging_prefetch_depth', fallback=2)
+
+
+def response_cache_enabled():
+    """True to reuse cached responses of read only query commands"""
+
+    return get_config_bool('use_response_cache')
+
+
+def response_cache_max_size():
+    """Maximum total size in bytes of the cached responses of query commands."""
+
+    return get_config_int('response_cache_max_size', fallback=50 * 1024 * 1024)
+
+
+def response_cache_ttl(operation_name, fallback):
+    """Seconds for which cached responses of the given SDK operation are reused."""
+
+    return get_config_int('response_cache_ttl_' + operation_name, fallback=fallback)
+
+
+def compression_cache_max_size():
+    """Maximum total size in bytes of the zip files kept by the compression cache of
+    application upload."""
+
+    return get_config_int('compression_cache_max_size', fallback=1024 * 1024 * 1024)
+
+
+def compression_cache_hash_content():
+    """True to key the zip files of the compression cache on the content of the compressed
+    files, rather than on their modification times."""
+
+    return get_config_bool('compression_cache_hash_content')
+
+
 def ca_cert_info():
     """CA certificate(s) path"""
 
@@ -110,6 +468,8 @@ def cert_info():
 
 def aad_cache():
     """AAD token cache."""
+    from adal.token_cache import TokenCache
+
     token_cache = TokenCache()
     token_cache.deserialize(get_config_value('aad_cache', fallback=None))
     return json.loads(get_config_value('aad_token', fallback=None)), token_cache
@@ -123,8 +483,7 @@ def set_aad_cache(token, cache):
     :return: None
     """
 
-    set_config_value('aad_token', json.dumps(token))
-    set_config_value('aad_cache', cache.serialize())
+    set_config_values({'aad_token': json.dumps(token), 'aad_cache': cache.serialize()})
 
 def aad_metadata():
     """AAD metadata."""
@@ -215,14 +574,23 @@ def get_cli_version_from_pkg():
     For example, 6.0.0.
     :return: str
     """
-    from pkg_resources import get_distribution
+    from importlib.metadata import version
 
-    pkg = get_distribution("sfctl")
-    sfctl_version = pkg.version
-    return '{0}'.format(sfctl_version)
+    return '{0}'.format(version('sfctl'))
 
 
 class VersionedCLI(CLI):
-    """Extend CLI to override get_cli_version."""
+    """Extend CLI to override get_cli_version, and keep the output file of each invocation
+    in the invocation data under 'out_file'."""
     def get_cli_version(self):
         return get_cli_version_from_pkg()
+
+    def invoke(self, args, initial_invocation_data=None, out_file=None):
+        # Commands which write their output as they run, such as list commands given --all,
+        # write it to the same file as the result
+        invocation_data = initial_invocation_data
+        if invocation_data is None:
+            invocation_data = defaultdict(lambda: None)
+        invocation_data['out_file'] = out_file or self.out_file
+        return super(VersionedCLI, self).invoke(args, initial_invocation_data=invocation_data,
+                                                out_file=out_file)
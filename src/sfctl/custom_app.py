@@ -10,43 +10,26 @@
 from __future__ import print_function
 
 import os
-from multiprocessing import Process, cpu_count
-from time import time
+import uuid
+from multiprocessing import Process
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed,
+                                FIRST_COMPLETED)
+from collections import deque
+from time import time, sleep
 import sys
-import zipfile
 import shutil
-import xml.etree.ElementTree as ET
-import contextlib
 from knack.util import CLIError
-import joblib
-from joblib import Parallel, delayed
 from tqdm import tqdm
 from sfctl.custom_exceptions import SFCTLInternalException
+from sfctl.package_compression import (_normalize_path, compress_package, largest_folders_first,
+                                       prepare_compressed_package, zip_folder)
+from sfctl.upload_async import upload_to_native_imagestore_async
+from sfctl.upload_body import open_upload_body
+from sfctl.upload_progress import ProgressBody, UploadProgress
+from sfctl.upload_util import (get_cpu_count, get_imagestore_url, get_lesser, get_timeout_left,
+                               get_upload_concurrency, queue_native_imagestore_upload)
 from sfctl.util import get_user_confirmation
 
-@contextlib.contextmanager
-def tqdm_joblib(tqdm_object):
-    """Context manager to patch joblib to report into tqdm progress bar given as argument"""
-    #pylint: disable=useless-super-delegation,too-few-public-methods
-    class TqdmBatchCompletionCallback(joblib.parallel.BatchCompletionCallBack):
-        """
-        tqdm class callback overrides to enable usage with Parallel loop
-        """
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-
-        def __call__(self, *args, **kwargs):
-            tqdm_object.update(n=self.batch_size)
-            return super().__call__(*args, **kwargs)
-
-    old_batch_callback = joblib.parallel.BatchCompletionCallBack
-    joblib.parallel.BatchCompletionCallBack = TqdmBatchCompletionCallback
-    try:
-        yield tqdm_object
-    finally:
-        joblib.parallel.BatchCompletionCallBack = old_batch_callback
-        tqdm_object.close()
-
 def validate_app_path(app_path):
     """Validate and return application package as absolute path"""
 
@@ -58,16 +41,6 @@ def validate_app_path(app_path):
         'Invalid path to application directory: {0}'.format(abspath)
     )
 
-def print_progress(current, total, rel_file_path, show_progress, time_left=None):
-    """Display progress for uploading"""
-    if show_progress:
-        print(
-            '[{}/{}] files, {}'.format(current, total, rel_file_path),
-            file=sys.stderr
-        )
-        if time_left is not None:
-            print('Time left: {} seconds'.format(time_left))
-
 def path_from_imagestore_string(imagestore_connstr):
     """
     Parse the file share path from the image store connection string
@@ -77,437 +50,554 @@ def path_from_imagestore_string(imagestore_connstr):
         return conn_str_list[1]
     return False
 
-def get_job_count():
+def create_upload_session(pool_size):
     """
-    Test-mockable wrapper for returning cpu count.
+    Return a requests session for image store uploads. All upload threads share the one
+    HTTP adapter of the session, which keeps up to pool_size connections open, so that
+    connections and TLS sessions are reused from one file to the next rather than closed
+    whenever more uploads are in flight than the default pool of 10 connections. New
+    connections resume the TLS session of earlier ones, see sfctl.tls.
+
+    :param pool_size: (int) The maximum number of connections kept open.
+    :return: requests.Session
     """
-    jobcount = None
-    try:
-        jobcount = cpu_count()
-    except Exception as ex: #pylint: disable=broad-except
-        print('Warning: cpu_count hit exception {}. Defaulting to 1.'.format(ex))
-        jobcount = 1
+    import requests
+    from sfctl.tls import SharedContextAdapter
 
-    if jobcount is None:
-        jobcount = 2
-    return jobcount
+    sesh = requests.Session()
+    adapter = SharedContextAdapter(pool_connections=1, pool_maxsize=pool_size)
+    for protocol in ('http://', 'https://'):
+        sesh.mount(protocol, adapter)
+    return sesh
 
-def upload_to_fileshare(source, dest, show_progress):
+def _copy_file_range(src, dst):
     """
-    Copies the package from source folder to dest folder
+    Copy the content of a file with os.copy_file_range, which lets the file system copy on
+    the server side or share the blocks of src, where it supports it, and otherwise copies
+    in the kernel. Falls back to shutil.copyfile where copy_file_range is not available, or
+    not supported between src and dst.
     """
-    total_files_count = 0
-    current_files_count = 0
-    for root, _, files in os.walk(source):
-        total_files_count += len(files)
 
-    for root, _, files in os.walk(source):
-        for single_file in files:
-            rel_path = root.replace(source, '').lstrip(os.sep)
-            dest_path = os.path.join(dest, rel_path)
-            if not os.path.isdir(dest_path):
-                os.makedirs(dest_path)
-
-            shutil.copyfile(
-                os.path.join(root, single_file), os.path.join(dest_path, single_file)
-            )
-            current_files_count += 1
-            print_progress(current_files_count, total_files_count,
-                           os.path.normpath(os.path.join(rel_path, single_file)),
-                           show_progress)
-
-    if show_progress:
-        print('Complete', file=sys.stderr)
-
-def get_timeout_left(target_timeout):
-    """
-    Return the number of seconds until timeout is reached, given a target_timeout which represents
-      the time at which the timer should stop. If the time left is less than 0, return 0
-    :param target_timeout: time measured as from epoch in seconds
-    :return: int
-    """
-    current_time = int(time())  # time from epoch in seconds
-    time_left = target_timeout - current_time
+    copy_file_range = getattr(os, 'copy_file_range', None)
 
-    if time_left <= 0:
-        return 0
-    return time_left
+    if copy_file_range is not None:
+        with open(src, 'rb') as src_opened, open(dst, 'wb') as dst_opened:
+            try:
+                while copy_file_range(src_opened.fileno(), dst_opened.fileno(), 1024 ** 3):
+                    pass
+                return
+            except OSError:
+                pass
+
+    shutil.copyfile(src, dst)
 
-def get_lesser(num_a, num_b):
+def copy_file_to_fileshare(src, dst, link_files=False):
     """
-    Return the lesser of int num_a and int num_b. If the lesser number is less than 0, return 0
-    :param num_a: (int)
-    :param num_b: (int)
-    :return: Return the smaller of num_a or num_b.
+    Copy a file of the package to the file share, unless dst has the same size and
+    modification time as src, which is the case of the copies of unchanged files made by
+    earlier uploads. Copies keep the modification time of src.
+
+    :param src: Path of the file of the package.
+    :param dst: Path of the file in the file share.
+    :param link_files: (bool) Hard link src to dst rather than copying it, where the file
+        system allows it.
+    :return: (bool) True if the file was copied, False if dst was already a copy of src
     """
 
-    return max(0, min(num_a, num_b))
-
-def upload_single_file_native_imagestore(sesh, endpoint, basename, #pylint: disable=too-many-locals,too-many-arguments
-                                         rel_path, single_file, root, target_timeout):
-    """
-    Used by upload_to_native_imagestore to upload individual files
-    of the application package to cluster
+    src_stat = os.stat(src)
 
-    :param sesh: A requests (module) session object.
-    :param endpoint: Connection url endpoint for upload requests.
-    :param basename: Image store base path.
-    :param rel_path: Image store relative directory path.
-    :param single_file: Filename.
-    :param root: Source directory path.
-    :param target_timeout: Time at which timeout would be reached.
-    """
     try:
-        from urllib.parse import urlparse, urlencode, urlunparse
-    except ImportError:
-        from urllib import urlencode
-        from urlparse import urlparse, urlunparse  # pylint: disable=import-error
+        dst_stat = os.stat(dst)
+    except OSError:
+        dst_stat = None
 
-    current_time_left = get_timeout_left(target_timeout)   # an int representing seconds
+    if dst_stat is not None:
+        if dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime_ns == src_stat.st_mtime_ns:
+            return False
+        # Rather than writing into dst, which may be a link to a file of an earlier package
+        os.remove(dst)
 
-    if current_time_left == 0:
-        raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
-                                        'timeout duration.')
-
-    url_path = (
-        os.path.normpath(os.path.join('ImageStore', basename,
-                                        rel_path, single_file))
-    ).replace('\\', '/')
-    fp_norm = os.path.normpath(os.path.join(root, single_file))
-    with open(fp_norm, 'rb') as file_opened:
-        url_parsed = list(urlparse(endpoint))
-        url_parsed[2] = url_path
-        url_parsed[4] = urlencode(
-            {'api-version': '6.1',
-                'timeout': current_time_left})
-        url = urlunparse(url_parsed)
-
-        # timeout is (connect_timeout, read_timeout)
-        res = sesh.put(url, data=file_opened,
-                        timeout=(get_lesser(60, current_time_left), current_time_left))
+    if link_files:
+        try:
+            os.link(src, dst)
+            return True
+        except OSError:
+            pass
 
-        res.raise_for_status()
+    _copy_file_range(src, dst)
+    os.utime(dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+    return True
 
-def upload_to_native_imagestore(sesh, endpoint, abspath, basename, #pylint: disable=too-many-locals,too-many-arguments
-                                show_progress, timeout):
+def _delete_from_fileshare(dest, manifest):
     """
-    Upload the application package to cluster
+    Remove the files no longer in the package from the file share, and from the manifest
 
-    :param sesh: A requests (module) session object.
-    :param endpoint: Connection url endpoint for upload requests.
-    :param abspath: Application source path.
-    :param basename: Image store destination path.
-    :param show_progress: boolean to determine whether to log upload progress.
-    :param timeout: Total upload timeout in seconds.
+    :param dest: The folder of the package in the file share.
+    :param manifest: sfctl.upload_manifest.UploadManifest of an incremental upload.
     """
-
-    try:
-        from urllib.parse import urlparse, urlencode, urlunparse
-    except ImportError:
-        from urllib import urlencode
-        from urlparse import urlparse, urlunparse  # pylint: disable=import-error
-    total_files_count = 0
-    current_files_count = 0
-    for root, _, files in os.walk(abspath):
-        # Number of uploads is number of files plus number of directories
-        total_files_count += (len(files) + 1)
-
-    target_timeout = int(time()) + timeout
-    jobcount = get_job_count()
-
-    # Note: while we are raising some exceptions regarding upload timeout, we are leaving the
-    # timeouts raised by the requests library as is since it contains enough information
-    for root, _, files in os.walk(abspath):
-        rel_path = os.path.normpath(os.path.relpath(root, abspath))
-        filecount = len(files)
-
+    for rel_file_path in manifest.files_to_delete():
         try:
-            if show_progress:
-                progressdescription = 'Uploading path: {}'.format(rel_path)
-                with tqdm_joblib(tqdm(desc=progressdescription, total=filecount)):
-                    Parallel(n_jobs=jobcount)(
-                        delayed(upload_single_file_native_imagestore)(
-                            sesh, endpoint, basename, rel_path, single_file, root, target_timeout)
-                            for single_file in files)
-            else:
-                Parallel(n_jobs=jobcount)(
-                    delayed(upload_single_file_native_imagestore)(
-                        sesh, endpoint, basename, rel_path, single_file, root, target_timeout)
-                        for single_file in files)
-        except Exception as e:
-            print(e)
-            raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
-                                         'timeout duration.')
-        current_time_left = get_timeout_left(target_timeout)
-
-        if current_time_left == 0:
-            raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
-                                         'timeout duration.')
+            os.remove(os.path.join(dest, *rel_file_path.split('/')))
+        except OSError:
+            pass
+        manifest.mark_deleted([rel_file_path])
 
-        url_path = (
-            os.path.normpath(os.path.join('ImageStore', basename,
-                                          rel_path, '_.dir'))
-        ).replace('\\', '/')
-        url_parsed = list(urlparse(endpoint))
-        url_parsed[2] = url_path
-        url_parsed[4] = urlencode({'api-version': '6.1',
-                                   'timeout': current_time_left})
-        url = urlunparse(url_parsed)
-
-        res = sesh.put(url,
-                       timeout=(get_lesser(60, current_time_left), current_time_left))
-        res.raise_for_status()
-        current_files_count += filecount + 1
-        print_progress(current_files_count, total_files_count,
-                       os.path.normpath(os.path.join(rel_path, '_.dir')),
-                       show_progress, get_timeout_left(target_timeout))
-    if show_progress:
-        print('Complete', file=sys.stderr)
-
-class IgnoreCopy():  # pylint: disable=too-few-public-methods,bad-option-value,C1001
+def _list_fileshare_copies(source, dest, manifest=None):
     """
-    A class which contains information and methods for the shutil.copytree method's
-    callback parameter.
+    List the files of the package to copy to the file share, in one walk of source, and
+    create the folders of dest they are copied to.
+
+    :param source: The folder of the package.
+    :param dest: The folder of the package in the file share.
+    :param manifest: sfctl.upload_manifest.UploadManifest of an incremental upload, or None.
+        Only the files which changed are listed.
+    :return: iterator of (source path, destination path, manifest key, folder) tuples, where
+        folder is a list [number of files of the folder listed] shared by the files of a folder
     """
+    created_dirs = set()
 
-    def __init__(self):
-        # Directories which will be ignored as part of the ignore_copy function
-        # If used for compressing application package:
-        # A list of strings representing the abs path of the dirs in an application package
-        # which need to be compressed
-        # Paths in dirs_to_ignore should normalized using the _normalize_path function before setting
-        self.dirs_to_ignore = []
-
-    def ignore_copy(self, directory_being_visited, list_of_dirs):
-        """
-        The ignore function for shutil.copytree()
-
-        :param directory_being_visited: str
-        :param list_of_dirs: Example: ['t.txt']
-
-        :return: a subset of the items in its second argument (must be relative path).
-                 these names will then be ignored in the copy process
-        """
+    for root, _, files in os.walk(source):
+        rel_path = os.path.relpath(root, source)
+        folder = [0]
 
-        to_ignore = []
+        for single_file in files:
+            rel_file_path = os.path.normpath(os.path.join(rel_path, single_file)) \
+                .replace(os.sep, '/')
 
-        for directory in list_of_dirs:
+            if manifest is not None and not manifest.needs_upload(rel_file_path):
+                continue
 
-            full_path = os.path.join(directory_being_visited, directory)
-            full_path = _normalize_path(full_path)
-            if full_path in self.dirs_to_ignore:
-                to_ignore.append(directory)
+            dest_path = os.path.normpath(os.path.join(dest, rel_path))
+            if dest_path not in created_dirs:
+                if not os.path.isdir(dest_path):
+                    os.makedirs(dest_path)
+                created_dirs.add(dest_path)
 
-        return to_ignore
+            folder[0] += 1
+            yield (os.path.join(root, single_file), os.path.join(dest_path, single_file),
+                   rel_file_path, folder)
 
-def _normalize_path(path):
+def upload_to_fileshare(source, dest, show_progress, manifest=None, concurrency=None,  # pylint: disable=too-many-arguments
+                        link_files=False, progress_json=False):
     """
-    Standardize a path to a file/folder location so that they can be compared
-
-    :param path: (str) represents a path on a machine
-    :return: (str) the standardized path
-    """
-
-    path = os.path.realpath(path)  # This removes slashes at the end of the path
-    path = os.path.normpath(path)
-    path = os.path.normcase(path)
-    path = os.path.abspath(path)
-    return path
+    Copies the package from source folder to dest folder
 
-# Note: provide in place compress in the future
-def compress_package(app_dir, output_dir):
+    The files are listed in one walk of source and copied on a pool of threads, so that the
+    latency of a network file share is paid by several files at the same time. Files which
+    dest already has with the same size and modification time are not copied again.
+
+    :param manifest: sfctl.upload_manifest.UploadManifest of an incremental upload. Only the
+        files which changed are copied, files no longer in the package are removed from dest,
+        and the manifest is saved after each folder is copied.
+    :param concurrency: Maximum number of files copied at the same time. Defaults to
+        get_upload_concurrency().
+    :param link_files: (bool) As passed to copy_file_to_fileshare
+    :param progress_json: (bool) Write progress to stderr as JSON lines rather than showing
+        a progress bar
     """
-    Compress to the location passed in (output_dir). Note that it is not the entire package
-    which is compressed, but rather, only some inside parts of the app package folder.
-
-    Check if the folder has the correct structure for a service fabric application. If
-    not, raise an exception alerting user of bad folder structure.
+    if manifest is not None:
+        _delete_from_fileshare(dest, manifest)
 
-    ZIP64 functionality is present for Python
-    versions 3.4 and above.
+    concurrency = concurrency or get_upload_concurrency()
+    progress = UploadProgress(show_progress, sys.stderr if progress_json else None)
 
-    For example, if app_dir = C:/SomeFolder/WordCountApp
-    and if output_dir = C:/SomeLocation,
-    then the following will be created: C:/SomeLocation/WordCountApp
+    def copy(src, dst):
+        copy_file_to_fileshare(src, dst, link_files)
+        progress.file_done(size=os.path.getsize(src))
 
-    :param app_dir: (str) An absolute path to an application package to be compressed
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='copy') as executor:
+        futures = {}
 
-    :param output_dir: (str) An absolute path to the location to output the zipped dir
+        for src, dst, rel_file_path, folder in _list_fileshare_copies(source, dest, manifest):
+            progress.add_total(os.path.getsize(src))
+            futures[executor.submit(copy, src, dst)] = (folder, rel_file_path)
 
-    :return: Nothing, or a CLIError exception
+        try:
+            for future in as_completed(futures):
+                folder, rel_file_path = futures[future]
+                future.result()
+
+                if manifest is not None:
+                    manifest.mark_uploaded([rel_file_path])
+                    folder[0] -= 1
+                    if folder[0] == 0:
+                        manifest.save()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            if manifest is not None:
+                manifest.save()
+            progress.close(failed=True)
+            raise
+
+    if manifest is not None:
+        manifest.save()
+
+    progress.close(show_progress)
+
+def _is_retriable(ex):
     """
+    Return True if a failed request may succeed when sent again: connection errors,
+    timeouts, throttling and server errors.
 
-    # Check if we're dealing with a dir in _check_folder_structure_and_get_dirs instead of
-    # in this function
-
-    # Normalize slashes, etc, in app_dir and output_dir
-    app_dir = _normalize_path(app_dir)
-    output_dir = _normalize_path(output_dir)
-
-    compress_copy = IgnoreCopy()
-
-    # Exception will be raised if the package isn't the correct structure
-    # This list may be empty in the case of an already compressed application package
-    compress_copy.dirs_to_ignore = _check_folder_structure_and_get_dirs(app_dir)
+    :param ex: requests.RequestException
+    :return: bool
+    """
+    response = getattr(ex, 'response', None)
+    if response is None:
+        return True
+    return response.status_code == 429 or response.status_code >= 500
+
+def upload_chunk_native_imagestore(sesh, endpoint, content_path, session_id,  #pylint: disable=too-many-arguments
+                                   file_path, chunk_range, file_size, target_timeout, retries,
+                                   progress=None):
+    """
+    Upload one chunk of a file as part of an image store upload session. Chunks which fail
+    with a retriable error are sent again, up to the given number of retries, waiting a
+    little longer after each failure.
 
-    if not compress_copy.dirs_to_ignore:
-        print("Nothing to copy")
+    :param sesh: A requests (module) session object.
+    :param endpoint: Connection url endpoint for upload requests.
+    :param content_path: Image store relative path of the file.
+    :param session_id: (str) The upload session ID.
+    :param file_path: Path of the local file.
+    :param chunk_range: (int, int) The first and last byte positions of the chunk.
+    :param file_size: (int) The size of the file in bytes.
+    :param target_timeout: Time at which timeout would be reached.
+    :param retries: (int) Number of times a failed chunk is sent again.
+    :param progress: sfctl.upload_progress.UploadProgress counting the bytes sent, or None
+    """
+    import requests
 
-    app_name = os.path.basename(app_dir)
-    copy_output_path = os.path.join(output_dir, app_name)
+    first, last = chunk_range
+
+    with open_upload_body(file_path, first, last - first + 1) as chunk:
+        if progress is not None:
+            chunk = progress.track(chunk)
+        attempt = 0
+        while True:
+            current_time_left = get_timeout_left(target_timeout)
+
+            if current_time_left == 0:
+                raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
+                                             'timeout duration.')
+
+            url = get_imagestore_url(endpoint, content_path + '/$/UploadChunk',
+                                     {'api-version': '6.0',
+                                      'session-id': session_id,
+                                      'timeout': current_time_left})
+            headers = {'Content-Range': 'bytes {0}-{1}/{2}'.format(first, last, file_size)}
+
+            try:
+                res = sesh.put(url, data=chunk, headers=headers,
+                               timeout=(get_lesser(60, current_time_left), current_time_left))
+                res.raise_for_status()
+                return
+            except requests.RequestException as ex:
+                if attempt >= retries or not _is_retriable(ex):
+                    raise
+                if isinstance(chunk, ProgressBody):
+                    chunk.rewind()
+                attempt += 1
+                sleep(get_lesser(2 ** attempt, get_timeout_left(target_timeout)))
+
+def upload_file_chunks_native_imagestore(sesh, endpoint, content_path, file_path,  #pylint: disable=too-many-arguments
+                                         target_timeout, chunk_size, chunk_concurrency,
+                                         chunk_retries=3, progress=None):
+    """
+    Upload a file in chunks using an image store upload session, then commit the session.
+    The chunks of the file are uploaded in parallel. If any chunk fails, the session is
+    deleted so that the image store does not keep the chunks already uploaded.
 
-    # Get the relative paths under app_name of dirs_to_copy so that we know
-    # where to place the new zipped file
-    relative_paths_to_compress = []
-    for directory in compress_copy.dirs_to_ignore:
+    :param sesh: A requests (module) session object.
+    :param endpoint: Connection url endpoint for upload requests.
+    :param content_path: Image store relative path of the file, for example
+        ImageStore/App/Pkg/Code/service.exe
+    :param file_path: Path of the local file.
+    :param target_timeout: Time at which timeout would be reached.
+    :param chunk_size: (int) Size of each chunk in bytes.
+    :param chunk_concurrency: (int) Maximum number of chunks uploaded at the same time.
+    :param chunk_retries: (int) Number of times a failed chunk is sent again.
+    :param progress: sfctl.upload_progress.UploadProgress counting the bytes sent, or None
+    """
 
-        rel_path = directory[len(app_dir):]
-        relative_paths_to_compress.append(rel_path.lstrip('\\').lstrip('/'))
+    file_size = os.path.getsize(file_path)
+    session_id = str(uuid.uuid4())
+    chunk_ranges = [(first, min(first + chunk_size, file_size) - 1)
+                    for first in range(0, file_size, chunk_size)]
 
     try:
-        # Copy everything except the one we want to zip. Those we will do manually
-        shutil.copytree(app_dir, copy_output_path, ignore=compress_copy.ignore_copy)
-
-        i = 0
-        for directory in relative_paths_to_compress:
-
-            dir_to_compress = compress_copy.dirs_to_ignore[i]
+        with ThreadPoolExecutor(max_workers=chunk_concurrency,
+                                thread_name_prefix='upload-chunk') as executor:
+            futures = [executor.submit(upload_chunk_native_imagestore, sesh, endpoint,
+                                       content_path, session_id, file_path, chunk_range,
+                                       file_size, target_timeout, chunk_retries, progress)
+                       for chunk_range in chunk_ranges]
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                # Do not start the chunks still queued, since the session is deleted
+                for future in futures:
+                    future.cancel()
+                raise
 
-            # Example: shutil.make_archive('C:\\Users\\user\\Downloads\\Code', 'zip',
-            # root_dir='C:\\WordCountV1Original\\WordCountServicePkg\\Code')
-            # The above will copy the contents of root_dir into the path given as the first
-            # parameter, with a .zip extension, so that a Code.zip will be created in Downloads
-
-            # Note for python versions before 3.4, zipping of folders larger than 2GB isn't
-            # supported
-            # It is more work and code to support Python 2.7 for this, and since we do plan to
-            # deprecate support for Python 2.7 in the future, we will just not add it here.
-            shutil.make_archive(os.path.join(copy_output_path, directory), 'zip', dir_to_compress)
-
-            i += 1
-
-    except zipfile.LargeZipFile as ex:
-        raise CLIError('Compression failed due to file too large. If you have Python 2.7, '
-                       'upgrading to 3.5 or higher will fix the issue. Please clean up '
-                       'location ' + output_dir + '\n' + str(ex))
+        current_time_left = get_timeout_left(target_timeout)
 
-    except Exception as ex:
-        raise CLIError(str.format('Compression failed due to {0}. Please clean up '
-                                  'location {1}', str(ex), output_dir))
+        if current_time_left == 0:
+            raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
+                                         'timeout duration.')
 
+        url = get_imagestore_url(endpoint, 'ImageStore/$/CommitUploadSession',
+                                 {'api-version': '6.0',
+                                  'session-id': session_id,
+                                  'timeout': current_time_left})
+        res = sesh.post(url, timeout=(get_lesser(60, current_time_left), current_time_left))
+        res.raise_for_status()
+    except Exception:
+        url = get_imagestore_url(endpoint, 'ImageStore/$/DeleteUploadSession',
+                                 {'api-version': '6.0', 'session-id': session_id})
+        try:
+            sesh.delete(url, timeout=(10, 10))
+        except Exception:  # pylint: disable=broad-except
+            # Deleting is best effort. The image store removes expired sessions regardless.
+            pass
+        raise
 
-def _check_folder_structure_and_get_dirs(app_dir):
+def upload_single_file_native_imagestore(sesh, endpoint, basename, #pylint: disable=too-many-locals,too-many-arguments
+                                         rel_path, single_file, root, target_timeout,
+                                         chunk_size=None, chunk_concurrency=1, progress=None):
     """
-    Check if the given path is a folder. If not, raise an exception indicating only
-    SF app package folders can be compressed.
+    Used by upload_to_native_imagestore to upload individual files
+    of the application package to cluster
 
-    Check if the folder given corresponds to a valid application structure. If the package
-    is valid, return a list of dirs (abs path, normalized using the
-    _normalize_path function) to be compressed.
+    :param sesh: A requests (module) session object.
+    :param endpoint: Connection url endpoint for upload requests.
+    :param basename: Image store base path.
+    :param rel_path: Image store relative directory path.
+    :param single_file: Filename.
+    :param root: Source directory path.
+    :param target_timeout: Time at which timeout would be reached.
+    :param chunk_size: Files larger than this many bytes are uploaded in chunks of this size.
+        None uploads every file in a single request.
+    :param chunk_concurrency: Maximum number of chunks of a file uploaded at the same time.
+    :param progress: sfctl.upload_progress.UploadProgress counting the bytes and files sent,
+        or None
+    """
 
-    If the folder is already compressed, then return empty list.
+    current_time_left = get_timeout_left(target_timeout)   # an int representing seconds
 
-    Example format:
+    if current_time_left == 0:
+        raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
+                                        'timeout duration.')
 
-    WordCountApp (this is the last segment of the app_dir path)
+    url_path = (
+        os.path.normpath(os.path.join('ImageStore', basename,
+                                        rel_path, single_file))
+    ).replace('\\', '/')
+    fp_norm = os.path.normpath(os.path.join(root, single_file))
 
-        o WordCountServicePkg
-              Code
-            •     WordCount.Service.exe
-            •     Other Files
-              Config
-            •     Settings.xml
-              ServiceManifest.xml
+    if chunk_size and os.path.getsize(fp_norm) > chunk_size:
+        upload_file_chunks_native_imagestore(sesh, endpoint, url_path, fp_norm, target_timeout,
+                                             chunk_size, chunk_concurrency, progress=progress)
+    else:
+        with open_upload_body(fp_norm) as body:
+            url = get_imagestore_url(endpoint, url_path,
+                                     {'api-version': '6.1',
+                                      'timeout': current_time_left})
 
-        o WordCountWebServicePkg
-              Code
-            •     WordCount.WebService.exe
-            •     Other Files
-              Config
-            •     Settings.xml
-              ServiceManifest.xml
+            # timeout is (connect_timeout, read_timeout)
+            res = sesh.put(url, data=body if progress is None else progress.track(body),
+                           timeout=(get_lesser(60, current_time_left), current_time_left))
 
-        o    ApplicationManifest.xml
+            res.raise_for_status()
 
-    The Code and Config folders should be compressed. These will be listed in the Application and Service manifests.
+    if progress is not None:
+        progress.file_done()
 
-    :param app_dir: (str) An absolute path to an application package
-    :return: A list of strings representing the absolute paths to directories which should
-             be compressed. Return a CLIError if the provided path is not a dir
+def upload_folder_marker_native_imagestore(sesh, endpoint, basename, rel_path, target_timeout):
     """
+    Upload the _.dir marker of a folder of the application package, once all the files of
+    the folder were uploaded
 
-    # Future optimization: don't copy already compressed packages. Just let the user know
-    # and upload. This should be an uncommon case, and isn't worth the effort now
+    :param sesh: A requests (module) session object.
+    :param endpoint: Connection url endpoint for upload requests.
+    :param basename: Image store base path.
+    :param rel_path: Image store relative directory path.
+    :param target_timeout: Time at which timeout would be reached.
+    """
 
-    to_compress = []
+    current_time_left = get_timeout_left(target_timeout)
 
-    if not os.path.isdir(app_dir):
-        raise CLIError('Only Service Fabric application packages may be compressed. '
-                       'The following path is not a directory: ' + app_dir)
+    if current_time_left == 0:
+        raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
+                                     'timeout duration.')
 
-    path_to_app_manifest = os.path.join(app_dir, 'ApplicationManifest.xml')
+    url_path = (
+        os.path.normpath(os.path.join('ImageStore', basename,
+                                      rel_path, '_.dir'))
+    ).replace('\\', '/')
+    url = get_imagestore_url(endpoint, url_path,
+                             {'api-version': '6.1',
+                              'timeout': current_time_left})
 
-    # An application manifest file should exist directly under the directory passed in
-    if not os.path.isfile(path_to_app_manifest):  # Casing does not matter
-        raise CLIError('Application package to be compressed is missing ApplicationManifest.xml')
+    import requests
 
-    # A list of the service packages. This should be the absolute path
-    service_packages = []
+    try:
+        res = sesh.put(url,
+                       timeout=(get_lesser(60, current_time_left), current_time_left))
+    except requests.Timeout:
+        # Markers of empty folders may be uploaded first, so they report the overall
+        # timeout the same way as files
+        raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
+                                     'timeout duration.')
+    res.raise_for_status()
 
-    # Parse the application manifest to find which folders should have the service manifest.
-    app_manifest_parsed = ET.parse(path_to_app_manifest).getroot()
-    for child in app_manifest_parsed:
-        # Use ends with, because the tags start with the xmlns
-        if child.tag.endswith('ServiceManifestImport'):
-            # We expect a child element that looks like:
-            # <ServiceManifestRef ServiceManifestName="CalculatorServicePackage" ServiceManifestVersion="1.0"/>
-            for inner_child in child:
-                if inner_child.tag.endswith('ServiceManifestRef'):
-                    path_to_service_package = os.path.join(app_dir, inner_child.attrib.get('ServiceManifestName'))
-                    service_packages.append(path_to_service_package)
+def upload_to_native_imagestore(sesh, endpoint, abspath, basename, #pylint: disable=too-many-locals,too-many-arguments,too-many-branches,too-many-statements
+                                show_progress, timeout, chunk_size=None, chunk_concurrency=1,
+                                manifest=None, concurrency=None, pending_files=None,
+                                progress_json=False):
+    """
+    Upload the application package to cluster
 
-    # Go through each service package folder and search for the service manifest
-    # The service manifest defines which packages are the code, config, and data packages, which
-    # needs to be compressed.
-    for service_package_path in service_packages:
-        path_to_service_manifest = os.path.join(service_package_path, 'ServiceManifest.xml')
+    The files of all folders are uploaded from one queue by a pool of threads, with at most
+    concurrency requests in flight. The _.dir marker of a folder is uploaded as soon as the
+    last file of the folder completes, ahead of the files still queued, so that folders with
+    few files do not wait for the rest of the package. Files which are still being written
+    when the upload starts are queued as soon as they are written.
 
-        # Raise exception is the expected service manifest file doesn't exist AND
-        # if the service package isn't already zipped
-        if not os.path.isfile(path_to_service_manifest) \
-                and not os.path.isfile(path_to_service_manifest+'.sfpkg'):  # Casing does not matter
-            raise CLIError('Service package to be compressed is missing ServiceManifest.xml in ' + service_package_path)
+    :param sesh: A requests (module) session object.
+    :param endpoint: Connection url endpoint for upload requests.
+    :param abspath: Application source path.
+    :param basename: Image store destination path.
+    :param show_progress: boolean to determine whether to log upload progress.
+    :param timeout: Total upload timeout in seconds.
+    :param chunk_size: Files larger than this many bytes are uploaded in chunks of this size.
+        None uploads every file in a single request.
+    :param chunk_concurrency: Maximum number of chunks of a file uploaded at the same time.
+    :param manifest: sfctl.upload_manifest.UploadManifest of an incremental upload. Only the
+        files which changed are uploaded, together with the _.dir marker of every folder, files
+        no longer in the package are deleted, and the manifest is saved after each folder is
+        uploaded.
+    :param concurrency: Maximum number of files and folder markers uploaded at the same time.
+        Defaults to get_upload_concurrency().
+    :param pending_files: dict mapping the paths of files of the package which are still
+        being written, such as zip files being compressed, to a Future which completes once
+        the file is written. The timeout includes the time spent waiting for them.
+    :param progress_json: (bool) Write progress to stderr as JSON lines rather than showing
+        a progress bar
+    """
 
-        service_manifest_parsed = ET.parse(path_to_service_manifest).getroot()
+    target_timeout = int(time()) + timeout
+    concurrency = concurrency or get_upload_concurrency()
 
-        for child in service_manifest_parsed:
-            if child.tag.endswith('CodePackage') or \
-                    child.tag.endswith('ConfigPackage') or child.tag.endswith('DataPackage'):
+    if manifest is not None:
+        from sfctl.upload_manifest import delete_native_imagestore_file
 
-                # If the app package already compressed,
-                # then mark a bool somewhere that says that this package is already
-                # compressed, and expect that we just upload the entire package without copying to any location
-                # In this case, we would not copy to output dir, and just upload. For partially compressed,
-                # we should compress just those and throw the compressed in the output folder
-                # For the case where there is no copy needed, we should print a statement letting the user know.
+        for rel_file_path in manifest.files_to_delete():
+            delete_native_imagestore_file(sesh, endpoint,
+                                          '/'.join(['ImageStore', basename, rel_file_path]),
+                                          target_timeout)
+            manifest.mark_deleted([rel_file_path])
+        manifest.save()
 
-                folder_name = child.attrib.get("Name")
-                folder_to_compress = os.path.join(service_package_path, folder_name)
+    folders, file_queue, waiting = queue_native_imagestore_upload(abspath, manifest,
+                                                                  pending_files)
 
-                if not os.path.isdir(folder_to_compress):  # Casing does not matter
-                    raise CLIError(str.format("{0} defined in {1} does not exist",
-                                              folder_to_compress, path_to_service_manifest))
+    marker_queue = deque(folder for folder in folders if folder[2] == 0)
+    progress = UploadProgress(show_progress, sys.stderr if progress_json else None)
+    progress.add_total(sum(os.path.getsize(os.path.join(folder[1], single_file))
+                           for folder, single_file, _ in file_queue), len(file_queue))
+    waiting_bar = tqdm(desc='Compressing', total=len(waiting), position=1) \
+        if show_progress and not progress_json and waiting else None
 
-                to_compress.append(_normalize_path(folder_to_compress))
+    # Note: while we are raising some exceptions regarding upload timeout, we are leaving the
+    # timeouts raised by the requests library as is since it contains enough information
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='upload') as executor:
+        in_flight = {}
 
-    return to_compress
+        try:
+            while marker_queue or file_queue or in_flight or waiting:
+                while len(in_flight) < concurrency and (marker_queue or file_queue):
+                    if marker_queue:
+                        folder = marker_queue.popleft()
+                        future = executor.submit(upload_folder_marker_native_imagestore, sesh,
+                                                 endpoint, basename, folder[0], target_timeout)
+                        in_flight[future] = (folder, None)
+                    else:
+                        folder, single_file, rel_file_path = file_queue.popleft()
+                        future = executor.submit(upload_single_file_native_imagestore, sesh,
+                                                 endpoint, basename, folder[0], single_file,
+                                                 folder[1], target_timeout, chunk_size,
+                                                 chunk_concurrency, progress)
+                        in_flight[future] = (folder, rel_file_path)
+
+                done, _ = wait(list(in_flight) + list(waiting), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future in waiting:
+                        folder, single_file, rel_file_path = waiting.pop(future)
+                        try:
+                            future.result()
+                        except Exception as ex:
+                            raise CLIError('Writing {0} failed due to {1}'.format(rel_file_path,
+                                                                                  ex))
+                        if waiting_bar is not None:
+                            waiting_bar.update()
+                        progress.add_total(os.path.getsize(os.path.join(folder[1], single_file)))
+                        # Upload the files which were just written ahead of the others, so
+                        # that the upload of a package keeps up with its compression
+                        file_queue.appendleft((folder, single_file, rel_file_path))
+                        continue
+
+                    folder, rel_file_path = in_flight.pop(future)
+
+                    if rel_file_path is None:
+                        future.result()
+                        continue
+
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(e)
+                        raise SFCTLInternalException('Upload has timed out. Consider passing a '
+                                                     'longer timeout duration.')
+
+                    if manifest is not None:
+                        manifest.mark_uploaded([rel_file_path])
+
+                    folder[2] -= 1
+                    if folder[2] == 0:
+                        if manifest is not None:
+                            manifest.save()
+                        marker_queue.append(folder)
+        except BaseException:
+            # Do not start the uploads still queued, but keep what was uploaded
+            for future in list(in_flight) + list(waiting):
+                future.cancel()
+            if manifest is not None:
+                manifest.save()
+            progress.close(failed=True)
+            raise
+        finally:
+            if waiting_bar is not None:
+                waiting_bar.close()
+
+    progress.close(show_progress)
 
 def upload(path, imagestore_string='fabric:ImageStore', show_progress=False, timeout=300,  # pylint: disable=too-many-locals,missing-docstring,too-many-arguments,too-many-branches,too-many-statements
-           compress=False, keep_compressed=False, compressed_location=None):
+           compress=False, keep_compressed=False, compressed_location=None, chunk_size=64,
+           chunk_concurrency=4, incremental=False, verify_store=False, concurrency=None,
+           pool_size=None, async_transport=False, compression_level=None, pipeline=False,
+           compression_cache=False, link_files=False, progress_json=False):
 
     from sfctl.config import (client_endpoint, no_verify_setting, ca_cert_info,
-                              cert_info)
-    import requests
+                              cert_info, using_aad, compression_cache_max_size,
+                              compression_cache_hash_content)
+    from sfctl.compression_cache import CompressionCache, get_compression_cache_dir
+    from sfctl.upload_manifest import (UploadManifest, get_upload_manifest_path,
+                                       get_fileshare_file_sizes,
+                                       get_native_imagestore_file_sizes)
 
     path = _normalize_path(path)
     if compressed_location is not None:
@@ -527,12 +617,45 @@ def upload(path, imagestore_string='fabric:ImageStore', show_progress=False, tim
     if all([no_verify_setting(), ca_cert_info()]):
         raise CLIError('Cannot specify both CA cert info and no verify')
 
-    if not compress and (keep_compressed or compressed_location is not None):
-        raise CLIError('--keep-compressed and --compressed-location options are only applicable '
-                       'if the --compress option is set')
+    if chunk_size < 0 or chunk_concurrency < 1:
+        raise CLIError('--chunk-size must not be negative, and --chunk-concurrency must be '
+                       'at least 1')
+
+    if (concurrency is not None and concurrency < 1) or (pool_size is not None and pool_size < 1):
+        raise CLIError('--concurrency and --pool-size must be at least 1')
+
+    concurrency = concurrency or get_upload_concurrency()
+    if pool_size is None:
+        # Each file in flight may upload chunk_concurrency chunks at the same time
+        pool_size = concurrency * chunk_concurrency
+
+    if not compress and (keep_compressed or compressed_location is not None or
+                         compression_level is not None or compression_cache):
+        raise CLIError('--keep-compressed, --compressed-location, --compression-level and '
+                       '--compression-cache options are only applicable if the --compress '
+                       'option is set')
+
+    if compression_level is not None and not 0 <= compression_level <= 9:
+        raise CLIError('--compression-level must be between 0 and 9')
+
+    if verify_store and not incremental:
+        raise CLIError('--verify-store is only applicable if the --incremental option is set')
+
+    if pipeline and (not compress or imagestore_string != 'fabric:ImageStore'):
+        raise CLIError('--pipeline is only applicable if the --compress option is set, and the '
+                       'package is uploaded to the native image store')
+
+    if link_files and 'file:' not in imagestore_string:
+        raise CLIError('--link-files is only applicable to file share image stores, which '
+                       'start with "file:"')
+
+    if pipeline and (incremental or async_transport):
+        raise CLIError('--pipeline cannot be combined with --incremental or --async-transport')
 
     compressed_pkg_location = None
     created_dir_path = None
+    folders_and_zip_paths = []
+    cache = None
 
     if compress:
 
@@ -565,7 +688,23 @@ def upload(path, imagestore_string='fabric:ImageStore', show_progress=False, tim
         if show_progress:
             print('Starting package compression into location: ' + compressed_pkg_location)
             print()  # New line for formatting purposes
-        compress_package(path, compressed_pkg_location)
+        # The compressed package is removed after the upload unless it is kept, so the files
+        # which are not compressed only need to be linked into it. With --pipeline, the zip
+        # files are written while the rest of the package uploads.
+        if compression_cache:
+            cache = CompressionCache(get_compression_cache_dir(compressed_pkg_location),
+                                     compression_cache_max_size(),
+                                     hash_content=compression_cache_hash_content(),
+                                     link_files=not keep_compressed)
+
+        if pipeline:
+            folders_and_zip_paths = prepare_compressed_package(
+                path, compressed_pkg_location, link_files=not keep_compressed)
+            if cache is not None:
+                folders_and_zip_paths = cache.restore(folders_and_zip_paths, compression_level)
+        else:
+            compress_package(path, compressed_pkg_location, link_files=not keep_compressed,
+                             compression_level=compression_level, cache=cache)
 
         # Change the path to the path with the compressed package
         compressed_path = os.path.join(compressed_pkg_location, file_or_folder_name)
@@ -574,6 +713,11 @@ def upload(path, imagestore_string='fabric:ImageStore', show_progress=False, tim
         abspath = validate_app_path(compressed_path)
         basename = os.path.basename(abspath)
 
+    manifest = None
+    if incremental:
+        manifest = UploadManifest(get_upload_manifest_path(endpoint, imagestore_string, basename),
+                                  abspath)
+
     # Note: pressing ctrl + C during upload does not end the current upload in progress, but only
     # stops the next one from occurring. This will be fixed in the future.
 
@@ -581,8 +725,12 @@ def upload(path, imagestore_string='fabric:ImageStore', show_progress=False, tim
     if 'file:' in imagestore_string:
         dest_path = path_from_imagestore_string(imagestore_string)
 
+        if verify_store:
+            manifest.verify(get_fileshare_file_sizes(os.path.join(dest_path, basename)))
+
         process = Process(target=upload_to_fileshare,
-                          args=(abspath, os.path.join(dest_path, basename), show_progress))
+                          args=(abspath, os.path.join(dest_path, basename), show_progress,
+                                manifest, concurrency, link_files, progress_json))
 
         process.start()
         process.join(timeout)  # If timeout is None then there is no timeout.
@@ -594,12 +742,47 @@ def upload(path, imagestore_string='fabric:ImageStore', show_progress=False, tim
 
     elif imagestore_string == 'fabric:ImageStore':
 
-        with requests.Session() as sesh:
+        with create_upload_session(pool_size) as sesh:
             sesh.verify = ca_cert
             sesh.cert = cert
-
-            # There is no need for a new process here since
-            upload_to_native_imagestore(sesh, endpoint, abspath, basename, show_progress, timeout)
+            if using_aad():
+                # Adds the Authorization header of the AAD token, also used by the asyncio
+                # transport
+                from sfctl.auth import AdalAuthentication
+                AdalAuthentication(no_verify_setting()).signed_session(sesh)
+
+            if verify_store:
+                manifest.verify(get_native_imagestore_file_sizes(sesh, endpoint, basename,
+                                                                 int(time()) + timeout))
+
+            if async_transport:
+                import asyncio
+                from sfctl.async_transport import AsyncGatewayClient
+
+                asyncio.run(upload_to_native_imagestore_async(
+                    AsyncGatewayClient(sesh, pool_size), endpoint, abspath, basename,
+                    show_progress, timeout, chunk_size * 1024 * 1024 or None, chunk_concurrency,
+                    manifest, concurrency, progress_json))
+            elif folders_and_zip_paths:
+                # Each zip file is uploaded as soon as it is written, while the next ones are
+                # compressed, one per CPU
+                with ProcessPoolExecutor(max_workers=get_cpu_count()) as executor:
+                    pending_files = dict(
+                        (zip_path, executor.submit(zip_folder, folder, zip_path,
+                                                   compression_level))
+                        for folder, zip_path in largest_folders_first(folders_and_zip_paths))
+                    upload_to_native_imagestore(sesh, endpoint, abspath, basename, show_progress,
+                                                timeout, chunk_size * 1024 * 1024 or None,
+                                                chunk_concurrency, manifest, concurrency,
+                                                pending_files, progress_json)
+                if cache is not None:
+                    cache.store(list(pending_files))
+            else:
+                # There is no need for a new process here since
+                upload_to_native_imagestore(sesh, endpoint, abspath, basename, show_progress,
+                                            timeout, chunk_size * 1024 * 1024 or None,
+                                            chunk_concurrency, manifest, concurrency,
+                                            progress_json=progress_json)
 
     else:
         raise CLIError('Unsupported image store connection string. Value should be either '
@@ -0,0 +1,221 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Run many sfctl commands concurrently in a single process"""
+
+import sys
+import json
+import shlex
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from knack.util import CLIError
+from sfctl.util import is_help_command
+
+# Commands which cannot be run from a batch
+EXCLUDED_GROUPS = ('batch', 'daemon')
+
+
+def parse_batch_line(line):
+    """
+    Parse one line of batch input into a list of arguments.
+
+    A line is either a command line, such as 'partition health --partition-id 1234',
+    or a JSON value: a string holding a command line, a list of arguments, or an object
+    with the command line or list of arguments under 'command'. A leading 'sfctl' is
+    ignored.
+
+    :param line: (str) The line to parse
+    :return: list of str
+    """
+
+    command = line
+    if line[0] in '{["':
+        try:
+            command = json.loads(line)
+        except ValueError as ex:
+            raise CLIError('Invalid JSON: {0}'.format(ex))
+        if isinstance(command, dict):
+            command = command.get('command')
+
+    if isinstance(command, str):
+        try:
+            command = shlex.split(command)
+        except ValueError as ex:
+            raise CLIError('Invalid command line: {0}'.format(ex))
+
+    if not isinstance(command, list) or not all(isinstance(arg, str) for arg in command):
+        raise CLIError('Expected a command line or a list of arguments')
+
+    if command and command[0] == 'sfctl':
+        command = command[1:]
+
+    if not command:
+        raise CLIError('Empty command')
+    if command[0] in EXCLUDED_GROUPS:
+        raise CLIError('{0} commands cannot be run from a batch'.format(command[0]))
+    if is_help_command(command):
+        raise CLIError('Help cannot be shown from a batch')
+
+    return command
+
+
+def read_batch_lines(input_file):
+    """
+    Yield the line number and text of each command in the batch input. Blank lines and
+    lines starting with '#' are skipped.
+
+    :param input_file: (str) Path to the batch input, or None or '-' for stdin
+    :return: generator of (int, str)
+    """
+
+    if input_file in (None, '-'):
+        lines = sys.stdin
+    else:
+        try:
+            lines = open(input_file, 'r')
+        except OSError as ex:
+            raise CLIError('Unable to read batch input {0}: {1}'.format(input_file, ex))
+
+    try:
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line_number, line
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+
+class BatchRunner:  # pylint: disable=too-few-public-methods
+    """Run commands on threads, each thread with its own CLI instance.
+
+    knack CLI instances keep the state of the command being invoked, so they are not
+    shared between threads. The Service Fabric client from apiclient.create, and its
+    connection pools, are shared by all threads."""
+
+    def __init__(self):
+        self._thread_data = threading.local()
+
+    def _get_cli(self):
+        """Return the CLI instance of the current thread"""
+        cli_env = getattr(self._thread_data, 'cli', None)
+        if cli_env is None:
+            from sfctl.entry import cli
+            cli_env = self._thread_data.cli = cli()
+        return cli_env
+
+    def run(self, line_number, line):
+        """
+        Run a single line of batch input.
+
+        :return: dict representing the outcome, written as one line of batch output
+        """
+
+        from sfctl.custom_paging import collecting_pages
+
+        outcome = {'line': line_number, 'command': line}
+
+        try:
+            args = parse_batch_line(line)
+            cli_env = self._get_cli()
+            cli_env.invocation = cli_env.invocation_cls(
+                cli_ctx=cli_env,
+                parser_cls=cli_env.parser_cls,
+                commands_loader_cls=cli_env.commands_loader_cls,
+                help_cls=cli_env.help_cls)
+            # Commands given --all return their items rather than writing them, which would
+            # interleave with the outcomes written
+            with collecting_pages():
+                cmd_result = cli_env.invocation.execute(args)
+            outcome['exitCode'] = cmd_result.exit_code
+            outcome['result'] = cmd_result.result
+        except SystemExit as ex:
+            # argparse exits on invalid arguments, after printing the error to stderr
+            outcome['exitCode'] = ex.code if isinstance(ex.code, int) else 1
+            outcome['error'] = 'Invalid arguments'
+        except Exception as ex:  # pylint: disable=broad-except
+            outcome['exitCode'] = 1
+            outcome['error'] = str(ex) or type(ex).__name__
+
+        return outcome
+
+
+def write_outcome(out_file, outcome):
+    """Write the outcome of a command as one line of JSON"""
+    out_file.write(json.dumps(outcome, default=str, sort_keys=True) + '\n')
+    out_file.flush()
+
+
+def write_completed(out_file, pending, ordered):
+    """
+    Wait for commands in flight to complete, and write their outcomes.
+
+    :param out_file: The stream outcomes are written to
+    :param pending: deque of the futures of the commands in flight, in input order. The
+        futures written are removed from it.
+    :param ordered: If set, wait for the first command of the input, rather than for any
+        command to complete.
+    :return: (int) The number of failed commands written
+    """
+
+    if ordered:
+        done = [pending.popleft()]
+    else:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+
+    failed = 0
+    for future in done:
+        outcome = future.result()
+        if outcome['exitCode'] != 0:
+            failed += 1
+        write_outcome(out_file, outcome)
+    return failed
+
+
+def run(input_file=None, concurrency=8, ordered=False):
+    """
+    Run many sfctl commands concurrently.
+
+    :param str input_file: File with one command per line. Defaults to stdin.
+    :param int concurrency: Maximum number of commands run at the same time.
+    :param bool ordered: Write results in input order, rather than as each command
+        completes.
+    """
+
+    if concurrency < 1:
+        raise CLIError('Concurrency must be at least 1.')
+
+    # colorama, used while invoking commands, may replace sys.stdout and sys.stderr.
+    # Keep the original streams, so that output is written to them and they can be restored.
+    out_file = sys.stdout
+    streams = (sys.stdout, sys.stderr)
+
+    runner = BatchRunner()
+    failed = 0
+    total = 0
+    # At most this many commands are read ahead of the outcomes written, so that input is
+    # streamed and memory does not grow with the size of the batch
+    window = 2 * concurrency
+    pending = deque()
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for line_number, line in read_batch_lines(input_file):
+                if len(pending) >= window:
+                    failed += write_completed(out_file, pending, ordered)
+                pending.append(executor.submit(runner.run, line_number, line))
+                total += 1
+
+            while pending:
+                failed += write_completed(out_file, pending, ordered)
+    finally:
+        sys.stdout, sys.stderr = streams
+
+    if failed:
+        raise CLIError('{0} of {1} commands failed.'.format(failed, total))
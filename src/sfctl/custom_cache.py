@@ -0,0 +1,87 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Read only query commands whose responses may be reused from the response cache"""
+
+import inspect
+from azure.servicefabric import ServiceFabricClientAPIs
+from sfctl.response_cache import cached_response
+
+NO_CACHE_DOC = """
+:param bool no_cache: Do not use a cached response, even if the response cache is turned
+ on. The response received is still cached for later commands.
+"""
+
+
+def cached_query(operation_name):
+    """Use the documentation of the SDK operation for the decorated command, so that
+    the help text of the command stays the same as when it mapped directly to the SDK."""
+
+    def decorator(func):
+        func.__doc__ = inspect.getdoc(getattr(ServiceFabricClientAPIs, operation_name)) + \
+            NO_CACHE_DOC
+        return func
+
+    return decorator
+
+
+# The documentation of the commands below is set by cached_query
+# pylint: disable=missing-docstring
+
+
+@cached_query('get_cluster_manifest')
+def cluster_manifest(client, timeout=60, no_cache=False):
+    return cached_response(
+        'get_cluster_manifest', dict(timeout=timeout),
+        lambda: client.get_cluster_manifest(timeout=timeout),
+        no_cache)
+
+
+@cached_query('get_provisioned_fabric_code_version_info_list')
+def code_versions(client, code_version=None, timeout=60, no_cache=False):
+    return cached_response(
+        'get_provisioned_fabric_code_version_info_list',
+        dict(code_version=code_version, timeout=timeout),
+        lambda: client.get_provisioned_fabric_code_version_info_list(
+            code_version=code_version, timeout=timeout),
+        no_cache)
+
+
+@cached_query('get_application_manifest')
+def application_manifest(client, application_type_name, application_type_version,
+                         timeout=60, no_cache=False):
+    return cached_response(
+        'get_application_manifest',
+        dict(application_type_name=application_type_name,
+             application_type_version=application_type_version, timeout=timeout),
+        lambda: client.get_application_manifest(application_type_name,
+                                                application_type_version, timeout=timeout),
+        no_cache)
+
+
+@cached_query('get_service_type_info_list')
+def service_type_list(client, application_type_name, application_type_version,
+                      timeout=60, no_cache=False):
+    return cached_response(
+        'get_service_type_info_list',
+        dict(application_type_name=application_type_name,
+             application_type_version=application_type_version, timeout=timeout),
+        lambda: client.get_service_type_info_list(application_type_name,
+                                                  application_type_version, timeout=timeout),
+        no_cache)
+
+
+@cached_query('get_service_manifest')
+def service_manifest(client, application_type_name, application_type_version,  # pylint: disable=too-many-arguments
+                     service_manifest_name, timeout=60, no_cache=False):
+    return cached_response(
+        'get_service_manifest',
+        dict(application_type_name=application_type_name,
+             application_type_version=application_type_version,
+             service_manifest_name=service_manifest_name, timeout=timeout),
+        lambda: client.get_service_manifest(application_type_name, application_type_version,
+                                            service_manifest_name, timeout=timeout),
+        no_cache)
@@ -9,15 +9,11 @@
 from __future__ import print_function
 from sys import exc_info
 from datetime import datetime, timedelta
-import adal
 from knack.util import CLIError
 from knack.log import get_logger
-from azure.servicefabric import ServiceFabricClientAPIs
-from msrest import ServiceClient, Configuration
-from sfctl.config import client_endpoint, SF_CLI_VERSION_CHECK_INTERVAL, get_cluster_auth, set_aad_cache, set_aad_metadata # pylint: disable=line-too-long
+from sfctl.config import client_endpoint, SF_CLI_VERSION_CHECK_INTERVAL, SF_CLI_VERSION_RECHECK_INTERVAL, get_cluster_auth, set_aad_cache, set_aad_metadata # pylint: disable=line-too-long
 from sfctl.state import get_sfctl_version
 from sfctl.custom_exceptions import SFCTLInternalException
-from sfctl.auth import ClientCertAuthentication, AdalAuthentication
 
 
 logger = get_logger(__name__)  # pylint: disable=invalid-name
@@ -71,6 +67,8 @@ def _get_client_cert_auth(pem, cert, key, ca, no_verify): # pylint: disable=inva
 
     :return: ClientCertAuthentication
     """
+    from sfctl.auth import ClientCertAuthentication
+
     client_cert = None
     if pem:
         client_cert = pem
@@ -94,6 +92,8 @@ def _get_rest_client(endpoint, cert=None, key=None, pem=None, ca=None,  # pylint
     :param no_verify: See select command in this file
     :return: ServiceClient from msrest
     """
+    from msrest import ServiceClient, Configuration
+    from sfctl.auth import AdalAuthentication
 
     if aad:
         new_token, new_cache = get_aad_token(endpoint, no_verify)
@@ -154,6 +154,7 @@ def select(endpoint='http://localhost:19080', cert=None, key=None, pem=None, ca=
     from sfctl.config import (set_ca_cert, set_auth,
                               set_cluster_endpoint,
                               set_no_verify)
+    from sfctl.response_cache import clear_response_cache
 
     select_arg_verify(endpoint, cert, key, pem, ca, aad, no_verify)
 
@@ -166,6 +167,93 @@ def select(endpoint='http://localhost:19080', cert=None, key=None, pem=None, ca=
     set_ca_cert(ca)
     set_auth(pem, cert, key, aad)
 
+    # Cached responses may belong to a different cluster, or to the same cluster seen
+    # with different credentials
+    clear_response_cache()
+
+
+def _verify_profile_name(name):
+    """Raise CLIError if the name cannot be used as a connection profile name"""
+
+    import re
+
+    if not re.match(r'^[A-Za-z0-9_.-]+$', name or ''):
+        raise CLIError('Profile names may only contain letters, digits, ".", "_" and "-"')
+
+
+def profile_add(name, endpoint, cert=None, key=None, pem=None, ca=None,  # pylint: disable=invalid-name,too-many-arguments
+                aad=False, no_verify=False):
+    """
+    Saves the connection to a Service Fabric cluster endpoint as a named profile.
+    Takes the same connection options as the select command. Commands run with
+    --clusters or --all-clusters connect to the clusters of the given profiles, without
+    selecting them. An existing profile with the same name is replaced.
+
+    :param str name: Name of the profile. May only contain letters, digits, '.', '_'
+    and '-'.
+    :param str endpoint: Cluster endpoint URL, including port and HTTP or HTTPS
+    prefix. Typically, the endpoint will look something like https://<your-url>:19080.
+    :param str cert: Absolute path to a client certificate file
+    :param str key: Absolute path to client certificate key file
+    :param str pem: Absolute path to client certificate, as a .pem file
+    :param str ca: Absolute path to CA certs directory to treat as valid
+    or CA bundle file.
+    :param bool aad: Use Azure Active Directory for authentication
+    :param bool no_verify: Disable verification for certificates when using
+    HTTPS, note: this is an insecure option and should not be used for
+    production environments
+    """
+
+    from sfctl.config import (set_ca_cert, set_auth, set_cluster_endpoint, set_no_verify,
+                              using_profile)
+    from sfctl.response_cache import clear_response_cache
+
+    _verify_profile_name(name)
+    select_arg_verify(endpoint, cert, key, pem, ca, aad, no_verify)
+
+    # The AAD token is saved with the profile as well
+    with using_profile(name):
+        rest_client = _get_rest_client(endpoint, cert, key, pem, ca, aad, no_verify)
+        rest_client.send(rest_client.get('/')).raise_for_status()
+
+        set_cluster_endpoint(endpoint)
+        set_no_verify(no_verify)
+        set_ca_cert(ca)
+        set_auth(pem, cert, key, aad)
+
+    clear_response_cache()
+
+
+def profile_list():
+    """
+    Lists the saved connection profiles, with the endpoint and security type of each.
+    """
+
+    from sfctl.config import profile_names, security_type, using_profile
+
+    profiles = []
+    for name in profile_names():
+        with using_profile(name):
+            profiles.append({'name': name, 'endpoint': client_endpoint(),
+                             'security': security_type()})
+
+    return profiles
+
+
+def profile_remove(name):
+    """
+    Removes a saved connection profile.
+
+    :param str name: Name of the profile
+    """
+
+    from sfctl.config import profile_names, remove_profile
+
+    if name not in profile_names():
+        raise CLIError('Connection profile {0} not found'.format(name))
+
+    remove_profile(name)
+
 
 def check_cluster_version(on_failure_or_connection, dummy_cluster_version=None):
     """ Check that the cluster version of sfctl is compatible with that of the cluster.
@@ -196,8 +284,13 @@ def check_cluster_version(on_failure_or_connection, dummy_cluster_version=None):
     :returns: True if versions match, or if the check is not performed. False otherwise.
     """
 
-    from sfctl.state import get_cluster_version_check_time, set_cluster_version_check_time
-    from warnings import warn
+    from sfctl.config import flush_snapshots
+    from sfctl.state import (get_cluster_version_check_time, set_cluster_version_check_time,
+                             set_cluster_version_check)
+
+    # Write the state set so far, so that whether a check is due is decided on the state
+    # other sfctl processes see
+    flush_snapshots()
 
     # Before doing anything, see if a check needs to be triggered.
     # Always trigger version check if on failure or connection
@@ -217,16 +310,20 @@ def check_cluster_version(on_failure_or_connection, dummy_cluster_version=None):
             # been checked. Set the initial value.
             set_cluster_version_check_time()
 
+    from azure.servicefabric import ServiceFabricClientAPIs
+
     cluster_auth = get_cluster_auth()
 
     auth = _get_client_cert_auth(cluster_auth['pem'], cluster_auth['cert'], cluster_auth['key'],
                                  cluster_auth['ca'], cluster_auth['no_verify'])
 
-    client = ServiceFabricClientAPIs(auth, base_url=client_endpoint())
+    endpoint = client_endpoint()
+    client = ServiceFabricClientAPIs(auth, base_url=endpoint)
 
     sfctl_version = get_sfctl_version()
 
     # Update the timestamp of the last cluster version check
+    check_time = datetime.utcnow()
     set_cluster_version_check_time()
 
     if dummy_cluster_version is None:
@@ -239,30 +336,127 @@ def check_cluster_version(on_failure_or_connection, dummy_cluster_version=None):
         except:  # pylint: disable=bare-except
             ex = exc_info()[0]
             logger.info('Check cluster version failed due to error: %s', str(ex))
-            return True
+            cluster_version = None
     else:
         if dummy_cluster_version == 'NoResult':
             cluster_version = None
         else:
             cluster_version = dummy_cluster_version
 
+    # Keep the result for check_cluster_version_deferred, which needs a selected cluster
+    if endpoint:
+        set_cluster_version_check(endpoint, cluster_version, check_time)
+
+    # Write the check right away, so that other sfctl processes see it rather than checking
+    # the cluster again
+    flush_snapshots()
+
     if cluster_version is None:
         # Do no checks if the get cluster version API fails, since most likely it failed
         # because the API doesn't exist.
         return True
 
     if not sfctl_cluster_version_matches(cluster_version, sfctl_version):
-        warn(str.format(
-            'sfctl has version "{0}" which does not match the cluster version "{1}". '
-            'See https://docs.microsoft.com/azure/service-fabric/service-fabric-cli#service-fabric-target-runtime '  # pylint: disable=line-too-long
-            'for version compatibility. Upgrade to a compatible version for the best experience.',
-            sfctl_version,
-            cluster_version))
+        _warn_version_mismatch(sfctl_version, cluster_version)
         return False
 
     return True
 
 
+def check_cluster_version_deferred(on_failure_or_connection):
+    """ Report a mismatch between the sfctl version and the last known version of the cluster,
+    and check the cluster version again in a background process if a check is due.
+
+    Unlike check_cluster_version, this makes no request to the cluster, so that commands do not
+    wait for the check. The background check records the cluster version in the state of the
+    endpoint, and the next command reports a mismatch once. A check is due once
+    SF_CLI_VERSION_CHECK_INTERVAL hours have passed since the last one, or on failure or
+    connection once SF_CLI_VERSION_RECHECK_INTERVAL minutes have, so that commands retried in
+    a loop start at most one check in that time.
+
+    :param on_failure_or_connection: True if this function is called due to an API call failure,
+        or because it was called on connection to a new cluster endpoint.
+        False otherwise. A mismatch is then reported again.
+    :type on_failure_or_connection: bool
+
+    :returns: True if versions match, or if the cluster version is not known yet.
+        False otherwise.
+    """
+
+    from sfctl.state import get_cluster_version_check, set_cluster_version_check
+
+    endpoint = client_endpoint()
+    if not endpoint:
+        return True
+
+    last_check = get_cluster_version_check(endpoint)
+    cluster_version = None
+    reported = False
+    matches = True
+
+    if last_check is not None:
+        cluster_version = last_check['version']
+        reported = last_check['reported']
+
+        if cluster_version is not None:
+            sfctl_version = get_sfctl_version()
+            matches = sfctl_cluster_version_matches(cluster_version, sfctl_version)
+            if not matches and (on_failure_or_connection or not reported):
+                _warn_version_mismatch(sfctl_version, cluster_version)
+                reported = True
+                set_cluster_version_check(endpoint, cluster_version, last_check['checked'],
+                                          reported)
+
+    if on_failure_or_connection:
+        check_interval = timedelta(minutes=SF_CLI_VERSION_RECHECK_INTERVAL)
+    else:
+        check_interval = timedelta(hours=SF_CLI_VERSION_CHECK_INTERVAL)
+
+    now = datetime.utcnow()
+    if last_check is None or now - last_check['checked'] >= check_interval:
+        # Record the check as started first, so that commands which complete while it runs
+        # do not start another one
+        set_cluster_version_check(endpoint, cluster_version, now, reported)
+        start_cluster_version_check(endpoint)
+
+    return matches
+
+
+def start_cluster_version_check(endpoint):
+    """
+    Start checking the version of a cluster in a new process, which runs on after this
+    process exits.
+
+    :param endpoint: (str) The cluster endpoint. The check is skipped if another cluster is
+        selected by the time the process starts.
+    """
+
+    import subprocess
+    import sys
+    from sfctl.config import flush_snapshots
+
+    # The new process reads the cluster settings and the state from their files
+    flush_snapshots()
+
+    logger.info('Starting cluster version check in the background')
+    subprocess.Popen([sys.executable, '-m', 'sfctl.cluster_version_background', endpoint],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, close_fds=True, start_new_session=True)
+
+
+def _warn_version_mismatch(sfctl_version, cluster_version):
+    """Warn that the sfctl version is not compatible with the cluster version"""
+
+    from warnings import warn
+
+    warn(str.format(
+        'sfctl has version "{0}" which does not match the cluster version "{1}". '
+        'See https://docs.microsoft.com/azure/service-fabric/service-fabric-cli#service-fabric-target-runtime '  # pylint: disable=line-too-long
+        'for version compatibility. Upgrade to a compatible version for the best experience.',
+        sfctl_version,
+        cluster_version))
+
+
 def sfctl_cluster_version_matches(cluster_version, sfctl_version):
     """
     Check if the sfctl version and the cluster version is compatible with each other.
@@ -287,6 +481,9 @@ def sfctl_cluster_version_matches(cluster_version, sfctl_version):
 def get_aad_token(endpoint, no_verify):
     #pylint: disable-msg=too-many-locals
     """Get AAD token"""
+    import adal
+    from azure.servicefabric import ServiceFabricClientAPIs
+    from sfctl.auth import ClientCertAuthentication
 
     auth = ClientCertAuthentication(None, None, no_verify)
 
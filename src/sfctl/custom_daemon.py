@@ -0,0 +1,98 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Commands to start, stop, and query the local sfctl daemon"""
+
+import os
+import sys
+import time
+from subprocess import Popen, DEVNULL
+from knack.util import CLIError
+from sfctl.daemon import (DEFAULT_IDLE_TIMEOUT, connect, send_request,
+                          get_daemon_socket_path, is_daemon_supported)
+
+# How long to wait for a newly started daemon to accept connections, in seconds
+DAEMON_START_TIMEOUT = 30
+
+
+def _daemon_request(request):
+    """Send a control request to the running daemon and return the final frame, or None
+    if no daemon is running"""
+
+    sock = connect()
+    if sock is None:
+        return None
+
+    try:
+        for frame in send_request(sock, request):
+            if 'stream' not in frame:
+                return frame
+    finally:
+        sock.close()
+
+    return None
+
+
+def start(idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Start the sfctl daemon in the background.
+
+    :param int idle_timeout: Seconds without any commands after which the daemon
+        stops itself.
+    """
+
+    if not is_daemon_supported():
+        raise CLIError('The sfctl daemon requires Unix domain sockets, '
+                       'which are not supported on this platform.')
+
+    if idle_timeout <= 0:
+        raise CLIError('The idle timeout must be a positive number of seconds.')
+
+    running = _daemon_request({'control': 'status'})
+    if running is not None:
+        print('The sfctl daemon is already running with process ID {0}'.format(
+            running['status']['pid']))
+        return
+
+    process = Popen([sys.executable, '-m', 'sfctl.daemon',
+                     '--idle-timeout', str(idle_timeout)],
+                    stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL,
+                    close_fds=True, start_new_session=True,
+                    cwd=os.path.expanduser('~'))
+
+    deadline = time.time() + DAEMON_START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise CLIError('The sfctl daemon exited during startup with exit code {0}.'.format(
+                process.returncode))
+        if _daemon_request({'control': 'status'}) is not None:
+            print('Started the sfctl daemon with process ID {0}'.format(process.pid))
+            return
+        time.sleep(0.1)
+
+    raise CLIError('Timed out waiting for the sfctl daemon to listen on {0}.'.format(
+        get_daemon_socket_path()))
+
+
+def stop():
+    """Stop the sfctl daemon."""
+
+    if _daemon_request({'control': 'stop'}) is None:
+        print('The sfctl daemon is not running')
+    else:
+        print('Stopped the sfctl daemon')
+
+
+def status():
+    """Show whether the sfctl daemon is running."""
+
+    response = _daemon_request({'control': 'status'})
+    if response is None:
+        return {'running': False, 'socket': get_daemon_socket_path()}
+
+    result = {'running': True}
+    result.update(response['status'])
+    return result
@@ -0,0 +1,270 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""List commands which can follow continuation tokens and stream every page"""
+
+import sys
+import json
+import inspect
+import threading
+from queue import Queue
+from contextlib import contextmanager
+from knack.util import todict
+from azure.servicefabric import ServiceFabricClientAPIs
+from sfctl.config import paging_prefetch_depth
+from sfctl.response_cache import cached_response
+from sfctl.custom_cache import NO_CACHE_DOC
+
+ALL_PAGES_DOC = """
+:param bool all_pages: Follow continuation tokens and write every item of every
+ page as it is received, one JSON object per line. This output is not affected by
+ the query and output arguments. Run from sfctl batch, or on several clusters
+ at once, the items of all pages are returned as the result of the command
+ instead.
+"""
+
+# Set on threads whose list commands return the items of all pages rather than writing them.
+# See collecting_pages.
+_COLLECT_PAGES = threading.local()
+
+# Set on threads whose list commands write all pages to the output of their invocation.
+# See writing_pages.
+_PAGES_OUTPUT = threading.local()
+
+
+def paged_list(operation_name, extra_doc=''):
+    """Use the documentation of the SDK list operation for the decorated command, so that
+    the help text of the command stays the same as when it mapped directly to the SDK."""
+
+    def decorator(func):
+        func.__doc__ = inspect.getdoc(getattr(ServiceFabricClientAPIs, operation_name)) + \
+            ALL_PAGES_DOC + extra_doc
+        return func
+
+    return decorator
+
+
+def iter_pages(get_page, continuation_token=None):
+    """
+    Yield pages of a list operation, following continuation tokens until the last page.
+
+    :param get_page: function which takes a continuation token and returns a page with
+        continuation_token and items attributes
+    :param continuation_token: (str) Token of the first page to get
+    :return: generator of pages
+    """
+
+    while True:
+        page = get_page(continuation_token)
+        yield page
+
+        continuation_token = page.continuation_token
+        if not continuation_token:
+            return
+
+
+def prefetch_pages(get_page, continuation_token=None, depth=2):
+    """
+    Yield pages of a list operation like iter_pages, while fetching the following pages
+    on a background thread. At most depth pages are fetched ahead of the page being
+    consumed, so memory use stays bounded when the consumer is slower than the cluster.
+
+    :param get_page: function which takes a continuation token and returns a page with
+        continuation_token and items attributes
+    :param continuation_token: (str) Token of the first page to get
+    :param depth: (int) Maximum number of pages fetched ahead. 0 fetches pages in sequence.
+    :return: generator of pages
+    """
+
+    if depth < 1:
+        for page in iter_pages(get_page, continuation_token):
+            yield page
+        return
+
+    fetched = Queue()
+    # One slot for each page which may be fetched before the consumer takes it
+    slots = threading.BoundedSemaphore(depth)
+    stopped = threading.Event()
+
+    def acquire_slot():
+        """Wait for a free slot, giving up if the consumer has stopped"""
+        while not stopped.is_set():
+            if slots.acquire(timeout=0.1):
+                return True
+        return False
+
+    def fetch():
+        pages = iter_pages(get_page, continuation_token)
+        try:
+            while acquire_slot():
+                page = next(pages, None)
+                fetched.put((page, None))
+                if page is None:
+                    return
+        except Exception as ex:  # pylint: disable=broad-except
+            # Raised to the consumer when it reaches this page
+            fetched.put((None, ex))
+
+    fetcher = threading.Thread(target=fetch, name='sfctl-page-prefetch')
+    fetcher.daemon = True
+    fetcher.start()
+
+    try:
+        while True:
+            page, error = fetched.get()
+            if error is not None:
+                raise error
+            if page is None:
+                return
+            slots.release()
+            yield page
+    finally:
+        stopped.set()
+
+
+def write_pages(pages, out_file=None):
+    """
+    Write the items of each page as JSON lines, flushing after each page.
+
+    :param pages: iterable of pages with an items attribute
+    :param out_file: file like object to write to. Defaults to the current sys.stdout.
+    """
+
+    out_file = out_file or sys.stdout
+
+    for page in pages:
+        for item in page.items or []:
+            out_file.write(json.dumps(todict(item), ensure_ascii=False, sort_keys=True) + '\n')
+        out_file.flush()
+
+
+@contextmanager
+def collecting_pages():
+    """
+    Within this context, list commands run by the current thread given --all return the
+    items of every page as a list, rather than writing them to stdout. Used where several
+    threads run commands at the same time, whose output would otherwise be interleaved.
+    """
+
+    previous = getattr(_COLLECT_PAGES, 'enabled', False)
+    _COLLECT_PAGES.enabled = True
+    try:
+        yield
+    finally:
+        _COLLECT_PAGES.enabled = previous
+
+
+@contextmanager
+def writing_pages(out_file):
+    """
+    Within this context, list commands run by the current thread given --all write the
+    items of every page to out_file, rather than to the current sys.stdout.
+
+    :param out_file: file like object the invocation writes its output to
+    """
+
+    previous = getattr(_PAGES_OUTPUT, 'out_file', None)
+    _PAGES_OUTPUT.out_file = out_file
+    try:
+        yield
+    finally:
+        _PAGES_OUTPUT.out_file = previous
+
+
+def list_or_stream(get_page, continuation_token, all_pages):
+    """Return a single page, or stream all pages starting from the given token. The next
+    pages are fetched while the current page is written."""
+
+    if not all_pages:
+        return get_page(continuation_token)
+
+    pages = prefetch_pages(get_page, continuation_token, paging_prefetch_depth())
+    if getattr(_COLLECT_PAGES, 'enabled', False):
+        return [item for page in pages for item in page.items or []]
+
+    write_pages(pages, getattr(_PAGES_OUTPUT, 'out_file', None))
+    return None
+
+
+# The documentation of the commands below is set by paged_list
+# pylint: disable=missing-docstring,too-many-arguments
+
+
+@paged_list('get_node_info_list')
+def list_nodes(client, continuation_token=None, node_status_filter='default',
+               max_results=0, timeout=60, all_pages=False):
+    return list_or_stream(
+        lambda token: client.get_node_info_list(continuation_token=token,
+                                                node_status_filter=node_status_filter,
+                                                max_results=max_results,
+                                                timeout=timeout),
+        continuation_token, all_pages)
+
+
+@paged_list('get_application_info_list')
+def list_applications(client, application_definition_kind_filter=0,
+                      application_type_name=None, exclude_application_parameters=False,
+                      continuation_token=None, max_results=0, timeout=60, all_pages=False):
+    return list_or_stream(
+        lambda token: client.get_application_info_list(
+            application_definition_kind_filter=application_definition_kind_filter,
+            application_type_name=application_type_name,
+            exclude_application_parameters=exclude_application_parameters,
+            continuation_token=token,
+            max_results=max_results,
+            timeout=timeout),
+        continuation_token, all_pages)
+
+
+@paged_list('get_application_type_info_list', NO_CACHE_DOC)
+def list_application_types(client, application_type_definition_kind_filter=0,
+                           exclude_application_parameters=False, continuation_token=None,
+                           max_results=0, timeout=60, all_pages=False, no_cache=False):
+    params = dict(application_type_definition_kind_filter=application_type_definition_kind_filter,
+                  exclude_application_parameters=exclude_application_parameters,
+                  max_results=max_results,
+                  timeout=timeout)
+
+    if not all_pages:
+        # Single pages are cached. Streaming all pages always reads the cluster.
+        return cached_response(
+            'get_application_type_info_list', dict(params, continuation_token=continuation_token),
+            lambda: client.get_application_type_info_list(
+                continuation_token=continuation_token, **params),
+            no_cache)
+
+    return list_or_stream(
+        lambda token: client.get_application_type_info_list(continuation_token=token, **params),
+        continuation_token, all_pages)
+
+
+@paged_list('get_service_info_list')
+def list_services(client, application_id, service_type_name=None,
+                  continuation_token=None, timeout=60, all_pages=False):
+    return list_or_stream(
+        lambda token: client.get_service_info_list(application_id,
+                                                   service_type_name=service_type_name,
+                                                   continuation_token=token,
+                                                   timeout=timeout),
+        continuation_token, all_pages)
+
+
+@paged_list('get_partition_info_list')
+def list_partitions(client, service_id, continuation_token=None, timeout=60, all_pages=False):
+    return list_or_stream(
+        lambda token: client.get_partition_info_list(service_id,
+                                                     continuation_token=token,
+                                                     timeout=timeout),
+        continuation_token, all_pages)
+
+
+@paged_list('get_replica_info_list')
+def list_replicas(client, partition_id, continuation_token=None, timeout=60, all_pages=False):
+    return list_or_stream(
+        lambda token: client.get_replica_info_list(partition_id,
+                                                   continuation_token=token,
+                                                   timeout=timeout),
+        continuation_token, all_pages)
@@ -0,0 +1,201 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Take an inventory of all applications, services, partitions and replicas of a cluster"""
+
+import sys
+import gzip
+import json
+import threading
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from knack.util import CLIError, todict
+from sfctl.custom_paging import iter_pages
+
+
+def _list_all(get_page):
+    """Return the items of all pages of a list operation"""
+    items = []
+    for page in iter_pages(get_page):
+        items.extend(page.items or [])
+    return items
+
+
+def _to_json(obj):
+    """Convert an SDK model to the dict written to the snapshot"""
+    return todict(obj)
+
+
+class SnapshotWalker:
+    """Walk the entity hierarchy of a cluster, listing the children of each level on a
+    separate thread pool, so that each level has its own concurrency limit.
+
+    Workers of a level wait only for workers of the levels below it, and replica workers
+    do not wait at all, so the pools cannot deadlock."""
+
+    def __init__(self, client, service_concurrency, partition_concurrency,
+                 replica_concurrency):
+        self.client = client
+        self.service_pool = ThreadPoolExecutor(max_workers=service_concurrency)
+        self.partition_pool = ThreadPoolExecutor(max_workers=partition_concurrency)
+        self.replica_pool = ThreadPoolExecutor(max_workers=replica_concurrency)
+        # The futures submitted to the pools which have not completed yet, so that queued
+        # work can be cancelled. Completed futures are removed, so that their results are
+        # only kept by the level which uses them.
+        self.futures = set()
+        self.futures_lock = threading.Lock()
+
+    def _submit(self, pool, func, arg):
+        """Submit work to one of the pools, keeping its future until it completes"""
+        future = pool.submit(func, arg)
+        with self.futures_lock:
+            self.futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        """Stop keeping a completed future"""
+        with self.futures_lock:
+            self.futures.discard(future)
+
+    def close(self):
+        """Stop the thread pools, without starting any queued work"""
+        pools = (self.service_pool, self.partition_pool, self.replica_pool)
+        # Cancel the queued work of every level before waiting, so that workers waiting
+        # on a lower level are not kept waiting for work which will never be needed.
+        # Futures are cancelled one by one, since shutdown only takes cancel_futures from
+        # Python 3.9.
+        with self.futures_lock:
+            futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+        for pool in pools:
+            pool.shutdown(wait=False)
+        for pool in pools:
+            pool.shutdown(wait=True)
+
+    def list_replicas(self, partition):
+        """Return the partition with its replicas"""
+        partition_json = _to_json(partition)
+        partition_id = partition.partition_information.id
+        partition_json['replicas'] = [_to_json(replica) for replica in _list_all(
+            lambda token: self.client.get_replica_info_list(partition_id,
+                                                            continuation_token=token))]
+        return partition_json
+
+    def list_partitions(self, service):
+        """Return the service with its partitions and their replicas"""
+        service_json = _to_json(service)
+        partitions = _list_all(
+            lambda token: self.client.get_partition_info_list(service.id,
+                                                              continuation_token=token))
+        futures = [self._submit(self.replica_pool, self.list_replicas, partition)
+                   for partition in partitions]
+        service_json['partitions'] = [future.result() for future in futures]
+        return service_json
+
+    def list_services(self, application):
+        """Return the application with its services, partitions and replicas"""
+        application_json = _to_json(application)
+        services = _list_all(
+            lambda token: self.client.get_service_info_list(application.id,
+                                                            continuation_token=token))
+        futures = [self._submit(self.partition_pool, self.list_partitions, service)
+                   for service in services]
+        application_json['services'] = [future.result() for future in futures]
+        return application_json
+
+    def walk(self):
+        """Yield each application with all of its children, as soon as it is complete.
+        Applications are no longer referenced by the walker once they are yielded."""
+        pending = set(self._submit(self.service_pool, self.list_services, application)
+                      for page in iter_pages(lambda token: self.client.get_application_info_list(
+                          continuation_token=token))
+                      for application in page.items or [])
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            while done:
+                yield done.pop().result()
+
+
+def open_snapshot_file(output_file):
+    """Open the file to write the snapshot to. Files ending in .gz are compressed."""
+
+    if output_file is None:
+        return sys.stdout, False
+
+    try:
+        if output_file.endswith('.gz'):
+            return gzip.open(output_file, 'wt', encoding='utf-8'), True
+        return open(output_file, 'w', encoding='utf-8'), True
+    except OSError as ex:
+        raise CLIError('Unable to write snapshot to {0}: {1}'.format(output_file, ex))
+
+
+def write_snapshot(out_file, nodes, applications):
+    """
+    Write the snapshot as a single JSON document. Applications are written one at a time
+    as they are received, so that only the applications being listed are kept in memory.
+
+    :param out_file: file like object to write to
+    :param nodes: list of node dicts
+    :param applications: iterable of application dicts
+    :return: (int) the number of applications written
+    """
+
+    timestamp = datetime.utcnow().isoformat() + 'Z'
+    out_file.write('{{"timestamp": {0}, "nodes": {1}, "applications": ['.format(
+        json.dumps(timestamp), json.dumps(nodes, ensure_ascii=False, sort_keys=True)))
+
+    count = 0
+    for application in applications:
+        if count:
+            out_file.write(',')
+        out_file.write('\n' + json.dumps(application, ensure_ascii=False, sort_keys=True))
+        count += 1
+
+    out_file.write('\n]}\n')
+    return count
+
+
+def snapshot(client, output_file=None, service_concurrency=8, partition_concurrency=16,
+             replica_concurrency=32):
+    """
+    Write an inventory of the nodes, applications, services, partitions and replicas
+    of the cluster.
+
+    :param str output_file: File to write the snapshot to. Compressed with gzip if the name
+        ends with .gz. Defaults to stdout.
+    :param int service_concurrency: Maximum number of applications whose services are
+        listed at the same time.
+    :param int partition_concurrency: Maximum number of services whose partitions are
+        listed at the same time.
+    :param int replica_concurrency: Maximum number of partitions whose replicas are
+        listed at the same time.
+    """
+
+    for name, value in (('service', service_concurrency),
+                        ('partition', partition_concurrency),
+                        ('replica', replica_concurrency)):
+        if value < 1:
+            raise CLIError('The {0} concurrency must be at least 1.'.format(name))
+
+    nodes = [_to_json(node) for node in _list_all(
+        lambda token: client.get_node_info_list(continuation_token=token))]
+
+    walker = SnapshotWalker(client, service_concurrency, partition_concurrency,
+                            replica_concurrency)
+    out_file, close_file = open_snapshot_file(output_file)
+
+    try:
+        write_snapshot(out_file, nodes, walker.walk())
+    finally:
+        walker.close()
+        if close_file:
+            out_file.close()
+        else:
+            out_file.flush()
@@ -0,0 +1,426 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Long running local sfctl daemon, and the thin client which forwards commands to it.
+
+When the daemon is running, the sfctl entry point sends its arguments over a Unix domain
+socket and streams the output back, instead of importing the CLI and creating new
+clients in a fresh process. The daemon keeps the imported modules, the command index
+and the Service Fabric clients for each endpoint alive between commands.
+
+Protocol: the daemon sends {"ready": true} once it handles a connection. Each request is
+then a single line of JSON. A command request has the form
+{"args": [...], "cwd": "...", "env": {...}}, where env holds the SFCTL_ environment variables
+of the client, and a control request has the form {"control": "stop"} or
+{"control": "status"}. The daemon responds with lines of JSON, either
+{"stream": "stdout" | "stderr", "data": "..."} for output, followed by a final
+{"exit_code": 0} or {"status": {...}}.
+
+The daemon runs one command at a time. A command which the daemon does not get to within
+DAEMON_READY_TIMEOUT seconds, because another command is still running, is run locally.
+
+This module is imported on every sfctl run, so only the standard library may be imported
+at module level. The CLI itself is imported by the daemon when it runs a command."""
+
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+import socket
+import socketserver
+
+# This is the same as sfctl.config.SF_CLI_CONFIG_DIR. It is duplicated here so that
+# forwarding a command does not need to import the CLI.
+SF_CLI_DAEMON_DIR = os.path.expanduser(os.path.join('~', '.sfctl'))
+DAEMON_SOCKET_FILE_NAME = 'daemon.sock'
+
+# Prefix of the environment variables which override sfctl settings. This is the same as
+# sfctl.config.SF_CLI_ENV_VAR_PREFIX, in upper case as knack reads them.
+ENV_VAR_PREFIX = 'SFCTL_'
+
+# Seconds to wait for the daemon to handle a command before running it locally
+DAEMON_READY_TIMEOUT = 0.5
+
+# Shut down the daemon after this many seconds without any requests
+DEFAULT_IDLE_TIMEOUT = 3600
+
+# Commands which are always run locally. Daemon management commands must not be forwarded,
+# and commands which may prompt the user or read stdin need the terminal of the calling process.
+LOCAL_COMMANDS = (('daemon',), ('batch',), ('application', 'upload'))
+LOCAL_ARGUMENTS = ('--has-pass',)
+
+
+def get_daemon_socket_path():
+    """
+    Returns the path of the Unix domain socket which the daemon listens on.
+    :return: str
+    """
+    return os.path.join(SF_CLI_DAEMON_DIR, DAEMON_SOCKET_FILE_NAME)
+
+
+def is_daemon_supported():
+    """Return True if the platform supports Unix domain sockets"""
+    return hasattr(socket, 'AF_UNIX')
+
+
+def should_forward(args):
+    """
+    Checks whether the given command may be run by the daemon.
+
+    :param args: a list of strings representing the command, for example, ['node', 'list']
+    :return: bool
+    """
+
+    for command in LOCAL_COMMANDS:
+        if tuple(args[:len(command)]) == command:
+            return False
+
+    return not any(arg in LOCAL_ARGUMENTS for arg in args)
+
+
+def connect(socket_path=None):
+    """
+    Connect to a running daemon.
+
+    :param socket_path: (str) The socket to connect to. Defaults to the daemon socket of
+        the current user.
+    :return: a connected socket, or None if no daemon is listening
+    """
+
+    if not is_daemon_supported():
+        return None
+
+    socket_path = socket_path or get_daemon_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+
+    return sock
+
+
+def wait_until_ready(sock, timeout=DAEMON_READY_TIMEOUT):
+    """
+    Wait for the daemon to handle the connection. The daemon only handles it once the
+    commands sent before it completed.
+
+    :param sock: a socket returned by connect
+    :param timeout: (float) Seconds to wait
+    :return: True if the daemon is ready for the request, False if it is busy
+    """
+
+    sock.settimeout(timeout)
+    try:
+        with sock.makefile('rb') as response:
+            frame = json.loads(response.readline().decode('utf-8'))
+    except (OSError, ValueError):
+        return False
+    finally:
+        sock.settimeout(None)
+
+    return isinstance(frame, dict) and frame.get('ready', False)
+
+
+def get_client_environment():
+    """
+    Return the environment variables of this process which override sfctl settings.
+    :return: dict
+    """
+    return dict((name, value) for name, value in os.environ.items()
+                if name.upper().startswith(ENV_VAR_PREFIX))
+
+
+def send_request(sock, request):
+    """
+    Send a request to the daemon, and yield each response frame, other than the frame
+    telling that the daemon is ready.
+
+    :param sock: a socket returned by connect
+    :param request: dict representing the request
+    :return: generator of dict
+    """
+
+    sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+
+    with sock.makefile('rb') as response:
+        for line in response:
+            frame = json.loads(line.decode('utf-8'))
+            if 'ready' not in frame:
+                yield frame
+
+
+def forward_command(args, socket_path=None):
+    """
+    Run a command on the daemon, writing its output to the stdout and stderr of this
+    process.
+
+    :param args: a list of strings representing the command
+    :param socket_path: (str) The daemon socket. Defaults to the daemon socket of the
+        current user.
+    :return: the exit code of the command, or None if the command was not run, because
+        no daemon is running, the daemon is busy running another command, or the command
+        must be run locally.
+    """
+
+    if not should_forward(args):
+        return None
+
+    sock = connect(socket_path)
+    if sock is None:
+        return None
+
+    if not wait_until_ready(sock):
+        sock.close()
+        return None
+
+    streams = {'stdout': sys.stdout, 'stderr': sys.stderr}
+    request = {'args': args, 'cwd': os.getcwd(), 'env': get_client_environment()}
+
+    try:
+        for frame in send_request(sock, request):
+            if 'exit_code' in frame:
+                return frame['exit_code']
+            stream = streams[frame['stream']]
+            stream.write(frame['data'])
+            stream.flush()
+    except (OSError, ValueError, KeyError) as ex:
+        sys.stderr.write('Lost connection to the sfctl daemon: {0}\n'.format(ex))
+        return 1
+    finally:
+        sock.close()
+
+    sys.stderr.write('The sfctl daemon closed the connection before the command completed\n')
+    return 1
+
+
+class _FrameWriter:  # pylint: disable=too-few-public-methods
+    """File like object which sends everything written to it as response frames"""
+
+    encoding = 'utf-8'
+
+    def __init__(self, sock, stream_name):
+        self.sock = sock
+        self.stream_name = stream_name
+
+    def write(self, data):
+        """Send the data to the client"""
+        if not data:
+            return
+        frame = json.dumps({'stream': self.stream_name, 'data': data}) + '\n'
+        self.sock.sendall(frame.encode('utf-8'))
+
+    def flush(self):
+        """Frames are sent as soon as they are written, so there is nothing to flush"""
+
+    @staticmethod
+    def isatty():
+        """Output is never a terminal"""
+        return False
+
+
+def _reset_logging():
+    """Remove the knack log handlers, so that the next command creates new handlers which
+    write to the redirected stderr. knack only configures logging once per process."""
+
+    import logging
+    from knack.log import CLI_LOGGER_NAME
+
+    for logger_name in ('', CLI_LOGGER_NAME):
+        logging.getLogger(logger_name).handlers = []
+
+
+@contextmanager
+def _client_environment(variables):
+    """
+    Within this context, the environment variables which override sfctl settings are those
+    of the client, rather than those of the daemon.
+
+    :param variables: dict of the environment variables of the client
+    """
+
+    variables = dict((name, value) for name, value in variables.items()
+                     if name.upper().startswith(ENV_VAR_PREFIX))
+    daemon_variables = get_client_environment()
+    for name in daemon_variables:
+        del os.environ[name]
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name in variables:
+            os.environ.pop(name, None)
+        os.environ.update(daemon_variables)
+
+
+class SFDaemonRequestHandler(socketserver.StreamRequestHandler):
+    """Handle a single request on a daemon connection"""
+
+    def handle(self):
+        # Clients which stopped waiting for the daemon have closed the connection already
+        try:
+            self._send({'ready': True})
+            line = self.rfile.readline()
+        except OSError:
+            return
+        if not line:
+            return
+
+        try:
+            request = json.loads(line.decode('utf-8'))
+        except ValueError:
+            self._send({'stream': 'stderr', 'data': 'Invalid sfctl daemon request\n'})
+            self._send({'exit_code': 1})
+            return
+
+        control = request.get('control')
+        if control == 'stop':
+            self.server.stopped = True
+            self._send({'exit_code': 0})
+        elif control == 'status':
+            self._send({'status': self.server.get_status()})
+        else:
+            self._send({'exit_code': self.run_command(request)})
+
+    def _send(self, frame):
+        self.wfile.write((json.dumps(frame) + '\n').encode('utf-8'))
+
+    def run_command(self, request):
+        """Run the command in this process, with stdout and stderr redirected to
+        the client, and from the working directory and with the sfctl environment variables
+        of the client."""
+
+        from sfctl.config import clear_snapshots
+        from sfctl.entry import run_command
+
+        stdout = _FrameWriter(self.connection, 'stdout')
+        stderr = _FrameWriter(self.connection, 'stderr')
+        previous_streams = (sys.stdout, sys.stderr)
+        previous_cwd = os.getcwd()
+
+        sys.stdout, sys.stderr = stdout, stderr
+        _reset_logging()
+        try:
+            os.chdir(request.get('cwd') or previous_cwd)
+            with _client_environment(request.get('env') or {}):
+                return run_command(request.get('args', []), out_file=stdout)
+        except SystemExit as ex:
+            return ex.code if isinstance(ex.code, int) else 1
+        except Exception as ex:  # pylint: disable=broad-except
+            stderr.write('{0}\n'.format(ex))
+            return 1
+        finally:
+            sys.stdout, sys.stderr = previous_streams
+            _reset_logging()
+            os.chdir(previous_cwd)
+            # Parse the settings again for the next command, in case they were changed by
+            # an sfctl process which does not use the daemon
+            clear_snapshots()
+            self.server.requests_served += 1
+
+
+class SFDaemonServer(socketserver.UnixStreamServer):
+    """Serve sfctl commands one at a time over a Unix domain socket.
+
+    Commands are handled sequentially, since the output of a command is captured by
+    redirecting the standard streams of the process. Clients run their command locally
+    rather than wait for a long running command, such as an upload, to complete."""
+
+    def __init__(self, socket_path, idle_timeout):
+        self.socket_path = socket_path
+        self.timeout = idle_timeout
+        self.stopped = False
+        self.started = time.time()
+        self.requests_served = 0
+
+        # Only the current user may connect, since commands run with their credentials
+        previous_umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, socket_path,
+                                                   SFDaemonRequestHandler)
+        finally:
+            os.umask(previous_umask)
+
+    def handle_timeout(self):
+        self.stopped = True
+
+    def get_status(self):
+        """Return a dict describing the daemon"""
+        return {'pid': os.getpid(),
+                'socket': self.socket_path,
+                'uptime': int(time.time() - self.started),
+                'requestsServed': self.requests_served,
+                'idleTimeout': self.timeout}
+
+    def serve_until_stopped(self):
+        """Handle requests until a stop request, or until idle for too long"""
+        try:
+            while not self.stopped:
+                self.handle_request()
+        finally:
+            self.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+def warm_up():
+    """Import the CLI and the Service Fabric SDK, and load the command index, so that the
+    first forwarded command is as fast as later ones."""
+
+    import sfctl.apiclient  # pylint: disable=unused-import,unused-variable
+    from sfctl.command_index import load_command_index
+
+    load_command_index()
+
+
+def create_server(socket_path=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Create the daemon server, replacing the socket of a daemon which is no longer running.
+
+    :param socket_path: (str) The socket to listen on. Defaults to the daemon socket of
+        the current user.
+    :param idle_timeout: (int) Seconds without requests after which the daemon stops
+    :return: the server. Call serve_until_stopped to handle requests.
+    """
+
+    socket_path = socket_path or get_daemon_socket_path()
+    socket_dir = os.path.dirname(socket_path)
+    if not os.path.isdir(socket_dir):
+        os.makedirs(socket_dir)
+
+    if os.path.exists(socket_path):
+        sock = connect(socket_path)
+        if sock is not None:
+            sock.close()
+            raise OSError('An sfctl daemon is already listening on ' + socket_path)
+        os.remove(socket_path)
+
+    return SFDaemonServer(socket_path, idle_timeout)
+
+
+def main(argv=None):
+    """Run the daemon in the foreground"""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m sfctl.daemon',
+                                     description='Run the sfctl daemon in the foreground')
+    parser.add_argument('--socket', default=None)
+    parser.add_argument('--idle-timeout', type=int, default=DEFAULT_IDLE_TIMEOUT)
+    parsed_args = parser.parse_args(argv)
+
+    server = create_server(parsed_args.socket, parsed_args.idle_timeout)
+    warm_up()
+    server.serve_until_stopped()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,12 +9,14 @@
 Handles creating and launching a CLI to handle a user command."""
 
 import sys
+from collections import defaultdict
 from knack.invocation import CommandInvoker
-from knack.util import CommandResultItem
-from sfctl.config import VersionedCLI
+from knack.util import CLIError, CommandResultItem
+from sfctl.config import VersionedCLI, flush_snapshots
 from sfctl.config import SF_CLI_CONFIG_DIR, SF_CLI_ENV_VAR_PREFIX, SF_CLI_NAME
+from sfctl.cluster_fanout import report_failed_clusters, split_fanout_args
 from sfctl.commands import SFCommandLoader, SFCommandHelp
-from sfctl.custom_cluster import check_cluster_version
+from sfctl.custom_cluster import check_cluster_version_deferred
 from sfctl.util import is_help_command
 
 def cli():
@@ -33,7 +35,8 @@ def launch():
     Configures and invokes CLI with arguments passed during the time the python
     session is launched.
 
-    This is run every time a sfctl command is invoked.
+    This is run every time a sfctl command is invoked, unless the command is forwarded
+    to the sfctl daemon.
 
     If you have a local error, say the command is not recognized, then the invoke command will
     raise an exception.
@@ -41,28 +44,61 @@ def launch():
     If the HTTP request returns an error, then an exception is not thrown, and error
     code is not 0."""
 
-    args_list = sys.argv[1:]
+    return run_command(sys.argv[1:])
+
+
+def run_command(args_list, out_file=None):
+    """Run a single sfctl command in this process.
+
+    :param args_list: a list of strings representing the command, for example,
+        ['node', 'list']
+    :param out_file: file like object to write the command result to. Defaults to
+        the current sys.stdout.
+    :return: the exit code of the command"""
+
+    try:
+        return _run_command(args_list, out_file)
+    finally:
+        # Write the settings and state set by the command, all at once
+        flush_snapshots()
+
+
+def _run_command(args_list, out_file):
+    """Run a single sfctl command, and check the cluster version unless it failed to parse"""
 
     cli_env = cli()
 
     is_help_cmd = is_help_command(args_list)
 
-    invocation_return_value = cli_env.invoke(args_list)
+    try:
+        profiles, args_list = split_fanout_args(args_list)
+    except CLIError as ex:
+        cli_env.logging.configure(args_list)
+        return cli_env.exception_handler(ex)
+
+    invocation_data = None
+    if profiles is not None and not is_help_cmd:
+        invocation_data = defaultdict(lambda: None, clusters=profiles)
+
+    invocation_return_value = cli_env.invoke(args_list, initial_invocation_data=invocation_data,
+                                             out_file=out_file or sys.stdout)
 
     # We don't invoke cluster version checking when the user gets an exception, since it means that
     # there is something wrong with their command input, such as missing a required parameter.
     # This is not the same as an error returned from the server, which does not raise an exception.
     # We should also not hit the cluster in the cases of the user inputting a help command (-h)
+    # The version is checked in the background, so the command does not wait for it.
 
-    if is_help_cmd:
+    # Commands run with --clusters or --all-clusters do not use the selected cluster
+    if is_help_cmd or invocation_data is not None:
         return invocation_return_value
 
     try:
-        if invocation_return_value != 0 or 'select' in sys.argv[1:]:
+        if invocation_return_value != 0 or 'select' in args_list:
             # invocation_return_value is 0 on success
-            check_cluster_version(on_failure_or_connection=True)
+            check_cluster_version_deferred(on_failure_or_connection=True)
         else:
-            check_cluster_version(on_failure_or_connection=False)
+            check_cluster_version_deferred(on_failure_or_connection=False)
 
     except:  # pylint: disable=bare-except
         # Catch any exceptions from checking cluster version. For example, if we are not able
@@ -78,7 +114,9 @@ class SFInvoker(CommandInvoker):  # pylint: disable=too-few-public-methods
     """Extend Invoker to to handle when a system service is not installed (BRS/EventStore cases)."""
     def execute(self, args):
         try:
-            return super(SFInvoker, self).execute(args)
+            cmd_result = super(SFInvoker, self).execute(args)
+            report_failed_clusters(self.data, cmd_result)
+            return cmd_result
 
         # For exceptions happening while handling http requests, FabricErrorException is thrown with
         # 'Internal Server Error' message, but here we handle the case where gateway is unable
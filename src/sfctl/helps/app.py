@@ -80,6 +80,87 @@ helps['application upload'] = """
               a newly created folder called sfctl_compressed_temp under the parent directory specified
               in the path argument. For example, if the path argument has value C:/FolderA/AppPkg,
               then the compressed package will be added to C:/FolderA/sfctl_compressed_temp/AppPkg
+        - name: --chunk-size
+          type: int
+          short-summary: Size in MB of the chunks in which large files are uploaded to the native
+              image store
+          long-summary: Files larger than this size are uploaded in chunks using an image store
+              upload session, so that a failed chunk is retried on its own rather than restarting
+              the whole file. Set to 0 to upload every file in a single request. Defaults to 64.
+        - name: --chunk-concurrency
+          type: int
+          short-summary: Maximum number of chunks of one file uploaded at the same time.
+              Defaults to 4.
+        - name: --incremental
+          type: bool
+          short-summary: Only upload the files which changed since the package was last uploaded
+              to the same destination
+          long-summary: sfctl keeps a manifest of the content hash of each uploaded file under
+              ~/.sfctl, for each cluster endpoint, image store and destination path. Files whose
+              hash did not change are skipped, files which are no longer part of the package are
+              deleted from the image store, and folder markers are always uploaded. The manifest
+              is saved as each folder completes, so running the same command again resumes an
+              interrupted upload.
+        - name: --verify-store
+          type: bool
+          short-summary: With --incremental, first list the content of the image store, and
+              upload again the files which are missing or whose size differs from the manifest
+          long-summary: Use this if the package may have been deleted or modified in the image
+              store since it was last uploaded, for example by sfctl store delete.
+        - name: --concurrency
+          type: int
+          short-summary: Maximum number of files uploaded to the native image store, or copied
+              to a file share, at the same time. Defaults to 10.
+        - name: --pool-size
+          type: int
+          short-summary: Maximum number of connections to the cluster kept open and shared by
+              all uploads to the native image store
+          long-summary: Defaults to concurrency multiplied by chunk-concurrency, so that every
+              request in flight can reuse an open connection.
+        - name: --async-transport
+          type: bool
+          short-summary: Upload to the native image store from a single asyncio event loop
+              rather than a pool of threads
+          long-summary: Suited to a high concurrency, such as hundreds of small files uploaded
+              at the same time. Requires aiohttp, which is installed by pip install sfctl[async].
+        - name: --compression-level
+          type: int
+          short-summary: With --compress, 0 to store files in the zip files without compression,
+              or 1 (fastest) to 9 (smallest)
+          long-summary: Storing without compression suits packages of binaries which are already
+              compressed. Code, config and data packages are compressed at the same time, one
+              per CPU. Defaults to the default level of zlib.
+        - name: --pipeline
+          type: bool
+          short-summary: With --compress, upload each zip file to the native image store as
+              soon as it is written, while the next ones are compressed
+          long-summary: The other files of the package are uploaded while the first zip files
+              are compressed. The timeout then includes the time spent compressing.
+        - name: --compression-cache
+          type: bool
+          short-summary: With --compress, reuse the zip files of the folders which did not
+              change since an earlier package was compressed to the same location
+          long-summary: The zip files are kept in a folder called sfctl_compression_cache under
+              the compressed location. A folder is unchanged if the names, sizes and modification
+              times of its files are. Set the compression_cache_hash_content setting to compare
+              the content of the files instead. The least recently used zip files are removed
+              once the cache is larger than the compression_cache_max_size setting, in bytes,
+              which defaults to 1 GB.
+        - name: --link-files
+          type: bool
+          short-summary: Hard link the files of the package into a file share image store on
+              the same file system, rather than copying them
+          long-summary: A linked file is the same file as in the package, so the package must
+              not be modified in place afterwards. Files which cannot be linked are copied.
+        - name: --progress-json
+          type: bool
+          short-summary: Write upload progress to stderr as one JSON object per line, rather
+              than showing a progress bar
+          long-summary: A line is written at most every second, and a last line once the
+              upload completes or fails. Each line has the event (progress, complete or failed),
+              the elapsed seconds, the bytes and files uploaded and in total, the throughput in
+              bytes per second, the ETA in seconds, and the bytes, files and throughput of each
+              worker.
 """
 
 helps['application upgrade'] = """
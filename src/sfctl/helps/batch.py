@@ -0,0 +1,39 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Help documentation for the sfctl batch command."""
+
+from knack.help_files import helps
+
+helps['batch'] = """
+    type: command
+    short-summary: Run many sfctl commands concurrently in a single process.
+    long-summary: Reads one command per line, either as a command line such as
+        'partition health --partition-id 1234', or as JSON holding a command line, a list of
+        arguments, or an object with the command under "command". Blank lines and lines
+        starting with '#' are skipped. The commands share one connection to the cluster.
+        Writes one line of JSON per command, with the input line number, the command,
+        its exit code, and either its result or its error. List commands given --all
+        return the items of all pages as their result. Fails if any command fails.
+    parameters:
+        - name: --input-file
+          type: string
+          short-summary: File with one command per line. Reads from stdin if not given,
+            or if '-'.
+        - name: --concurrency
+          type: int
+          short-summary: Maximum number of commands run at the same time. Defaults to 8.
+        - name: --ordered
+          type: bool
+          short-summary: Write results in input order, rather than as each command
+            completes.
+    examples:
+        - name: Get the health of many partitions, 16 at a time.
+          text: sfctl batch --input-file partitions.txt --concurrency 16
+        - name: Read commands from stdin.
+          text: |
+            printf 'node list\\napplication list\\n' | sfctl batch --ordered
+"""
@@ -0,0 +1,42 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Help documentation for sfctl daemon commands."""
+
+from knack.help_files import helps
+
+helps['daemon start'] = """
+    type: command
+    short-summary: Start the sfctl daemon in the background.
+    long-summary: While the daemon is running, sfctl commands are sent to the daemon
+        and run there, rather than in a new process. The daemon keeps connections to
+        the cluster open between commands, which makes running many commands in a row
+        much faster. The daemon runs with the environment of the shell which started it,
+        except for the SFCTL_ environment variables, which are those of the command.
+        The daemon runs one command at a time. A command started while the daemon is
+        busy with another command runs in its own process instead.
+        Restart the daemon after upgrading sfctl.
+    parameters:
+        - name: --idle-timeout
+          type: int
+          short-summary: Seconds without any commands after which the daemon stops
+            itself. Defaults to one hour.
+    examples:
+        - name: Start the daemon, and stop it after 10 minutes without commands.
+          text: sfctl daemon start --idle-timeout 600
+"""
+
+helps['daemon stop'] = """
+    type: command
+    short-summary: Stop the sfctl daemon.
+"""
+
+helps['daemon status'] = """
+    type: command
+    short-summary: Show whether the sfctl daemon is running.
+    long-summary: If the daemon is running, also shows its process ID, how long it has
+        been running, and how many commands it has served.
+"""
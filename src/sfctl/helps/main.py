@@ -47,6 +47,18 @@ helps['cluster'] = """
     short-summary: Select, manage, and operate Service Fabric clusters
 """
 
+helps['cluster profile'] = """
+    type: group
+    short-summary: Save connections to many clusters, to run commands on with --clusters
+        or --all-clusters
+    long-summary: Any command, such as 'sfctl node list --clusters prod-east,prod-west' or
+        'sfctl cluster health --all-clusters', may be given --clusters with a comma separated
+        list of profile names, or --all-clusters for all saved profiles. The command runs on
+        all of the clusters at the same time, without selecting them, and writes a list with
+        the result or error of each cluster, tagged with the profile name. At most
+        cluster_fanout_concurrency clusters are sent the command at once, 32 by default.
+"""
+
 helps['compose'] = """
     type: group
     short-summary: Create, delete, and manage Docker Compose applications
@@ -107,6 +119,12 @@ helps['settings telemetry'] = """
         the error message returned
 """
 
+helps['daemon'] = """
+    type: group
+    short-summary: Manage the local sfctl daemon, which runs commands without starting
+        a new process each time
+"""
+
 helps['events'] = """
     type: group
     short-summary: Retrieve events from the events store (if EventStore service is already installed)
@@ -0,0 +1,383 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Compress the code, config and data packages of application packages into zip files"""
+
+import os
+import shutil
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from knack.util import CLIError
+from sfctl.upload_util import get_cpu_count
+
+
+class IgnoreCopy():  # pylint: disable=too-few-public-methods,bad-option-value,C1001
+    """
+    A class which contains information and methods for the shutil.copytree method's
+    callback parameter.
+    """
+
+    def __init__(self):
+        # Directories which will be ignored as part of the ignore_copy function
+        # If used for compressing application package:
+        # A list of strings representing the abs path of the dirs in an application package
+        # which need to be compressed
+        # Paths in dirs_to_ignore should normalized using the _normalize_path function before setting
+        self.dirs_to_ignore = []
+
+    def ignore_copy(self, directory_being_visited, list_of_dirs):
+        """
+        The ignore function for shutil.copytree()
+
+        :param directory_being_visited: str
+        :param list_of_dirs: Example: ['t.txt']
+
+        :return: a subset of the items in its second argument (must be relative path).
+                 these names will then be ignored in the copy process
+        """
+
+        to_ignore = []
+
+        for directory in list_of_dirs:
+
+            full_path = os.path.join(directory_being_visited, directory)
+            full_path = _normalize_path(full_path)
+            if full_path in self.dirs_to_ignore:
+                to_ignore.append(directory)
+
+        return to_ignore
+
+
+def _normalize_path(path):
+    """
+    Standardize a path to a file/folder location so that they can be compared
+
+    :param path: (str) represents a path on a machine
+    :return: (str) the standardized path
+    """
+
+    path = os.path.realpath(path)  # This removes slashes at the end of the path
+    path = os.path.normpath(path)
+    path = os.path.normcase(path)
+    path = os.path.abspath(path)
+    return path
+
+
+def _link_or_copy(src, dst):
+    """
+    A copy function for shutil.copytree which hard links files rather than copying their
+    content, and copies the files which cannot be linked, for example because the
+    destination is on another drive.
+
+    :param src: (str) Path of the source file
+    :param dst: (str) Path of the file to create
+    :return: (str) dst
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def zip_folder(folder, zip_path, compression_level=None):
+    """
+    Write the content of a folder to a zip file, with the same entries as shutil.make_archive.
+    Files are read and compressed one at a time, directly from the folder. Entries are
+    written in sorted order, so that compressing the same files again gives the same zip file.
+
+    ZIP64 is used for archives larger than 2 GB.
+
+    :param folder: (str) The folder to compress
+    :param zip_path: (str) Path of the zip file to create
+    :param compression_level: (int) 0 to store files without compression, or 1 (fastest) to
+        9 (smallest) to deflate them. None uses the default deflate level.
+    :return: None
+    """
+
+    if compression_level == 0:
+        compression, compresslevel = zipfile.ZIP_STORED, None
+    else:
+        compression, compresslevel = zipfile.ZIP_DEFLATED, compression_level
+
+    with zipfile.ZipFile(zip_path, 'w', compression, allowZip64=True,
+                         compresslevel=compresslevel) as zip_file:
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            rel_root = os.path.relpath(root, folder)
+            if rel_root != os.curdir:
+                zip_file.write(root, rel_root)
+            for single_file in sorted(files):
+                zip_file.write(os.path.join(root, single_file),
+                               os.path.normpath(os.path.join(rel_root, single_file)))
+
+
+def _folder_size(folder):
+    """Return the total size in bytes of the files under a folder"""
+    return sum(os.path.getsize(os.path.join(root, single_file))
+               for root, _, files in os.walk(folder) for single_file in files)
+
+
+def largest_folders_first(folders_and_zip_paths):
+    """
+    Sort (folder, zip path) pairs so that the largest folders are compressed first, and a
+    large folder is not left to compress on its own at the end.
+    """
+    return sorted(folders_and_zip_paths, key=lambda pair: _folder_size(pair[0]), reverse=True)
+
+
+def zip_folders(folders_and_zip_paths, compression_level=None, jobs=None):
+    """
+    Compress folders into zip files at the same time, on a pool of processes, largest
+    folders first.
+
+    :param folders_and_zip_paths: list of (folder, zip path) pairs, as passed to zip_folder
+    :param compression_level: (int) As passed to zip_folder
+    :param jobs: (int) Maximum number of folders compressed at the same time. Defaults to the
+        number of CPUs.
+    :return: None
+    """
+
+    jobs = min(jobs or get_cpu_count(), len(folders_and_zip_paths))
+
+    if jobs <= 1:
+        for folder, zip_path in folders_and_zip_paths:
+            zip_folder(folder, zip_path, compression_level)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(zip_folder, folder, zip_path, compression_level)
+                   for folder, zip_path in largest_folders_first(folders_and_zip_paths)]
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def prepare_compressed_package(app_dir, output_dir, link_files=False):
+    """
+    Copy an application package to the location passed in (output_dir), except for the
+    folders to compress, and return the zip files to write for them. compress_package writes
+    the zip files right away, while upload --pipeline uploads each one as soon as it is
+    written.
+
+    :param app_dir: (str) An absolute path to an application package to be compressed
+
+    :param output_dir: (str) An absolute path to the location to output the zipped dir
+
+    :param link_files: (bool) As passed to compress_package
+
+    :return: list of (folder, zip path) pairs, as passed to zip_folder, or a CLIError exception
+    """
+
+    # Check if we're dealing with a dir in _check_folder_structure_and_get_dirs instead of
+    # in this function
+
+    # Normalize slashes, etc, in app_dir and output_dir
+    app_dir = _normalize_path(app_dir)
+    output_dir = _normalize_path(output_dir)
+
+    compress_copy = IgnoreCopy()
+
+    # Exception will be raised if the package isn't the correct structure
+    # This list may be empty in the case of an already compressed application package
+    compress_copy.dirs_to_ignore = _check_folder_structure_and_get_dirs(app_dir)
+
+    if not compress_copy.dirs_to_ignore:
+        print("Nothing to copy")
+
+    app_name = os.path.basename(app_dir)
+    copy_output_path = os.path.join(output_dir, app_name)
+
+    # Get the relative paths under app_name of dirs_to_copy so that we know
+    # where to place the new zipped file
+    relative_paths_to_compress = []
+    for directory in compress_copy.dirs_to_ignore:
+
+        rel_path = directory[len(app_dir):]
+        relative_paths_to_compress.append(rel_path.lstrip('\\').lstrip('/'))
+
+    try:
+        # Copy everything except the one we want to zip. Those we will do manually
+        shutil.copytree(app_dir, copy_output_path, ignore=compress_copy.ignore_copy,
+                        copy_function=_link_or_copy if link_files else shutil.copy2)
+
+    except Exception as ex:
+        raise CLIError(str.format('Compression failed due to {0}. Please clean up '
+                                  'location {1}', str(ex), output_dir))
+
+    # For example, the Code folder of WordCountServicePkg is compressed into
+    # C:/SomeLocation/WordCountApp/WordCountServicePkg/Code.zip
+    return [(dir_to_compress, os.path.join(copy_output_path, directory) + '.zip')
+            for directory, dir_to_compress in zip(relative_paths_to_compress,
+                                                  compress_copy.dirs_to_ignore)]
+
+
+def compress_package(app_dir, output_dir, link_files=False, compression_level=None, jobs=None,  # pylint: disable=too-many-arguments
+                     cache=None):
+    """
+    Compress to the location passed in (output_dir). Note that it is not the entire package
+    which is compressed, but rather, only some inside parts of the app package folder.
+
+    Check if the folder has the correct structure for a service fabric application. If
+    not, raise an exception alerting user of bad folder structure.
+
+    The folders to compress are written as zip files directly from app_dir. The other files
+    of the package are copied, or hard linked if link_files is set.
+
+    For example, if app_dir = C:/SomeFolder/WordCountApp
+    and if output_dir = C:/SomeLocation,
+    then the following will be created: C:/SomeLocation/WordCountApp
+
+    :param app_dir: (str) An absolute path to an application package to be compressed
+
+    :param output_dir: (str) An absolute path to the location to output the zipped dir
+
+    :param link_files: (bool) Hard link the files which are not compressed into output_dir
+        rather than copying them, where the file system allows it. Use this when the
+        compressed package is only read, and removed afterwards, since a linked file is the
+        same file as in app_dir.
+
+    :param compression_level: (int) 0 to store files without compression, which suits
+        packages of already compressed binaries, or 1 (fastest) to 9 (smallest).
+
+    :param jobs: (int) Maximum number of folders compressed at the same time, on a pool of
+        processes. Defaults to the number of CPUs.
+
+    :param cache: sfctl.compression_cache.CompressionCache from which the zip files of
+        unchanged folders are reused, and to which new zip files are added, or None
+
+    :return: Nothing, or a CLIError exception
+    """
+
+    folders_and_zip_paths = prepare_compressed_package(app_dir, output_dir, link_files)
+    if cache is not None:
+        folders_and_zip_paths = cache.restore(folders_and_zip_paths, compression_level)
+
+    try:
+        zip_folders(folders_and_zip_paths, compression_level, jobs)
+
+    except zipfile.LargeZipFile as ex:
+        raise CLIError('Compression failed due to file too large. Please clean up '
+                       'location ' + _normalize_path(output_dir) + '\n' + str(ex))
+
+    except Exception as ex:
+        raise CLIError(str.format('Compression failed due to {0}. Please clean up '
+                                  'location {1}', str(ex), _normalize_path(output_dir)))
+
+    if cache is not None:
+        cache.store([zip_path for _, zip_path in folders_and_zip_paths])
+
+
+def _check_folder_structure_and_get_dirs(app_dir):
+    """
+    Check if the given path is a folder. If not, raise an exception indicating only
+    SF app package folders can be compressed.
+
+    Check if the folder given corresponds to a valid application structure. If the package
+    is valid, return a list of dirs (abs path, normalized using the
+    _normalize_path function) to be compressed.
+
+    If the folder is already compressed, then return empty list.
+
+    Example format:
+
+    WordCountApp (this is the last segment of the app_dir path)
+
+        o WordCountServicePkg
+              Code
+            •     WordCount.Service.exe
+            •     Other Files
+              Config
+            •     Settings.xml
+              ServiceManifest.xml
+
+        o WordCountWebServicePkg
+              Code
+            •     WordCount.WebService.exe
+            •     Other Files
+              Config
+            •     Settings.xml
+              ServiceManifest.xml
+
+        o    ApplicationManifest.xml
+
+    The Code and Config folders should be compressed. These will be listed in the Application and Service manifests.
+
+    :param app_dir: (str) An absolute path to an application package
+    :return: A list of strings representing the absolute paths to directories which should
+             be compressed. Return a CLIError if the provided path is not a dir
+    """
+
+    # Future optimization: don't copy already compressed packages. Just let the user know
+    # and upload. This should be an uncommon case, and isn't worth the effort now
+
+    to_compress = []
+
+    if not os.path.isdir(app_dir):
+        raise CLIError('Only Service Fabric application packages may be compressed. '
+                       'The following path is not a directory: ' + app_dir)
+
+    path_to_app_manifest = os.path.join(app_dir, 'ApplicationManifest.xml')
+
+    # An application manifest file should exist directly under the directory passed in
+    if not os.path.isfile(path_to_app_manifest):  # Casing does not matter
+        raise CLIError('Application package to be compressed is missing ApplicationManifest.xml')
+
+    # A list of the service packages. This should be the absolute path
+    service_packages = []
+
+    # Parse the application manifest to find which folders should have the service manifest.
+    app_manifest_parsed = ET.parse(path_to_app_manifest).getroot()
+    for child in app_manifest_parsed:
+        # Use ends with, because the tags start with the xmlns
+        if child.tag.endswith('ServiceManifestImport'):
+            # We expect a child element that looks like:
+            # <ServiceManifestRef ServiceManifestName="CalculatorServicePackage" ServiceManifestVersion="1.0"/>
+            for inner_child in child:
+                if inner_child.tag.endswith('ServiceManifestRef'):
+                    path_to_service_package = os.path.join(app_dir, inner_child.attrib.get('ServiceManifestName'))
+                    service_packages.append(path_to_service_package)
+
+    # Go through each service package folder and search for the service manifest
+    # The service manifest defines which packages are the code, config, and data packages, which
+    # needs to be compressed.
+    for service_package_path in service_packages:
+        path_to_service_manifest = os.path.join(service_package_path, 'ServiceManifest.xml')
+
+        # Raise exception is the expected service manifest file doesn't exist AND
+        # if the service package isn't already zipped
+        if not os.path.isfile(path_to_service_manifest) \
+                and not os.path.isfile(path_to_service_manifest+'.sfpkg'):  # Casing does not matter
+            raise CLIError('Service package to be compressed is missing ServiceManifest.xml in ' + service_package_path)
+
+        service_manifest_parsed = ET.parse(path_to_service_manifest).getroot()
+
+        for child in service_manifest_parsed:
+            if child.tag.endswith('CodePackage') or \
+                    child.tag.endswith('ConfigPackage') or child.tag.endswith('DataPackage'):
+
+                # If the app package already compressed,
+                # then mark a bool somewhere that says that this package is already
+                # compressed, and expect that we just upload the entire package without copying to any location
+                # In this case, we would not copy to output dir, and just upload. For partially compressed,
+                # we should compress just those and throw the compressed in the output folder
+                # For the case where there is no copy needed, we should print a statement letting the user know.
+
+                folder_name = child.attrib.get("Name")
+                folder_to_compress = os.path.join(service_package_path, folder_name)
+
+                if not os.path.isdir(folder_to_compress):  # Casing does not matter
+                    raise CLIError(str.format("{0} defined in {1} does not exist",
+                                              folder_to_compress, path_to_service_manifest))
+
+                to_compress.append(_normalize_path(folder_to_compress))
+
+    return to_compress
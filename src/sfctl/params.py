@@ -56,6 +56,11 @@ def custom_arguments(self, _):  # pylint: disable=too-many-statements
                                   'will equal the remaining timeout duration. '
                                   'Timeout does not include the time required to '
                                   'compress the application package. ')
+        arg_context.argument('chunk_size', type=int)
+        arg_context.argument('chunk_concurrency', type=int)
+        arg_context.argument('concurrency', type=int)
+        arg_context.argument('pool_size', type=int)
+        arg_context.argument('compression_level', type=int)
 
     with ArgumentsContext(self, 'application create') as arg_context:
         arg_context.argument('parameters', type=json_encoded)
@@ -218,3 +223,19 @@ def custom_arguments(self, _):  # pylint: disable=too-many-statements
         # expect the parameter command_input in the python method as --command in commandline.
         arg_context.argument('command_input',
                              CLIArgumentType(options_list='--command'))
+
+    for paged_command in ('node list', 'application list', 'application type-list',
+                          'service list', 'partition list', 'replica list'):
+        with ArgumentsContext(self, paged_command) as arg_context:
+            arg_context.argument('all_pages', options_list=('--all',))
+
+    with ArgumentsContext(self, 'daemon start') as arg_context:
+        arg_context.argument('idle_timeout', type=int)
+
+    with ArgumentsContext(self, 'batch') as arg_context:
+        arg_context.argument('concurrency', type=int)
+
+    with ArgumentsContext(self, 'cluster snapshot') as arg_context:
+        arg_context.argument('service_concurrency', type=int)
+        arg_context.argument('partition_concurrency', type=int)
+        arg_context.argument('replica_concurrency', type=int)
@@ -0,0 +1,222 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Read and write the local cache of responses to read only query commands.
+
+The cache is opt-in, using the use_response_cache setting. Each response is stored as one
+file under the sfctl config directory, keyed by the cluster endpoint, the SDK operation and
+its parameters. Entries expire after a time to live set per operation, and the least
+recently used entries are removed once the cache grows beyond response_cache_max_size
+bytes. The whole cache is cleared whenever a cluster is selected."""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+from knack.log import get_logger
+from knack.util import todict
+from sfctl.config import (SF_CLI_CONFIG_DIR, client_endpoint, response_cache_enabled,
+                          response_cache_max_size, response_cache_ttl)
+
+RESPONSE_CACHE_DIR_NAME = 'response_cache'
+
+# Seconds for which the responses of each operation are reused, unless overridden by the
+# response_cache_ttl_<operation> setting. Manifests of a given application type version
+# do not change once it is provisioned, so they are kept the longest.
+DEFAULT_TTLS = {
+    'get_cluster_manifest': 300,
+    'get_provisioned_fabric_code_version_info_list': 300,
+    'get_application_type_info_list': 60,
+    'get_service_type_info_list': 3600,
+    'get_application_manifest': 86400,
+    'get_service_manifest': 86400
+}
+
+# Parameters which do not change the response, and so are not part of the cache key
+IGNORED_PARAMS = ['timeout']
+
+logger = get_logger(__name__)  # pylint: disable=invalid-name
+
+
+def get_response_cache_dir():
+    """
+    Returns the path of the directory where cached responses are stored.
+    :return: str
+    """
+    return os.path.join(SF_CLI_CONFIG_DIR, RESPONSE_CACHE_DIR_NAME)
+
+
+def get_cache_key(endpoint, operation_name, params):
+    """
+    Returns the key of the response to an operation with the given parameters.
+
+    :param endpoint: (str) The cluster endpoint
+    :param operation_name: (str) The name of the SDK operation
+    :param params: dict of the parameters passed to the operation
+    :return: str
+    """
+    params = dict((name, value) for name, value in params.items()
+                  if name not in IGNORED_PARAMS)
+    return json.dumps([endpoint, operation_name, params], sort_keys=True)
+
+
+def _get_entry_path(key):
+    """Return the path of the file storing the entry with the given key"""
+    return os.path.join(get_response_cache_dir(),
+                        hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+
+def _remove(path):
+    """Remove a file, ignoring files already removed by another sfctl process"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def read_entry(key, now=None):
+    """
+    Return the cached response with the given key, and mark it as recently used.
+
+    :param key: (str) Key returned by get_cache_key
+    :param now: (float) The current time. For testing only.
+    :return: (bool, object) Whether a response was found, and the response
+    """
+
+    now = time.time() if now is None else now
+    entry_path = _get_entry_path(key)
+
+    try:
+        with open(entry_path, 'r') as entry_file:
+            entry = json.load(entry_file)
+    except (OSError, ValueError):
+        return False, None
+
+    if not isinstance(entry, dict) or entry.get('key') != key:
+        return False, None
+
+    if entry.get('expires', 0) <= now:
+        _remove(entry_path)
+        return False, None
+
+    try:
+        # The modification time orders entries for least recently used eviction
+        os.utime(entry_path, (now, now))
+    except OSError:
+        pass
+
+    return True, entry.get('value')
+
+
+def write_entry(key, value, ttl, max_size, now=None):
+    """
+    Store a response in the cache, then evict the least recently used entries if the
+    cache is larger than max_size bytes. The entry is written to a temporary file first
+    and then renamed, so that concurrent sfctl processes never read a partial entry.
+    Failures are logged and otherwise ignored, since the cache is only an optimization.
+
+    :param key: (str) Key returned by get_cache_key
+    :param value: The JSON serializable response
+    :param ttl: (int) Seconds for which the entry may be read
+    :param max_size: (int) Maximum total size of the cache in bytes
+    :param now: (float) The current time. For testing only.
+    :return: None
+    """
+
+    now = time.time() if now is None else now
+    cache_dir = get_response_cache_dir()
+    entry_path = _get_entry_path(key)
+    temp_path = '{0}.{1}.tmp'.format(entry_path, os.getpid())
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(temp_path, 'w') as entry_file:
+            json.dump({'key': key, 'expires': now + ttl, 'value': value}, entry_file)
+        os.utime(temp_path, (now, now))
+        os.replace(temp_path, entry_path)
+    except (OSError, TypeError, ValueError) as ex:
+        logger.debug('Unable to write cached response to %s: %s', entry_path, str(ex))
+        _remove(temp_path)
+        return
+
+    evict_entries(max_size)
+
+
+def evict_entries(max_size):
+    """
+    Remove the least recently used entries until the cache is no larger than max_size bytes.
+
+    :param max_size: (int) Maximum total size of the cache in bytes
+    :return: None
+    """
+
+    cache_dir = get_response_cache_dir()
+    entries = []
+
+    try:
+        file_names = os.listdir(cache_dir)
+    except OSError:
+        return
+
+    for file_name in file_names:
+        if not file_name.endswith('.json'):
+            continue
+        entry_path = os.path.join(cache_dir, file_name)
+        try:
+            stat = os.stat(entry_path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+    total_size = sum(size for _, size, _ in entries)
+
+    for _, size, entry_path in sorted(entries):
+        if total_size <= max_size:
+            return
+        _remove(entry_path)
+        total_size -= size
+
+
+def clear_response_cache():
+    """Remove all cached responses."""
+
+    cache_dir = get_response_cache_dir()
+
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def cached_response(operation_name, params, fetch, no_cache=False):
+    """
+    Return the response of an operation from the cache, or fetch and cache it.
+
+    When the cache is turned off, the response of fetch is returned unchanged. Otherwise,
+    the response is returned as the dict written to the cache, so that the output of a
+    command is the same whether or not its response was cached.
+
+    :param operation_name: (str) The name of the SDK operation, which selects the TTL
+    :param params: dict of the parameters passed to the operation
+    :param fetch: function without arguments which sends the request
+    :param no_cache: (bool) Do not read the cache, but still store the fresh response
+    :return: The response
+    """
+
+    if not response_cache_enabled():
+        return fetch()
+
+    key = get_cache_key(client_endpoint(), operation_name, params)
+
+    if not no_cache:
+        found, value = read_entry(key)
+        if found:
+            return value
+
+    value = todict(fetch())
+    write_entry(key, value, response_cache_ttl(operation_name, DEFAULT_TTLS[operation_name]),
+                response_cache_max_size())
+    return value
@@ -13,6 +13,7 @@ from multiprocessing import Process
 import portalocker
 from applicationinsights import TelemetryClient
 from sfctl.telemetry import TELEMETRY_FILE_PATH
+from sfctl.config import flush_snapshots
 from sfctl.state import set_telemetry_send_retry_count
 
 INSTRUMENTATION = '482faeea-c22b-4c75-a1af-5bfe79f36cb7'
@@ -86,8 +87,10 @@ def send_telemetry_best_attempt():
     except:  # pylint: disable=bare-except
         pass
 
-    # After send has completed, clear the telemetry retry counter
+    # After send has completed, clear the telemetry retry counter. This runs in a child process,
+    # which exits without running exit handlers, so the state is written here.
     set_telemetry_send_retry_count(0)
+    flush_snapshots()
 
 # pylint: disable=invalid-name
 if __name__ == '__main__':
@@ -7,13 +7,17 @@
 """Read and modify state related to the CLI"""
 
 import os
+import json
+import hashlib
 from datetime import datetime
 from knack.config import CLIConfig
-from pkg_resources import get_distribution
+from sfctl.config import get_snapshot
 
 # knack CLIConfig has all the functionality needed to keep track of state, so we are using that
 # here to prevent code duplication. We are using CLIConfig to create a file called 'state' to
 # track states associated with SFCTL, such as the last time sfctl version was checked.
+# The file is parsed again only when it changes, and written once the command completes. See
+# sfctl.config.ConfigSnapshot.
 
 # Default names
 SF_CLI_NAME = 'sfctl'
@@ -32,16 +36,20 @@ def get_state_path():
 
     # This is the same as
     # self.config_path = os.path.join(self.config_dir, CLIConfig._CONFIG_FILE_NAME)
-    return CLIConfig(SF_CLI_STATE_DIR, SF_CLI_NAME, 'state').config_path
+    return _get_state_snapshot().config_path
+
+
+def _get_state_snapshot():
+    """Return the snapshot of the sfctl state file"""
+
+    return get_snapshot('state', lambda: CLIConfig(SF_CLI_STATE_DIR, SF_CLI_NAME, 'state'))
 
 
 def get_state_value(name, fallback=None):
     """Gets a state entry by name.
     In the case where the state entry name is not found, will use fallback value."""
 
-    cli_config = CLIConfig(SF_CLI_STATE_DIR, SF_CLI_NAME, 'state')
-
-    return cli_config.get('servicefabric', name, fallback)
+    return _get_state_snapshot().get('servicefabric', name, fallback)
 
 
 def set_state_value(name, value):
@@ -52,8 +60,7 @@ def set_state_value(name, value):
     :return: None
     """
 
-    cli_config = CLIConfig(SF_CLI_STATE_DIR, SF_CLI_NAME, 'state')
-    cli_config.set_value('servicefabric', name, value)
+    _get_state_snapshot().set_value('servicefabric', name, value)
 
 
 def get_cluster_version_check_time():
@@ -84,6 +91,55 @@ def set_cluster_version_check_time(custom_time=None):
         set_state_value('datetime', custom_time.strftime(DATETIME_FORMAT))
 
 
+def _cluster_version_state_name(endpoint):
+    """Name of the state entry of the version of a cluster. Endpoints contain characters which
+    are not allowed in names, so the name has a hash of the endpoint instead."""
+
+    return 'cluster_version_' + hashlib.sha256(endpoint.encode('utf-8')).hexdigest()[:16]
+
+
+def get_cluster_version_check(endpoint):
+    """
+    Get the result of the last version check of a cluster.
+    :param endpoint: (str) The cluster endpoint
+    :return: dict with keys version (str, or None if the version is not known), checked
+        (datetime.datetime in UTC, the time the check was started) and reported (bool, True if
+        a mismatch with the version was already reported). None if the cluster was never
+        checked.
+    """
+
+    value = get_state_value(_cluster_version_state_name(endpoint), None)
+
+    if value is None:
+        return None
+
+    try:
+        entry = json.loads(value)
+        return {'version': entry['version'],
+                'checked': datetime.strptime(entry['checked'], DATETIME_FORMAT),
+                'reported': entry.get('reported', False)}
+    except (ValueError, KeyError, TypeError):
+        # Written by another version of sfctl, or corrupt. Check the cluster again.
+        return None
+
+
+def set_cluster_version_check(endpoint, version, checked=None, reported=False):
+    """
+    Set the result of the version check of a cluster.
+    :param endpoint: (str) The cluster endpoint
+    :param version: (str) The cluster version, or None if it is not known
+    :param checked: (datetime.datetime) The time the check was started, in UTC. Defaults to
+        the current time.
+    :param reported: (bool) True if a mismatch with the version was already reported
+    :return: None
+    """
+
+    entry = {'version': version,
+             'checked': (checked or datetime.utcnow()).strftime(DATETIME_FORMAT),
+             'reported': reported}
+    set_state_value(_cluster_version_state_name(endpoint), json.dumps(entry))
+
+
 def get_telemetry_send_retry_count():
     """
     Get the number of send telemetry attempts have failed consecutively.
@@ -129,5 +185,6 @@ def get_sfctl_version():
     Get the version of the sfctl. For example, 6.0.0
     :return: str
     """
-    pkg = get_distribution("sfctl")
-    return pkg.version
+    from importlib.metadata import version
+
+    return version('sfctl')
@@ -15,7 +15,7 @@ import json
 from uuid import uuid4
 import portalocker
 from knack.log import get_logger
-from sfctl.config import get_telemetry_config, get_cli_version_from_pkg
+from sfctl.config import get_telemetry_config, get_cli_version_from_pkg, flush_snapshots
 from sfctl.state import increment_telemetry_send_retry_count
 
 # knack CLIConfig has been re-purposed to handle state instead.
@@ -162,6 +162,9 @@ def send_telemetry():
     send_telemetry_background_path = \
         os.path.join(current_file_location, 'send_telemetry_background.py')
 
+    # The background process resets the retry counter, so the counter is written first
+    flush_snapshots()
+
     # subprocess.run is the newer version of the call command (python 3.5)
     # If you close the terminal, this process will end as well.
     Popen(['python', send_telemetry_background_path], close_fds=True)
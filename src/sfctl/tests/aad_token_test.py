@@ -0,0 +1,171 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for the AAD tokens kept in memory and refreshed in the background"""
+
+import os
+import ssl
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from mock import patch
+from adal.token_cache import TokenCache
+import sfctl.config as sf_config
+from sfctl.aad_token import get_token_manager
+from sfctl.tests.helpers import write_self_signed_cert
+
+RESOURCE = 'https://cluster.contoso.com'
+CLIENT_ID = 'client-id'
+USER_ID = 'user@contoso.com'
+
+# Seconds the token endpoint waits before responding
+LATENCY = 0.5
+
+
+class TokenHandler(BaseHTTPRequestHandler):
+    """Stand in for the AAD token endpoint, redeeming refresh tokens"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a token request after the latency"""
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        self.server.requests.append(form)
+        time.sleep(LATENCY)
+
+        number = len(self.server.requests)
+        body = json.dumps({'token_type': 'Bearer', 'expires_in': 3600, 'resource': RESOURCE,
+                           'access_token': 'access-{0}'.format(number),
+                           'refresh_token': 'refresh-{0}'.format(number)}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        pass
+
+
+class TokenServer(ThreadingMixIn, HTTPServer):
+    """HTTPS token endpoint, handling each request on its own thread"""
+    daemon_threads = True
+
+    def __init__(self, cert_path, key_path):
+        HTTPServer.__init__(self, ('localhost', 0), TokenHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.requests = []
+
+
+class AadTokenTests(unittest.TestCase):
+    """AAD token manager tests"""
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        cert_path, key_path = write_self_signed_cert(temp_dir)
+
+        self.server = TokenServer(cert_path, key_path)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.authority = 'https://localhost:{0}/tenant'.format(self.server.server_address[1])
+
+        for target, value in (('sfctl.config.SF_CLI_CONFIG_DIR', temp_dir),
+                              ('sfctl.config._SNAPSHOTS', {}),
+                              ('sfctl.aad_token._MANAGERS', {}),
+                              # The stand in endpoint is not a known AAD instance
+                              ('adal.authority.Authority._validate_via_instance_discovery',
+                               lambda _: None)):
+            config_patch = patch(target, new=value)
+            config_patch.start()
+            self.addCleanup(config_patch.stop)
+        env_patch = patch.dict(os.environ, {'REQUESTS_CA_BUNDLE': cert_path})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+
+    def select(self, expires_in):
+        """Save a token expiring in the given number of seconds, as cluster select does"""
+        token = {'tokenType': 'Bearer', 'expiresIn': 3600, 'resource': RESOURCE,
+                 'accessToken': 'access-0', 'refreshToken': 'refresh-0', 'userId': USER_ID,
+                 'isMRRT': True, '_clientId': CLIENT_ID, '_authority': self.authority,
+                 'expiresOn': str(datetime.now() + timedelta(seconds=expires_in))}
+        sf_config.set_aad_metadata(self.authority, RESOURCE, CLIENT_ID)
+        sf_config.set_aad_cache(token, TokenCache(json.dumps([token])))
+        sf_config.flush_snapshots()
+
+    def persisted_access_token(self):
+        """The access token in the configuration file"""
+        sf_config.clear_snapshots()
+        return json.loads(sf_config.get_config_value('aad_token'))['accessToken']
+
+    def test_valid_token_kept(self):
+        """A token which is not about to expire is used without any request"""
+        self.select(expires_in=3600)
+        manager = get_token_manager()
+
+        for _ in range(10):
+            self.assertEqual('access-0', manager.get_access_token())
+        self.assertIsNone(manager.refresh_thread)
+        self.assertEqual([], self.server.requests)
+
+    def test_refresh_ahead_of_expiry(self):
+        """A token expiring soon is still used, while a new one is requested in the
+        background and written to the configuration"""
+        self.select(expires_in=200)
+        manager = get_token_manager()
+
+        threads = [threading.Thread(target=manager.get_access_token) for _ in range(8)]
+        start = time.time()
+        self.assertEqual('access-0', manager.get_access_token())
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(time.time() - start, LATENCY)
+
+        manager.refresh_thread.join()
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual(['refresh_token'], self.server.requests[0]['grant_type'])
+        self.assertEqual(['refresh-0'], self.server.requests[0]['refresh_token'])
+        self.assertEqual('access-1', self.persisted_access_token())
+
+        self.assertEqual('access-1', manager.get_access_token())
+        self.assertIsNone(manager.refresh_thread)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_expired_token_refreshed(self):
+        """A command waits for a new token once the token expires"""
+        self.select(expires_in=30)
+
+        self.assertEqual('access-1', get_token_manager().get_access_token())
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual('access-1', self.persisted_access_token())
+
+    def test_token_of_profile(self):
+        """Each connection profile has its own token, and a token selected by another
+        process is read again"""
+        self.select(expires_in=3600)
+        with sf_config.using_profile('other'):
+            self.select(expires_in=30)
+
+        self.assertEqual('access-1', get_token_manager('other').get_access_token())
+        self.assertEqual('access-0', get_token_manager().get_access_token())
+
+        token = json.loads(sf_config.get_config_value('aad_token'))
+        token['accessToken'] = 'access-selected'
+        sf_config.set_config_value('aad_token', json.dumps(token))
+        self.assertEqual('access-selected', get_token_manager().get_access_token())
+        self.assertEqual(1, len(self.server.requests))
@@ -0,0 +1,103 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for the Service Fabric client cache"""
+
+import unittest
+import requests
+from mock import patch
+from msrest.universal_http.requests import RequestHTTPSenderConfiguration
+from sfctl import apiclient
+
+
+class ApiClientTests(unittest.TestCase):
+    """Client cache tests"""
+
+    def setUp(self):
+        self.settings = {'endpoint': 'http://cluster-a:19080', 'max_idle': 300,
+                         'pools': (10, 10)}
+
+        patches = [
+            patch('sfctl.apiclient.client_endpoint',
+                  side_effect=lambda: self.settings['endpoint']),
+            patch('sfctl.apiclient.security_type', return_value='none'),
+            patch('sfctl.apiclient.cert_info', return_value=None),
+            patch('sfctl.apiclient.ca_cert_info', return_value=None),
+            patch('sfctl.apiclient.no_verify_setting', return_value=False),
+            patch('sfctl.apiclient.client_max_idle',
+                  side_effect=lambda: self.settings['max_idle']),
+            patch('sfctl.apiclient.connection_pool_settings',
+                  side_effect=lambda: self.settings['pools'])
+        ]
+        for settings_patch in patches:
+            settings_patch.start()
+            self.addCleanup(settings_patch.stop)
+
+        apiclient.clear_clients()
+        self.addCleanup(apiclient.clear_clients)
+
+    def test_client_reused_for_same_settings(self):
+        """Commands to the same cluster share one client"""
+        client = apiclient.create(None)
+
+        self.assertIs(client, apiclient.create(None))
+
+        self.settings['endpoint'] = 'http://cluster-b:19080'
+        self.assertIsNot(client, apiclient.create(None))
+
+        self.settings['endpoint'] = 'http://cluster-a:19080'
+        self.settings['pools'] = (1, 50)
+        self.assertIsNot(client, apiclient.create(None))
+
+    def test_aad_client_of_profile(self):
+        """AAD clients are not shared by connection profiles with the same endpoint, since
+        each profile has its own token"""
+        from sfctl.config import using_profile
+
+        with patch('sfctl.apiclient.security_type', return_value='aad'):
+            client = apiclient.create(None)
+            self.assertIs(client, apiclient.create(None))
+
+            with using_profile('other'):
+                other = apiclient.create(None)
+                self.assertIs(other, apiclient.create(None))
+            self.assertIsNot(client, other)
+
+    def test_idle_client_evicted(self):
+        """Clients unused for longer than the max idle setting are closed and replaced"""
+        with patch('sfctl.apiclient.time.time', return_value=1000):
+            client = apiclient.create(None)
+
+        with patch('sfctl.apiclient.time.time', return_value=1300), \
+                patch.object(client, 'close') as close_mock:
+            self.assertIs(client, apiclient.create(None))
+            self.assertFalse(close_mock.called)
+
+        with patch('sfctl.apiclient.time.time', return_value=1601), \
+                patch.object(client, 'close') as close_mock:
+            self.assertIsNot(client, apiclient.create(None))
+            self.assertTrue(close_mock.called)
+
+    def test_zero_max_idle_disables_reuse(self):
+        """A max idle of zero creates a new client for every command"""
+        self.settings['max_idle'] = 0
+        client = apiclient.create(None)
+
+        self.assertIsNot(client, apiclient.create(None))
+
+    def test_pooled_session_callback(self):
+        """The session callback mounts adapters with the configured pool sizes once"""
+        callback = apiclient.pooled_session_callback(2, 25)
+        config = RequestHTTPSenderConfiguration()
+        session = requests.Session()
+
+        self.assertEqual({'timeout': 5}, callback(session, config, {}, timeout=5))
+        adapter = session.get_adapter('https://cluster-a:19080')
+        self.assertEqual(25, adapter._pool_maxsize)  # pylint: disable=protected-access
+        self.assertEqual(2, adapter._pool_connections)  # pylint: disable=protected-access
+
+        callback(session, config, {})
+        self.assertIs(adapter, session.get_adapter('https://cluster-a:19080'))
@@ -14,11 +14,13 @@ try:
     from urllib import parse
 except ImportError:
     import urlparse as parse
+from knack.util import CLIError
 from mock import patch, MagicMock
 import requests
 import vcr
 import sfctl.custom_app as sf_c
-from sfctl.tests.mock_server import (find_localhost_free_port, start_mock_server)
+from sfctl.tests.mock_server import (find_localhost_free_port, start_mock_server,
+                                     MockServer, COMMITTED_UPLOADS, UPLOAD_SESSIONS)
 from sfctl.custom_exceptions import SFCTLInternalException
 from sfctl.tests.helpers import (MOCK_CONFIG, get_mock_endpoint, set_mock_endpoint)
 
@@ -119,23 +121,37 @@ class AppTests(unittest.TestCase):
         self.assertEqual(sf_c.path_from_imagestore_string(test_string),
                          expected_string)
 
-    def test_upload_to_fileshare(self):  # pylint: disable=no-self-use
+    def test_upload_to_fileshare(self):
         """Upload copies files to non-native store correctly with no
-        progress"""
+        progress, skips files already copied, and links files if asked to"""
         import shutil
         import tempfile
 
-        temp_file = tempfile.NamedTemporaryFile(dir=tempfile.mkdtemp())
-        temp_src_dir = os.path.dirname(temp_file.name)
+        temp_src_dir = tempfile.mkdtemp()
         temp_dst_dir = tempfile.mkdtemp()
-        shutil_mock = MagicMock()
-        shutil_mock.copyfile.return_value = None
-        with patch('sfctl.custom_app.shutil', new=shutil_mock):
+        self.addCleanup(shutil.rmtree, temp_src_dir)
+        self.addCleanup(shutil.rmtree, temp_dst_dir)
+        os.makedirs(os.path.join(temp_src_dir, 'Code'))
+        for name in ('ApplicationManifest.xml', os.path.join('Code', 'service.exe')):
+            with open(os.path.join(temp_src_dir, name), 'w') as src_file:
+                src_file.write(name)
+
+        sf_c.upload_to_fileshare(temp_src_dir, temp_dst_dir, False, concurrency=2)
+        copied = os.path.join(temp_dst_dir, 'Code', 'service.exe')
+        with open(copied) as dst_file:
+            self.assertEqual(os.path.join('Code', 'service.exe'), dst_file.read())
+        self.assertFalse(os.path.samefile(os.path.join(temp_src_dir, 'Code', 'service.exe'),
+                                          copied))
+
+        with patch('sfctl.custom_app._copy_file_range') as copy_mock:
             sf_c.upload_to_fileshare(temp_src_dir, temp_dst_dir, False)
-            shutil_mock.copyfile.assert_called_once()
-        temp_file.close()
-        shutil.rmtree(os.path.dirname(temp_file.name))
-        shutil.rmtree(temp_dst_dir)
+            copy_mock.assert_not_called()
+
+        with open(os.path.join(temp_src_dir, 'Code', 'service.exe'), 'a') as src_file:
+            src_file.write('v2')
+        sf_c.upload_to_fileshare(temp_src_dir, temp_dst_dir, False, link_files=True)
+        self.assertTrue(os.path.samefile(os.path.join(temp_src_dir, 'Code', 'service.exe'),
+                                         copied))
 
 
     def test_upload_image_store_timeout_overall(self):  #pylint: disable=invalid-name
@@ -187,6 +203,8 @@ class AppTests(unittest.TestCase):
         - Where the timeout is sufficient to completing the task.
             - Make sure the # of requests is correct -> # of files + # of dirs
             - Make sure that each URL shows a decreasing amount of time left"""
+        import shutil
+        import tempfile
 
         current_directory = os.path.dirname(os.path.realpath(__file__))
         # 4 files total in sample_nested_folders
@@ -194,30 +212,24 @@ class AppTests(unittest.TestCase):
         endpoint = 'http://localhost:' + str(self.port)
         basename = os.path.basename(path_to_upload_file)
 
-        generated_file_path = 'native_image_store_upload_test.json'
+        # Record the requests outside of the working directory, and remove them afterwards
+        recording_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, recording_dir)
+        generated_file_path = os.path.join(recording_dir, 'native_image_store_upload_test.json')
 
         with requests.Session() as sesh:
             # Session does not need any security
 
             # Testing long timeout - expect upload completion
 
-            # In case this file was created and not deleted by a previous test,
-            # delete it here
-            try:
-                os.remove(generated_file_path)
-            except OSError:
-                # if the file doesn't exist, then there's nothing for us to do here
-                pass
-
             timeout = 65  # upload should complete
             with vcr.use_cassette(generated_file_path, record_mode='all',
-                                  serializer='json'), \
-                    patch('sfctl.custom_app.get_job_count') as get_job_count_mock:
+                                  serializer='json'):
 
                 try:
-                    get_job_count_mock.return_value = 1
                     sf_c.upload_to_native_imagestore(sesh, endpoint, path_to_upload_file, basename,
-                                                 show_progress=False, timeout=timeout)
+                                                     show_progress=False, timeout=timeout,
+                                                     concurrency=1)
                 except:
                     pass
         # Read in the json file to make sure that each file waited ~3 seconds, and not much more
@@ -246,3 +258,197 @@ class AppTests(unittest.TestCase):
                 self.assertAlmostEqual(int(query_timeout[0]), timeout-iteration*3, delta=2)
 
                 iteration += 1
+
+    def test_upload_file_in_chunks(self):
+        """Files larger than the chunk size are uploaded in chunks through an upload session,
+        and failed chunks are retried"""
+        import shutil
+        import tempfile
+        from time import time
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        file_content = os.urandom(10000)
+        with open(os.path.join(temp_dir, 'large.bin'), 'wb') as large_file:
+            large_file.write(file_content)
+
+        endpoint = 'http://localhost:' + str(self.port)
+        MockServer.failing_chunk_uploads = 2
+        self.addCleanup(setattr, MockServer, 'failing_chunk_uploads', 0)
+
+        with requests.Session() as sesh, patch('sfctl.custom_app.sleep'):
+            sf_c.upload_single_file_native_imagestore(
+                sesh, endpoint, 'ChunkApp', 'Code', 'large.bin', temp_dir, int(time()) + 60,
+                chunk_size=3000, chunk_concurrency=2)
+
+        self.assertEqual(0, MockServer.failing_chunk_uploads)
+        self.assertEqual(file_content, COMMITTED_UPLOADS['ChunkApp/Code/large.bin'])
+        self.assertEqual({}, UPLOAD_SESSIONS)
+
+    def test_upload_chunk_failure_deletes_session(self):
+        """When a chunk keeps failing, the error is raised and the upload session deleted"""
+        import shutil
+        import tempfile
+        from time import time
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        with open(os.path.join(temp_dir, 'large.bin'), 'wb') as large_file:
+            large_file.write(os.urandom(5000))
+
+        endpoint = 'http://localhost:' + str(self.port)
+        MockServer.failing_chunk_uploads = 100
+        self.addCleanup(setattr, MockServer, 'failing_chunk_uploads', 0)
+
+        with requests.Session() as sesh, patch('sfctl.custom_app.sleep'):
+            with self.assertRaises(requests.HTTPError):
+                sf_c.upload_file_chunks_native_imagestore(
+                    sesh, endpoint, 'ImageStore/FailedApp/large.bin',
+                    os.path.join(temp_dir, 'large.bin'), int(time()) + 60, chunk_size=1000,
+                    chunk_concurrency=1, chunk_retries=2)
+
+        self.assertNotIn('FailedApp/large.bin', COMMITTED_UPLOADS)
+        self.assertEqual({}, UPLOAD_SESSIONS)
+
+    def test_incremental_upload_to_fileshare(self):
+        """Incremental uploads only copy changed files, remove deleted files, and copy again
+        files missing from the destination when verified"""
+        import shutil
+        import tempfile
+        from sfctl.upload_manifest import UploadManifest, get_fileshare_file_sizes
+
+        src_dir = tempfile.mkdtemp()
+        dst_dir = tempfile.mkdtemp()
+        manifest_path = os.path.join(tempfile.mkdtemp(), 'manifest.json')
+        for temp_dir in (src_dir, dst_dir, os.path.dirname(manifest_path)):
+            self.addCleanup(shutil.rmtree, temp_dir)
+
+        os.makedirs(os.path.join(src_dir, 'Code'))
+        for name, content in (('ApplicationManifest.xml', 'app'), ('Code/a.dll', 'a'),
+                              ('Code/b.dll', 'b')):
+            with open(os.path.join(src_dir, name), 'w') as src_file:
+                src_file.write(content)
+
+        def upload():
+            """Upload incrementally, and return the files copied"""
+            manifest = UploadManifest(manifest_path, src_dir)
+            manifest.verify(get_fileshare_file_sizes(dst_dir))
+            with patch('sfctl.custom_app._copy_file_range',
+                       side_effect=sf_c._copy_file_range) as copy:  # pylint: disable=protected-access
+                sf_c.upload_to_fileshare(src_dir, dst_dir, False, manifest)
+            return sorted(os.path.relpath(call[0][0], src_dir).replace(os.sep, '/')
+                          for call in copy.call_args_list)
+
+        self.assertEqual(['ApplicationManifest.xml', 'Code/a.dll', 'Code/b.dll'], upload())
+        self.assertEqual([], upload())
+
+        with open(os.path.join(src_dir, 'Code', 'a.dll'), 'w') as src_file:
+            src_file.write('changed')
+        os.remove(os.path.join(src_dir, 'Code', 'b.dll'))
+        os.remove(os.path.join(dst_dir, 'ApplicationManifest.xml'))
+
+        self.assertEqual(['ApplicationManifest.xml', 'Code/a.dll'], upload())
+        self.assertEqual(['ApplicationManifest.xml', 'Code/a.dll'],
+                         sorted(get_fileshare_file_sizes(dst_dir)))
+
+    def test_incremental_upload_to_native_imagestore(self):  #pylint: disable=invalid-name
+        """Incremental uploads to the native image store skip unchanged files, but always
+        upload the folder markers, and resume after a failure"""
+        import shutil
+        import tempfile
+        from sfctl.upload_manifest import UploadManifest
+
+        src_dir = os.path.join(tempfile.mkdtemp(), 'IncrementalApp')
+        manifest_path = os.path.join(tempfile.mkdtemp(), 'manifest.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(src_dir))
+        self.addCleanup(shutil.rmtree, os.path.dirname(manifest_path))
+
+        os.makedirs(os.path.join(src_dir, 'Code'))
+        for name in ('ApplicationManifest.xml', 'Code/a.dll', 'Code/b.dll'):
+            with open(os.path.join(src_dir, name), 'w') as src_file:
+                src_file.write(name)
+
+        def upload(failing_path=None):
+            """Upload incrementally, and return the image store paths put"""
+            def put(url, **_):
+                response = MagicMock()
+                path = parse.urlparse(url).path
+                if path == failing_path:
+                    response.raise_for_status.side_effect = requests.HTTPError()
+                return response
+
+            sesh = MagicMock()
+            sesh.put.side_effect = put
+            try:
+                sf_c.upload_to_native_imagestore(
+                    sesh, 'http://localhost', src_dir, 'IncrementalApp', False, 60,
+                    manifest=UploadManifest(manifest_path, src_dir), concurrency=1)
+            except SFCTLInternalException:
+                pass
+            return sorted(parse.urlparse(call[0][0]).path for call in sesh.put.call_args_list)
+
+        self.assertIn('/ImageStore/IncrementalApp/ApplicationManifest.xml',
+                      upload(failing_path='/ImageStore/IncrementalApp/Code/a.dll'))
+
+        resumed = upload()
+        self.assertNotIn('/ImageStore/IncrementalApp/ApplicationManifest.xml', resumed)
+        self.assertIn('/ImageStore/IncrementalApp/Code/a.dll', resumed)
+        self.assertIn('/ImageStore/IncrementalApp/Code/_.dir', resumed)
+
+        self.assertEqual(['/ImageStore/IncrementalApp/Code/_.dir',
+                          '/ImageStore/IncrementalApp/_.dir'], upload())
+
+    def test_upload_pending_files(self):
+        """Files still being written are uploaded once written, before their folder marker,
+        and a failure to write them fails the upload"""
+        import shutil
+        import tempfile
+        from concurrent.futures import Future
+
+        src_dir = os.path.join(tempfile.mkdtemp(), 'PipelineApp')
+        self.addCleanup(shutil.rmtree, os.path.dirname(src_dir))
+        os.makedirs(os.path.join(src_dir, 'SvcPkg'))
+        with open(os.path.join(src_dir, 'ApplicationManifest.xml'), 'w') as src_file:
+            src_file.write('manifest')
+        zip_path = os.path.join(src_dir, 'SvcPkg', 'Code.zip')
+
+        def upload(write_zip):
+            """Upload while the zip file is written, and return the image store paths put"""
+            written = Future()
+            puts = []
+
+            def put(url, **_):
+                path = parse.urlparse(url).path
+                puts.append(path)
+                # The zip file is written once the other files were uploaded
+                if path.endswith('ApplicationManifest.xml'):
+                    if write_zip:
+                        with open(zip_path, 'wb') as zip_file:
+                            zip_file.write(b'zip')
+                        written.set_result(None)
+                    else:
+                        written.set_exception(OSError('disk full'))
+                return MagicMock()
+
+            sesh = MagicMock()
+            sesh.put.side_effect = put
+            sf_c.upload_to_native_imagestore(sesh, 'http://localhost', src_dir, 'PipelineApp',
+                                             False, 60, concurrency=1,
+                                             pending_files={zip_path: written})
+            return puts
+
+        puts = upload(write_zip=True)
+        self.assertEqual(4, len(puts))
+        self.assertLess(puts.index('/ImageStore/PipelineApp/SvcPkg/Code.zip'),
+                        puts.index('/ImageStore/PipelineApp/SvcPkg/_.dir'))
+
+        os.remove(zip_path)
+        with self.assertRaises(CLIError):
+            upload(write_zip=False)
+
+    def test_upload_session_pool(self):
+        """Upload sessions share one adapter keeping the given number of connections open"""
+        with sf_c.create_upload_session(32) as sesh:
+            adapter = sesh.get_adapter('https://localhost:19080')
+            self.assertIs(adapter, sesh.get_adapter('http://localhost:19080'))
+            self.assertEqual(32, adapter._pool_maxsize)  # pylint: disable=protected-access
@@ -0,0 +1,135 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for running commands with sfctl batch"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from mock import MagicMock, patch
+from knack.util import CLIError
+from sfctl.custom_batch import parse_batch_line, run
+
+
+class BatchTests(unittest.TestCase):
+    """Batch command tests"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.temp_dir))
+
+    def write_input(self, lines):
+        """Write batch input lines to a file and return its path"""
+        input_path = os.path.join(self.temp_dir, 'batch.txt')
+        with open(input_path, 'w') as input_file:
+            input_file.write('\n'.join(lines) + '\n')
+        return input_path
+
+    def run_batch(self, lines, **kwargs):
+        """Run a batch and return the outcomes written, and the error raised, if any"""
+        error = None
+        with patch('sys.stdout', new=StringIO()) as stdout:
+            try:
+                run(input_file=self.write_input(lines), **kwargs)
+            except CLIError as ex:
+                error = ex
+        return [json.loads(line) for line in stdout.getvalue().splitlines()], error
+
+    def test_parse_batch_line(self):
+        """Command lines, JSON strings, argument lists and objects are accepted"""
+        expected = ['partition', 'health', '--partition-id', 'a b']
+        self.assertEqual(expected, parse_batch_line('partition health --partition-id "a b"'))
+        self.assertEqual(expected,
+                         parse_batch_line('sfctl partition health --partition-id "a b"'))
+        self.assertEqual(expected, parse_batch_line(json.dumps(expected)))
+        self.assertEqual(expected, parse_batch_line(json.dumps({'command': expected})))
+        self.assertEqual(expected, parse_batch_line(
+            json.dumps('partition health --partition-id "a b"')))
+
+        for invalid in ('{"command": 1}', '[1, 2]', '{not json', 'sfctl', 'batch',
+                        'daemon stop', 'node list -h', 'node list "unterminated'):
+            with self.assertRaises(CLIError, msg=invalid):
+                parse_batch_line(invalid)
+
+    @patch('sfctl.custom_cluster.client_endpoint', return_value='http://batch-test:19080')
+    def test_run_commands(self, _):
+        """Each command writes one line with its result or error"""
+        outcomes, error = self.run_batch(['# comment', '', 'cluster show-connection',
+                                          'cluster not-a-command'], ordered=True)
+
+        self.assertEqual(2, len(outcomes))
+        self.assertEqual({'line': 3, 'command': 'cluster show-connection', 'exitCode': 0,
+                          'result': 'http://batch-test:19080'}, outcomes[0])
+        self.assertEqual(4, outcomes[1]['line'])
+        self.assertEqual(2, outcomes[1]['exitCode'])
+        self.assertIn('error', outcomes[1])
+        self.assertIn('1 of 2', str(error))
+
+    def test_all_pages_in_result(self):
+        """List commands given --all return the items of all pages as their result, rather
+        than writing them between the outcomes of the batch"""
+        from azure.servicefabric.models import PagedNodeInfoList, NodeInfo
+
+        def get_node_info_list(continuation_token=None, **_):
+            if continuation_token is None:
+                return PagedNodeInfoList(continuation_token='page2',
+                                         items=[NodeInfo(name='node1')])
+            return PagedNodeInfoList(continuation_token='', items=[NodeInfo(name='node2')])
+
+        client = MagicMock()
+        client.get_node_info_list.side_effect = get_node_info_list
+        # A function rather than a mock, since command groups deep copy the client factory
+        with patch('sfctl.commands.client_create', new=lambda _: client):
+            outcomes, error = self.run_batch(['node list --all'] * 4, concurrency=4)
+
+        self.assertIsNone(error)
+        self.assertEqual(4, len(outcomes))
+        for outcome in outcomes:
+            self.assertEqual(['node1', 'node2'], [node['name'] for node in outcome['result']])
+
+    def test_output_order(self):
+        """Results are written in completion order unless ordered is set"""
+
+        def slow_first(_, line_number, line):
+            time.sleep(0.3 if line_number == 1 else 0)
+            return {'line': line_number, 'command': line, 'exitCode': 0}
+
+        with patch('sfctl.custom_batch.BatchRunner.run', autospec=True, side_effect=slow_first):
+            outcomes, error = self.run_batch(['node list', 'node info'], concurrency=2)
+            self.assertIsNone(error)
+            self.assertEqual([2, 1], [outcome['line'] for outcome in outcomes])
+
+            outcomes, _ = self.run_batch(['node list', 'node info'], concurrency=2,
+                                         ordered=True)
+            self.assertEqual([1, 2], [outcome['line'] for outcome in outcomes])
+
+    def test_input_streamed(self):
+        """Only a bounded number of commands are read ahead of the outcomes written"""
+        read_ahead = []
+
+        def lines():
+            for line_number in range(1, 51):
+                read_ahead.append(line_number)
+                yield line_number, 'node list'
+
+        def run_line(_, line_number, line):
+            # The number of lines read beyond this one when it is run
+            return {'line': line_number, 'command': line, 'exitCode': 0,
+                    'readAhead': len(read_ahead) - line_number}
+
+        with patch('sfctl.custom_batch.read_batch_lines', return_value=lines()), \
+                patch('sfctl.custom_batch.BatchRunner.run', autospec=True,
+                      side_effect=run_line), \
+                patch('sys.stdout', new=StringIO()) as stdout:
+            run(concurrency=2, ordered=True)
+
+        outcomes = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(list(range(1, 51)), [outcome['line'] for outcome in outcomes])
+        self.assertLessEqual(max(outcome['readAhead'] for outcome in outcomes), 4)
@@ -0,0 +1,211 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for connection profiles, and commands run on many clusters at once"""
+
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from mock import patch
+from knack.util import CLIError
+import sfctl.config as sf_config
+from sfctl.cluster_fanout import split_fanout_args
+from sfctl.entry import run_command
+
+# Seconds each cluster waits before responding
+LATENCY = 0.5
+
+
+class ClusterHandler(BaseHTTPRequestHandler):
+    """Answer node list with a single node named after the cluster, after the latency"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer after the latency"""
+        time.sleep(LATENCY)
+        if self.server.failing:
+            self.respond(500, {'Error': {'Code': 'FABRIC_E_COMMUNICATION_ERROR',
+                                         'Message': 'Unavailable'}})
+        else:
+            self.respond(200, {'ContinuationToken': '',
+                               'Items': [{'Name': self.server.cluster_name}]})
+
+    def respond(self, status, body):
+        """Send a JSON response"""
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        pass
+
+    def handle(self):
+        try:
+            BaseHTTPRequestHandler.handle(self)
+        except ConnectionResetError:
+            pass
+
+
+class ClusterServer(ThreadingMixIn, HTTPServer):
+    """Mock cluster, handling each request on its own thread"""
+    daemon_threads = True
+
+    def __init__(self, cluster_name, failing=False):
+        HTTPServer.__init__(self, ('localhost', 0), ClusterHandler)
+        self.cluster_name = cluster_name
+        self.failing = failing
+
+    @property
+    def endpoint(self):
+        """The HTTP endpoint of the server"""
+        return 'http://localhost:{0}'.format(self.server_address[1])
+
+
+class ClusterFanoutTests(unittest.TestCase):
+    """Connection profile and fan out tests"""
+
+    def setUp(self):
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(config_dir))
+
+        for target in ('sfctl.config.SF_CLI_CONFIG_DIR', 'sfctl.response_cache.SF_CLI_CONFIG_DIR'):
+            config_patch = patch(target, new=config_dir)
+            config_patch.start()
+            self.addCleanup(config_patch.stop)
+        snapshots_patch = patch('sfctl.config._SNAPSHOTS', new={})
+        snapshots_patch.start()
+        self.addCleanup(snapshots_patch.stop)
+
+        self.servers = {}
+        for name, failing in (('east', False), ('west', False), ('down', True)):
+            server = self.servers[name] = ClusterServer(name, failing)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+
+    def run_sfctl(self, args):
+        """Run a command, and return its exit code and output"""
+        out_file = StringIO()
+        with patch('sys.stderr', new=StringIO()):
+            exit_code = run_command(args, out_file=out_file)
+        output = out_file.getvalue()
+        return exit_code, json.loads(output) if output else None
+
+    def add_profiles(self, *names):
+        """Save a profile for each of the mock clusters"""
+        for name in names:
+            exit_code, _ = self.run_sfctl(['cluster', 'profile', 'add', '--name', name,
+                                           '--endpoint', self.servers[name].endpoint])
+            self.assertEqual(0, exit_code)
+
+    def test_split_fanout_args(self):
+        """The fan out options are removed from the arguments of the command"""
+        with patch('sfctl.config.profile_names', return_value=['a', 'b', 'c']):
+            self.assertEqual((None, ['node', 'list']), split_fanout_args(['node', 'list']))
+            self.assertEqual((['b', 'a'], ['node', 'list', '--all']),
+                             split_fanout_args(['node', 'list', '--clusters', 'b, a,b',
+                                                '--all']))
+            self.assertEqual((['c', 'a'], ['node', 'list']),
+                             split_fanout_args(['node', '--clusters=c', 'list',
+                                                '--clusters', 'a']))
+            self.assertEqual((['a', 'b', 'c'], ['node', 'list']),
+                             split_fanout_args(['node', 'list', '--all-clusters']))
+
+            for invalid in (['--clusters', 'a,d'], ['--clusters'], ['--clusters', '--all'],
+                            ['--clusters', ','], ['--clusters', 'a', '--all-clusters']):
+                with self.assertRaises(CLIError, msg=invalid):
+                    split_fanout_args(['node', 'list'] + invalid)
+
+        with patch('sfctl.config.profile_names', return_value=[]), \
+                self.assertRaises(CLIError):
+            split_fanout_args(['node', 'list', '--all-clusters'])
+
+    def test_profiles(self):
+        """Profiles are listed and removed, and do not change the selected cluster"""
+        self.add_profiles('west', 'east')
+
+        self.assertEqual((0, [{'name': 'east', 'endpoint': self.servers['east'].endpoint,
+                               'security': 'none'},
+                              {'name': 'west', 'endpoint': self.servers['west'].endpoint,
+                               'security': 'none'}]),
+                         self.run_sfctl(['cluster', 'profile', 'list']))
+        self.assertIsNone(sf_config.client_endpoint())
+
+        self.assertEqual(0, self.run_sfctl(['cluster', 'profile', 'remove', '--name', 'east'])[0])
+        self.assertEqual(1, self.run_sfctl(['cluster', 'profile', 'remove', '--name', 'east'])[0])
+        self.assertEqual(['west'], sf_config.profile_names())
+        self.assertEqual(1, self.run_sfctl(['cluster', 'profile', 'add', '--name', 'a,b',
+                                            '--endpoint', self.servers['east'].endpoint])[0])
+
+        # Parsed again from the file
+        sf_config.clear_snapshots()
+        self.assertEqual(['west'], sf_config.profile_names())
+        with sf_config.using_profile('west'):
+            self.assertEqual(self.servers['west'].endpoint, sf_config.client_endpoint())
+
+    def test_fanout(self):
+        """The command runs on all clusters at once, with the results tagged by cluster"""
+        self.add_profiles('east', 'west')
+
+        start = time.time()
+        exit_code, output = self.run_sfctl(['node', 'list', '--all-clusters', '--query',
+                                            '[].{cluster: cluster, nodes: result.items[].name}'])
+        elapsed = time.time() - start
+
+        self.assertEqual(0, exit_code)
+        self.assertEqual([{'cluster': 'east', 'nodes': ['east']},
+                          {'cluster': 'west', 'nodes': ['west']}], output)
+        # As long as the slowest cluster, rather than the sum of both
+        self.assertLess(elapsed, LATENCY * 2)
+
+    def test_fanout_all_pages(self):
+        """The items of all pages are returned as the result of each cluster"""
+        self.add_profiles('east', 'west')
+
+        out_file = StringIO()
+        with patch('sys.stdout', new=out_file):
+            exit_code, output = self.run_sfctl(['node', 'list', '--all', '--all-clusters',
+                                                '--query',
+                                                '[].{cluster: cluster, nodes: result[].name}'])
+
+        self.assertEqual(0, exit_code)
+        self.assertEqual([{'cluster': 'east', 'nodes': ['east']},
+                          {'cluster': 'west', 'nodes': ['west']}], output)
+        self.assertEqual('', out_file.getvalue())
+
+    def test_fanout_failures(self):
+        """A failure on one cluster is reported in its result, and fails the command"""
+        self.add_profiles('east')
+        with sf_config.using_profile('down'):
+            sf_config.set_cluster_endpoint(self.servers['down'].endpoint)
+            sf_config.set_auth()
+
+        exit_code, output = self.run_sfctl(['node', 'list', '--clusters', 'down,east'])
+
+        self.assertEqual(1, exit_code)
+        self.assertEqual(['down', 'east'], [outcome['cluster'] for outcome in output])
+        self.assertIn('Unavailable', output[0]['error'])
+        self.assertEqual('east', output[1]['result']['items'][0]['name'])
+
+        # The query applies to the merged results
+        self.assertEqual((1, ['east']),
+                         self.run_sfctl(['node', 'list', '--clusters', 'down,east', '--query',
+                                         '[].result.items[].name']))
+
+        self.assertEqual((1, None), self.run_sfctl(['cluster', 'select', '--clusters', 'east']))
+        self.assertEqual((1, None), self.run_sfctl(['cluster', 'profile', 'list',
+                                                    '--all-clusters']))
+        self.assertEqual((1, None), self.run_sfctl(['node', 'list', '--clusters', 'missing']))
@@ -0,0 +1,103 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for the cluster version check deferred to a background process"""
+
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from mock import MagicMock, patch
+import sfctl.custom_cluster as sf_cluster
+from sfctl.custom_cluster import start_cluster_version_check
+import sfctl.state as sfctl_state
+from sfctl import cluster_version_background
+
+ENDPOINT = 'https://cluster:19080'
+
+
+class DeferredClusterVersionTests(unittest.TestCase):
+    """Deferred cluster version check tests"""
+
+    def setUp(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(state_dir))
+
+        self.start_check = MagicMock()
+        for target, value in (('sfctl.state.SF_CLI_STATE_DIR', state_dir),
+                              ('sfctl.config._SNAPSHOTS', {}),
+                              ('sfctl.custom_cluster.client_endpoint', lambda: ENDPOINT),
+                              ('sfctl.cluster_version_background.client_endpoint',
+                               lambda: ENDPOINT),
+                              ('sfctl.custom_cluster.get_sfctl_version', lambda: '11.2.1'),
+                              ('sfctl.custom_cluster.start_cluster_version_check',
+                               self.start_check)):
+            state_patch = patch(target, new=value)
+            state_patch.start()
+            self.addCleanup(state_patch.stop)
+
+    def test_check_started_once(self):
+        """A check is started for a new cluster, and not again by commands retried in a
+        loop until SF_CLI_VERSION_RECHECK_INTERVAL has passed"""
+        self.assertTrue(sf_cluster.check_cluster_version_deferred(True))
+        self.start_check.assert_called_once_with(ENDPOINT)
+
+        for _ in range(20):
+            self.assertTrue(sf_cluster.check_cluster_version_deferred(True))
+            self.assertTrue(sf_cluster.check_cluster_version_deferred(False))
+        self.assertEqual(1, self.start_check.call_count)
+
+        checked = datetime.utcnow() - timedelta(minutes=11)
+        sfctl_state.set_cluster_version_check(ENDPOINT, None, checked)
+        sf_cluster.check_cluster_version_deferred(False)
+        self.assertEqual(1, self.start_check.call_count)
+        sf_cluster.check_cluster_version_deferred(True)
+        self.assertEqual(2, self.start_check.call_count)
+
+        checked = datetime.utcnow() - timedelta(hours=25)
+        sfctl_state.set_cluster_version_check(ENDPOINT, None, checked)
+        sf_cluster.check_cluster_version_deferred(False)
+        self.assertEqual(3, self.start_check.call_count)
+
+    def test_mismatch_reported_from_state(self):
+        """A mismatch found by the background check is reported by the next command, and
+        again by failed commands"""
+        with patch('sfctl.custom_cluster.get_cluster_auth',
+                   return_value={'pem': None, 'cert': None, 'key': None, 'ca': None,
+                                 'no_verify': False}), \
+                patch('azure.servicefabric.ServiceFabricClientAPIs') as client_class, \
+                self.assertWarns(UserWarning):
+            client_class.return_value.get_cluster_version.return_value.version = '7.0.0'
+            cluster_version_background.main(ENDPOINT)
+        self.assertEqual('7.0.0', sfctl_state.get_cluster_version_check(ENDPOINT)['version'])
+
+        with self.assertWarns(UserWarning):
+            self.assertFalse(sf_cluster.check_cluster_version_deferred(False))
+        with patch('warnings.warn') as warn:
+            self.assertFalse(sf_cluster.check_cluster_version_deferred(False))
+            warn.assert_not_called()
+        with self.assertWarns(UserWarning):
+            self.assertFalse(sf_cluster.check_cluster_version_deferred(True))
+        self.start_check.assert_not_called()
+
+    def test_background_check_skipped_for_other_cluster(self):
+        """The background check does nothing if another cluster was selected meanwhile"""
+        with patch('sfctl.cluster_version_background.client_endpoint',
+                   new=lambda: 'https://other:19080'), \
+                patch('sfctl.cluster_version_background.check_cluster_version') as check:
+            cluster_version_background.main(ENDPOINT)
+        check.assert_not_called()
+
+    def test_start_detached(self):
+        """The check runs in a new session, after the settings are written"""
+        with patch('subprocess.Popen') as popen, \
+                patch('sfctl.config.flush_snapshots') as flush:
+            popen.side_effect = lambda *_, **__: flush.assert_called_once_with()
+            start_cluster_version_check(ENDPOINT)
+
+        args, kwargs = popen.call_args
+        self.assertEqual(['-m', 'sfctl.cluster_version_background', ENDPOINT], args[0][1:])
+        self.assertTrue(kwargs['start_new_session'])
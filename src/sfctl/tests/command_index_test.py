@@ -0,0 +1,93 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for the command index and lazy command table loading"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from mock import patch
+import sfctl.command_index as sf_index
+from sfctl.entry import cli
+from sfctl.commands import SFCommandLoader
+
+
+class CommandIndexTests(unittest.TestCase):
+    """Command index tests"""
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.config_dir))
+
+        config_dir_patch = patch('sfctl.command_index.SF_CLI_CONFIG_DIR', new=self.config_dir)
+        config_dir_patch.start()
+        self.addCleanup(config_dir_patch.stop)
+
+        sf_index._LOADED_INDEX.clear()  # pylint: disable=protected-access
+        self.addCleanup(sf_index._LOADED_INDEX.clear)  # pylint: disable=protected-access
+
+    @staticmethod
+    def _load(args):
+        """Load the command table for the given args with a new loader"""
+        loader = SFCommandLoader(cli_ctx=cli())
+        return loader.load_command_table(args)
+
+    def test_full_load_writes_index(self):
+        """Loading without an index loads all commands and writes the index"""
+        command_table = self._load(['node', 'list'])
+
+        self.assertIn('application upload', command_table)
+        self.assertIn('settings telemetry set-telemetry', command_table)
+
+        with open(sf_index.get_command_index_path(), 'r') as index_file:
+            index = json.load(index_file)
+
+        self.assertEqual(index['key'], sf_index.get_index_key())
+        self.assertEqual(sorted(index['commands']), sorted(command_table))
+        self.assertEqual(index['commands']['node info'],
+                         ['azure.servicefabric#ServiceFabricClientAPIs.get_node_info', True])
+        self.assertEqual(index['commands']['cluster select'],
+                         ['sfctl.custom_cluster#select', False])
+
+    def test_indexed_load_registers_invoked_group(self):
+        """With an index, only the commands of the invoked group are registered"""
+        full_table = self._load(['cluster', 'show-connection'])
+        sf_index._LOADED_INDEX.clear()  # pylint: disable=protected-access
+
+        command_table = self._load(['chaos', 'schedule', 'get'])
+
+        expected = [name for name in full_table if name.split()[0] == 'chaos']
+        self.assertEqual(sorted(command_table), sorted(expected))
+        self.assertIn('chaos schedule set', command_table)
+
+    def test_unknown_group_loads_all_commands(self):
+        """An unknown group loads the full table so errors list all valid groups"""
+        full_table = self._load(['node', 'list'])
+        command_table = self._load(['nodee', 'list'])
+
+        self.assertEqual(sorted(command_table), sorted(full_table))
+
+    def test_stale_index_ignored(self):
+        """An index written for a different key is not used"""
+        if not os.path.isdir(self.config_dir):
+            os.makedirs(self.config_dir)
+        with open(sf_index.get_command_index_path(), 'w') as index_file:
+            json.dump({'key': 'stale', 'commands': {'node list': ['a#b', True]}}, index_file)
+
+        self.assertIsNone(sf_index.load_command_index())
+
+    def test_help_only_loaded_for_help(self):
+        """Help modules are imported only when help is requested"""
+        self._load(['node', 'list'])
+
+        with patch('sfctl.commands.load_help_files') as load_help_mock:
+            self._load(['node', 'list'])
+            self.assertFalse(load_help_mock.called)
+
+            self._load(['node', 'list', '-h'])
+            self.assertTrue(load_help_mock.called)
@@ -0,0 +1,120 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for the snapshots of the sfctl configuration files"""
+
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+from configparser import ConfigParser
+from mock import MagicMock, patch
+from knack.config import CLIConfig
+import sfctl.config as sf_config
+
+
+class ConfigSnapshotTests(unittest.TestCase):
+    """Config snapshot tests"""
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.config_dir))
+        self.config_path = os.path.join(self.config_dir, 'config')
+        with open(self.config_path, 'w') as config_file:
+            config_file.write('[servicefabric]\nendpoint = http://first:19080\n'
+                              'security = none\nno_verify = false\n')
+
+        self.create_cli_config = MagicMock(wraps=CLIConfig)
+        for target, value in (('SF_CLI_CONFIG_DIR', self.config_dir),
+                              ('CLIConfig', self.create_cli_config),
+                              ('_SNAPSHOTS', {})):
+            config_patch = patch('sfctl.config.' + target, new=value)
+            config_patch.start()
+            self.addCleanup(config_patch.stop)
+
+    def read_file(self):
+        """The settings in the configuration file"""
+        parser = ConfigParser()
+        parser.read(self.config_path)
+        return dict(parser.items('servicefabric'))
+
+    def test_parsed_once(self):
+        """All getters read the file parsed on first use"""
+        for _ in range(3):
+            self.assertEqual('http://first:19080', sf_config.client_endpoint())
+            self.assertEqual('none', sf_config.security_type())
+            self.assertFalse(sf_config.no_verify_setting())
+            self.assertIsNone(sf_config.ca_cert_info())
+            self.assertIsNone(sf_config.cert_info())
+
+        self.assertEqual(1, self.create_cli_config.call_count)
+
+    def test_changed_file_parsed_again(self):
+        """A file changed by another process is parsed again on next use"""
+        self.assertEqual('http://first:19080', sf_config.client_endpoint())
+
+        with open(self.config_path, 'w') as config_file:
+            config_file.write('[servicefabric]\nendpoint = http://other-cluster:19080\n')
+
+        for _ in range(3):
+            self.assertEqual('http://other-cluster:19080', sf_config.client_endpoint())
+        self.assertEqual(2, self.create_cli_config.call_count)
+
+    def test_set_values_written_together(self):
+        """Settings set are read back at once, and written with the settings of other
+        processes by the next flush"""
+        sf_config.set_cluster_endpoint('http://second:19080')
+        sf_config.set_no_verify(True)
+        sf_config.set_auth(pem='/certs/cluster.pem')
+
+        self.assertEqual('http://second:19080', sf_config.client_endpoint())
+        self.assertTrue(sf_config.no_verify_setting())
+        self.assertEqual('/certs/cluster.pem', sf_config.cert_info())
+        self.assertEqual('http://first:19080', self.read_file()['endpoint'])
+
+        # Another process writes a setting in the meantime
+        other_config = ConfigParser()
+        other_config.read(self.config_path)
+        other_config.set('servicefabric', 'use_telemetry', 'false')
+        with open(self.config_path, 'w') as config_file:
+            other_config.write(config_file)
+
+        sf_config.flush_snapshots()
+
+        settings = self.read_file()
+        self.assertEqual('http://second:19080', settings['endpoint'])
+        self.assertEqual('true', settings['no_verify'])
+        self.assertEqual('pem', settings['security'])
+        self.assertEqual('/certs/cluster.pem', settings['pem_path'])
+        self.assertEqual('false', settings['use_telemetry'])
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(self.config_path).st_mode))
+        self.assertEqual(['config'], os.listdir(self.config_dir))
+
+        # The file is parsed again once after the flush, and only written if settings change
+        self.assertFalse(sf_config.get_telemetry_config())
+        self.assertEqual(2, self.create_cli_config.call_count)
+        mtime = os.stat(self.config_path).st_mtime_ns
+        sf_config.flush_snapshots()
+        self.assertEqual(mtime, os.stat(self.config_path).st_mtime_ns)
+
+    def test_environment_overrides_set_value(self):
+        """Environment variables take precedence over settings set by the process"""
+        sf_config.set_cluster_endpoint('http://second:19080')
+
+        with patch.dict(os.environ, {'SFCTL_SERVICEFABRIC_ENDPOINT': 'http://env:19080'}):
+            self.assertEqual('http://env:19080', sf_config.client_endpoint())
+        self.assertEqual('http://second:19080', sf_config.client_endpoint())
+
+    def test_clear_snapshots(self):
+        """Clearing writes the settings set, and parses the file again on next use"""
+        sf_config.set_cluster_endpoint('http://second:19080')
+        sf_config.clear_snapshots()
+        self.assertEqual('http://second:19080', self.read_file()['endpoint'])
+
+        with open(self.config_path, 'w') as config_file:
+            config_file.write('[servicefabric]\nendpoint = http://third:19080\n')
+        self.assertEqual('http://third:19080', sf_config.client_endpoint())
@@ -0,0 +1,184 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for the sfctl daemon and the client which forwards commands to it"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from io import StringIO
+from mock import patch
+from sfctl import daemon
+
+
+@unittest.skipUnless(daemon.is_daemon_supported(), 'Unix domain sockets are not supported')
+class DaemonTests(unittest.TestCase):
+    """Daemon tests"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.temp_dir))
+        self.socket_path = os.path.join(self.temp_dir, daemon.DAEMON_SOCKET_FILE_NAME)
+
+    def start_server(self, idle_timeout=30):
+        """Run a daemon server on a background thread"""
+        server = daemon.create_server(self.socket_path, idle_timeout)
+        thread = threading.Thread(target=server.serve_until_stopped)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join, 10)
+        self.addCleanup(self.stop_server)
+        return thread
+
+    def stop_server(self):
+        """Stop the daemon server, if it is still running"""
+        sock = daemon.connect(self.socket_path)
+        if sock is not None:
+            list(daemon.send_request(sock, {'control': 'stop'}))
+            sock.close()
+
+    def forward(self, args):
+        """Forward a command to the test server, and return the exit code and output"""
+        with patch('sys.stdout', new=StringIO()) as stdout, \
+                patch('sys.stderr', new=StringIO()) as stderr:
+            exit_code = daemon.forward_command(args, socket_path=self.socket_path)
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def test_should_forward(self):
+        """Daemon management and interactive commands are run locally"""
+        self.assertTrue(daemon.should_forward(['node', 'list']))
+        self.assertTrue(daemon.should_forward([]))
+        self.assertFalse(daemon.should_forward(['daemon', 'stop']))
+        self.assertFalse(daemon.should_forward(['application', 'upload', '--path', 'a']))
+        self.assertFalse(daemon.should_forward(['compose', 'create', '--has-pass']))
+
+    def test_no_daemon_not_forwarded(self):
+        """Without a running daemon, commands are not forwarded"""
+        self.assertEqual((None, '', ''), self.forward(['node', 'list']))
+
+    @patch('sfctl.entry.check_cluster_version_deferred')
+    @patch('sfctl.custom_cluster.client_endpoint', return_value='http://daemon-test:19080')
+    def test_forward_command_output(self, _, __):
+        """Output and exit codes of commands run on the daemon are returned to the client"""
+        self.start_server()
+
+        exit_code, stdout, _ = self.forward(['cluster', 'show-connection'])
+        self.assertEqual(0, exit_code)
+        self.assertIn('http://daemon-test:19080', stdout)
+
+        exit_code, stdout, stderr = self.forward(['cluster', 'not-a-command'])
+        self.assertEqual(2, exit_code)
+        self.assertEqual('', stdout)
+        self.assertIn('not-a-command', stderr)
+
+    def test_forward_uses_client_cwd(self):
+        """Commands run from the working directory of the client"""
+        self.start_server()
+        cwd = os.getcwd()
+
+        def record_cwd(_, **__):
+            print(os.getcwd())
+            return 0
+
+        with patch('sfctl.entry.run_command', side_effect=record_cwd):
+            os.chdir(self.temp_dir)
+            try:
+                _, stdout, _ = self.forward(['node', 'list'])
+            finally:
+                os.chdir(cwd)
+
+        self.assertEqual(os.path.realpath(self.temp_dir), os.path.realpath(stdout.strip()))
+        self.assertEqual(cwd, os.getcwd())
+
+    def test_forward_uses_client_environment(self):
+        """Commands run with the sfctl environment variables of the client only"""
+        self.start_server()
+
+        def record_environment(_, **__):
+            print(json.dumps(sorted((name, value) for name, value in os.environ.items()
+                                    if name.startswith('SFCTL_'))))
+            return 0
+
+        daemon_environment = {'SFCTL_SERVICEFABRIC_ENDPOINT': 'http://daemon:19080',
+                              'SFCTL_SERVICEFABRIC_NO_VERIFY': 'true'}
+        client_environment = {'SFCTL_SERVICEFABRIC_ENDPOINT': 'http://client:19080',
+                              'PATH': '/client'}
+
+        with patch('sfctl.entry.run_command', side_effect=record_environment), \
+                patch.dict(os.environ, daemon_environment):
+            sock = daemon.connect(self.socket_path)
+            try:
+                frames = list(daemon.send_request(sock, {'args': ['node', 'list'],
+                                                         'env': client_environment}))
+            finally:
+                sock.close()
+
+            self.assertEqual(daemon_environment['SFCTL_SERVICEFABRIC_NO_VERIFY'],
+                             os.environ['SFCTL_SERVICEFABRIC_NO_VERIFY'])
+            self.assertEqual(daemon_environment['SFCTL_SERVICEFABRIC_ENDPOINT'],
+                             os.environ['SFCTL_SERVICEFABRIC_ENDPOINT'])
+            self.assertNotEqual('/client', os.environ.get('PATH'))
+
+        self.assertEqual([['SFCTL_SERVICEFABRIC_ENDPOINT', 'http://client:19080']],
+                         json.loads(frames[0]['data']))
+        self.assertEqual({'exit_code': 0}, frames[-1])
+
+    def test_busy_daemon_not_forwarded(self):
+        """Commands are not forwarded while the daemon runs another command"""
+        self.start_server()
+        running = threading.Event()
+        release = threading.Event()
+
+        def wait_for_release(_, **__):
+            running.set()
+            release.wait(10)
+            return 0
+
+        with patch('sfctl.entry.run_command', side_effect=wait_for_release):
+            first = threading.Thread(target=daemon.forward_command, args=(['node', 'list'],),
+                                     kwargs={'socket_path': self.socket_path})
+            first.start()
+            self.addCleanup(first.join, 10)
+            self.addCleanup(release.set)
+            self.assertTrue(running.wait(10))
+
+            self.assertEqual((None, '', ''), self.forward(['node', 'list']))
+
+    def test_stop_removes_socket(self):
+        """Stopping the daemon closes and removes the socket"""
+        thread = self.start_server()
+        self.assertTrue(os.path.exists(self.socket_path))
+
+        self.stop_server()
+        thread.join(10)
+
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertIsNone(daemon.connect(self.socket_path))
+
+    def test_idle_timeout_stops_server(self):
+        """The daemon stops itself when idle for longer than the idle timeout"""
+        thread = self.start_server(idle_timeout=0.1)
+        thread.join(10)
+
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_stale_socket_replaced(self):
+        """A socket left behind by a daemon which is no longer running is replaced"""
+        with open(self.socket_path, 'w'):
+            pass
+
+        self.start_server()
+        sock = daemon.connect(self.socket_path)
+        self.assertIsNotNone(sock)
+        status = list(daemon.send_request(sock, {'control': 'status'}))[-1]['status']
+        sock.close()
+
+        self.assertEqual(os.getpid(), status['pid'])
@@ -277,9 +277,10 @@ class HelpTextTests(unittest.TestCase):
 
         self.validate_output(
             'sfctl',
-            subgroups=('application', 'chaos', 'cluster', 'compose', 'is', 'node',
+            subgroups=('application', 'chaos', 'cluster', 'compose', 'daemon', 'is', 'node',
                        'partition', 'property', 'replica', 'rpm', 'sa-cluster',
-                       'service', 'settings', 'store'))
+                       'service', 'settings', 'store'),
+            commands=('batch',))
 
         self.validate_output(
             'sfctl chaos schedule',
@@ -302,15 +303,24 @@ class HelpTextTests(unittest.TestCase):
 
         self.validate_output(
             'sfctl cluster',
+            subgroups=('profile',),
             commands=('code-versions', 'config-versions', 'health', 'manifest',
                       'operation-cancel', 'operation-list', 'provision', 'recover-system',
-                      'report-health', 'select', 'unprovision', 'upgrade', 'upgrade-resume',
-                      'upgrade-rollback', 'upgrade-status', 'upgrade-update'))
+                      'report-health', 'select', 'snapshot', 'unprovision', 'upgrade',
+                      'upgrade-resume', 'upgrade-rollback', 'upgrade-status', 'upgrade-update'))
+
+        self.validate_output(
+            'sfctl cluster profile',
+            commands=('add', 'list', 'remove'))
 
         self.validate_output(
             'sfctl container',
             commands=('invoke-api', 'logs'))
 
+        self.validate_output(
+            'sfctl daemon',
+            commands=('start', 'status', 'stop'))
+
         self.validate_output(
             'sfctl compose',
             commands=('create', 'list', 'remove', 'status', 'upgrade', 'upgrade-rollback',
@@ -6,8 +6,10 @@
 
 """A mock server for testing purposes."""
 
-from threading import Thread
+from threading import Thread, Lock
+from socketserver import ThreadingMixIn
 import socket
+import time
 try:
     from urllib import parse
 except ImportError:
@@ -16,11 +18,102 @@ from future.backports.http.server import (BaseHTTPRequestHandler, HTTPServer)
 import requests
 
 
+# Chunks received through image store upload sessions, keyed by session id, then by image
+# store path, then by the position of the first byte of the chunk
+UPLOAD_SESSIONS = {}
+# Files uploaded whole, or assembled from the chunks of committed upload sessions, keyed by
+# image store path
+COMMITTED_UPLOADS = {}
+UPLOAD_LOCK = Lock()
+
+
 class MockServer(BaseHTTPRequestHandler):
     """ Overrides the following methods in BaseHTTPRequestHandler """
 
     # pylint: disable=no-member
 
+    # Seconds to wait before responding to each image store upload
+    upload_latency = 0
+    # Bytes per second at which the body of each image store upload is read, to stand in
+    # for the throughput of a single connection to a remote cluster. 0 reads at full speed.
+    upload_bandwidth = 0
+    # Number of chunk uploads still to be failed with 503, to test retries
+    failing_chunk_uploads = 0
+
+    def end_headers(self):
+        # Most responses have no body. Saying so lets clients keep the connection open when
+        # protocol_version is set to HTTP/1.1.
+        if not any(header.lower().startswith(b'content-length:')
+                   for header in getattr(self, '_headers_buffer', [])):
+            self.send_header('Content-Length', '0')
+        BaseHTTPRequestHandler.end_headers(self)
+
+    def _query(self):
+        """The query parameters of the request, as a dict of lists"""
+        return parse.parse_qs(parse.urlparse(self.path).query)
+
+    def _read_upload(self):
+        """Read the body of an image store upload, at the configured bandwidth and latency"""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            # requests sends empty files, and files of unknown length, in chunks
+            blocks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                blocks.append(self.rfile.read(size))
+                self.rfile.readline()
+                if size == 0:
+                    break
+            time.sleep(MockServer.upload_latency)
+            return b''.join(blocks)
+
+        remaining = int(self.headers.get('Content-Length', 0))
+        blocks = []
+        start = time.time()
+
+        while remaining > 0:
+            block = self.rfile.read(min(remaining, 64 * 1024))
+            if not block:
+                break
+            blocks.append(block)
+            remaining -= len(block)
+            if MockServer.upload_bandwidth:
+                received = sum(len(received_block) for received_block in blocks)
+                time.sleep(max(0, start + received / MockServer.upload_bandwidth - time.time()))
+
+        time.sleep(MockServer.upload_latency)
+        return b''.join(blocks)
+
+    def _upload_chunk(self):
+        """Store a chunk uploaded as part of an image store upload session"""
+        body = self._read_upload()
+
+        with UPLOAD_LOCK:
+            if MockServer.failing_chunk_uploads > 0:
+                MockServer.failing_chunk_uploads -= 1
+                self.send_response(requests.codes.service_unavailable)
+                self.end_headers()
+                return
+
+            content_path = parse.unquote(parse.urlparse(self.path).path)
+            content_path = content_path[len('/ImageStore/'):-len('/$/UploadChunk')]
+            first = int(self.headers['Content-Range'].split()[1].split('-')[0])
+            session = UPLOAD_SESSIONS.setdefault(self._query()['session-id'][0], {})
+            session.setdefault(content_path, {})[first] = body
+
+        self.send_response(requests.codes.ok)
+        self.end_headers()
+
+    def _commit_upload_session(self):
+        """Assemble the files of an upload session from their chunks"""
+        with UPLOAD_LOCK:
+            session = UPLOAD_SESSIONS.pop(self._query()['session-id'][0], {})
+            for content_path, chunks in session.items():
+                COMMITTED_UPLOADS[content_path] = b''.join(
+                    chunks[first] for first in sorted(chunks))
+
+        self.send_response(requests.codes.ok)
+        self.end_headers()
+
     def do_GET(self):  # pylint: disable=C0103,missing-docstring
         self.send_response(requests.codes.ok)
         self.end_headers()
@@ -30,6 +123,10 @@ class MockServer(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_POST(self):  # pylint: disable=C0103,missing-docstring
+        if self.path.startswith('/ImageStore/$/CommitUploadSession?'):
+            self._commit_upload_session()
+            return
+
         # Certain requests expect a very specific response.
         # For those, return other status codes
         if (self.path.startswith('/$/RollbackUpgrade?') or
@@ -49,6 +146,16 @@ class MockServer(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_PUT(self):  # pylint: disable=C0103,missing-docstring
+        if self.path.startswith('/ImageStore/') and '/$/UploadChunk?' in self.path:
+            self._upload_chunk()
+            return
+
+        if self.path.startswith('/ImageStore/'):
+            body = self._read_upload()
+            with UPLOAD_LOCK:
+                content_path = parse.unquote(parse.urlparse(self.path).path)
+                COMMITTED_UPLOADS[content_path[len('/ImageStore/'):]] = body
+
         # Return 200 as the default response
 
         if self.path.startswith('/ImageStore/') and self.path.find('sample_nested_folders') != -1:
@@ -57,7 +164,6 @@ class MockServer(BaseHTTPRequestHandler):
             query = parse.parse_qs(parsed_url.query)  # This is a dict of lists
 
             counter = 0
-            import time
 
             while int(query['timeout'][0]) > 0 and counter < 3:
                 time.sleep(1)
@@ -67,6 +173,10 @@ class MockServer(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_DELETE(self):  # pylint: disable=C0103,missing-docstring
+        if self.path.startswith('/ImageStore/$/DeleteUploadSession?'):
+            with UPLOAD_LOCK:
+                UPLOAD_SESSIONS.pop(self._query()['session-id'][0], None)
+
         # Return 200 as the default response
         self.send_response(requests.codes.ok)
         self.end_headers()
@@ -83,9 +193,18 @@ def find_localhost_free_port():
     return sock.getsockname()[1]
 
 
-def start_mock_server(port):
-    """ Start a new mock server at localhost:port. """
-    mock_server = HTTPServer(('localhost', port), MockServer)
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """ An HTTP server which handles each request on a new thread """
+    daemon_threads = True
+    # Accept as many pending connections as a cluster gateway would, rather than 5
+    request_queue_size = 128
+
+
+def start_mock_server(port, threaded=False):
+    """ Start a new mock server at localhost:port. If threaded is set, requests are
+    handled concurrently, as they are by a real cluster. """
+    server_class = ThreadingHTTPServer if threaded else HTTPServer
+    mock_server = server_class(('localhost', port), MockServer)
     mock_server_thread = Thread(target=mock_server.serve_forever)
     mock_server_thread.setDaemon(True)  # Set automatic cleanup of this thread
     mock_server_thread.start()
@@ -0,0 +1,134 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for compressing application packages"""
+
+import os
+import unittest
+from mock import patch
+from sfctl.package_compression import compress_package, zip_folder, zip_folders
+
+
+class PackageCompressionTests(unittest.TestCase):
+    """Package compression tests"""
+
+    def test_compress_package(self):
+        """Code packages are zipped from the source folder with the same entries as
+        shutil.make_archive, and the other files are linked or copied"""
+        import shutil
+        import tempfile
+        import zipfile
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        app_dir = os.path.join(temp_dir, 'App')
+        code_dir = os.path.join(app_dir, 'SvcPkg', 'Code')
+        os.makedirs(os.path.join(code_dir, 'sub'))
+        files = {
+            'ApplicationManifest.xml':
+                '<ApplicationManifest><ServiceManifestImport>'
+                '<ServiceManifestRef ServiceManifestName="SvcPkg" ServiceManifestVersion="1.0"/>'
+                '</ServiceManifestImport></ApplicationManifest>',
+            'SvcPkg/ServiceManifest.xml':
+                '<ServiceManifest><CodePackage Name="Code" Version="1.0"/></ServiceManifest>',
+            'SvcPkg/Code/service.exe': 'exe',
+            'SvcPkg/Code/sub/lib.dll': 'dll'
+        }
+        for name, content in files.items():
+            with open(os.path.join(app_dir, name), 'w') as package_file:
+                package_file.write(content)
+
+        expected_names = sorted(zipfile.ZipFile(
+            shutil.make_archive(os.path.join(temp_dir, 'expected'), 'zip', code_dir)).namelist())
+
+        for link_files in (True, False):
+            output_dir = os.path.join(temp_dir, 'linked' if link_files else 'copied')
+            compress_package(app_dir, output_dir, link_files=link_files)
+
+            compressed = os.path.join(output_dir, 'App')
+            self.assertFalse(os.path.exists(os.path.join(compressed, 'SvcPkg', 'Code')))
+            with zipfile.ZipFile(os.path.join(compressed, 'SvcPkg', 'Code.zip')) as code_zip:
+                self.assertEqual(expected_names, sorted(code_zip.namelist()))
+                self.assertEqual(b'dll', code_zip.read('sub/lib.dll'))
+            self.assertEqual(link_files, os.path.samefile(
+                os.path.join(app_dir, 'ApplicationManifest.xml'),
+                os.path.join(compressed, 'ApplicationManifest.xml')))
+
+    def test_compression_cache(self):
+        """Zip files of unchanged folders are reused from the cache, and the least recently
+        used ones are evicted"""
+        import shutil
+        import tempfile
+        from sfctl.compression_cache import CompressionCache, get_compression_cache_dir
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        app_dir = os.path.join(temp_dir, 'App')
+        output_dir = os.path.join(temp_dir, 'output')
+        files = {
+            'ApplicationManifest.xml':
+                '<ApplicationManifest><ServiceManifestImport>'
+                '<ServiceManifestRef ServiceManifestName="SvcPkg" ServiceManifestVersion="1.0"/>'
+                '</ServiceManifestImport></ApplicationManifest>',
+            'SvcPkg/ServiceManifest.xml':
+                '<ServiceManifest><CodePackage Name="Code" Version="1.0"/>'
+                '<ConfigPackage Name="Config" Version="1.0"/></ServiceManifest>',
+            'SvcPkg/Code/service.exe': 'exe',
+            'SvcPkg/Config/Settings.xml': '<Settings/>'
+        }
+        for name, content in files.items():
+            if not os.path.isdir(os.path.dirname(os.path.join(app_dir, name))):
+                os.makedirs(os.path.dirname(os.path.join(app_dir, name)))
+            with open(os.path.join(app_dir, name), 'w') as package_file:
+                package_file.write(content)
+
+        def compress(max_size=1024 * 1024):
+            """Compress the package, and return the names of the folders zipped"""
+            shutil.rmtree(os.path.join(output_dir, 'App'), ignore_errors=True)
+            cache = CompressionCache(get_compression_cache_dir(output_dir), max_size,
+                                     link_files=True)
+            with patch('sfctl.package_compression.zip_folder', side_effect=zip_folder) as zip_mock:
+                compress_package(app_dir, output_dir, link_files=True, jobs=1, cache=cache)
+            return sorted(os.path.basename(call[0][0]) for call in zip_mock.call_args_list)
+
+        self.assertEqual(['Code', 'Config'], compress())
+        self.assertEqual([], compress())
+        self.assertTrue(os.path.isfile(os.path.join(output_dir, 'App', 'SvcPkg', 'Code.zip')))
+
+        with open(os.path.join(app_dir, 'SvcPkg', 'Config', 'Settings.xml'), 'w') as settings:
+            settings.write('<Settings><Section/></Settings>')
+        self.assertEqual(['Config'], compress())
+
+        # A cache smaller than one zip file keeps none
+        self.assertEqual([], compress(max_size=0))
+        self.assertEqual([], os.listdir(get_compression_cache_dir(output_dir)))
+        self.assertEqual(['Code', 'Config'], compress())
+
+    def test_zip_folders(self):
+        """Folders are zipped on a pool of processes, and level 0 stores files uncompressed"""
+        import shutil
+        import tempfile
+        import zipfile
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        pairs = []
+        for index in range(3):
+            folder = os.path.join(temp_dir, 'Code{0}'.format(index))
+            os.makedirs(folder)
+            with open(os.path.join(folder, 'service.exe'), 'wb') as code_file:
+                code_file.write(b'x' * 10000 * (index + 1))
+            pairs.append((folder, folder + '.zip'))
+
+        for compression_level, compress_type in ((0, zipfile.ZIP_STORED),
+                                                 (9, zipfile.ZIP_DEFLATED)):
+            zip_folders(pairs, compression_level, jobs=2)
+
+            for index, (_, zip_path) in enumerate(pairs):
+                with zipfile.ZipFile(zip_path) as code_zip:
+                    info = code_zip.getinfo('service.exe')
+                    self.assertEqual(compress_type, info.compress_type)
+                    self.assertEqual(b'x' * 10000 * (index + 1), code_zip.read('service.exe'))
@@ -0,0 +1,137 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for list commands which follow continuation tokens"""
+
+import json
+import time
+import unittest
+from io import StringIO
+from mock import MagicMock, patch
+from azure.servicefabric.models import PagedNodeInfoList, NodeInfo
+from sfctl.entry import run_command
+import sfctl.custom_paging as sf_paging
+
+
+def node_pages():
+    """Three pages of nodes, linked by continuation tokens"""
+    return {
+        None: PagedNodeInfoList(continuation_token='page2',
+                                items=[NodeInfo(name='node1'), NodeInfo(name='node2')]),
+        'page2': PagedNodeInfoList(continuation_token='page3', items=[]),
+        'page3': PagedNodeInfoList(continuation_token='', items=[NodeInfo(name='node3')])
+    }
+
+
+class PagingTests(unittest.TestCase):
+    """Paging tests"""
+
+    def setUp(self):
+        pages = node_pages()
+        self.client = MagicMock()
+        self.client.get_node_info_list.side_effect = \
+            lambda continuation_token=None, **_: pages[continuation_token]
+
+    def requested_tokens(self):
+        """The continuation tokens of each page requested from the client"""
+        return [call[1]['continuation_token']
+                for call in self.client.get_node_info_list.call_args_list]
+
+    def test_iter_pages_follows_tokens(self):
+        """All pages are returned, ending at the first page without a continuation token"""
+        pages = list(sf_paging.iter_pages(
+            lambda token: self.client.get_node_info_list(continuation_token=token)))
+
+        self.assertEqual(3, len(pages))
+        self.assertEqual([None, 'page2', 'page3'], self.requested_tokens())
+
+    def test_single_page_without_all(self):
+        """Without --all, the requested page is returned unchanged"""
+        result = sf_paging.list_nodes(self.client, continuation_token='page2', max_results=5)
+
+        self.assertEqual('page3', result.continuation_token)
+        self.assertEqual(['page2'], self.requested_tokens())
+        self.assertEqual(5, self.client.get_node_info_list.call_args[1]['max_results'])
+
+    def test_all_pages_streamed_as_json_lines(self):
+        """With --all, every item is written as one line of JSON, and nothing is returned"""
+        with patch('sys.stdout', new=StringIO()) as stdout:
+            result = sf_paging.list_nodes(self.client, all_pages=True)
+
+        self.assertIsNone(result)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(['node1', 'node2', 'node3'],
+                         [json.loads(line)['name'] for line in lines])
+
+    def test_all_pages_collected(self):
+        """Within collecting_pages, the items of all pages are returned rather than written"""
+        with patch('sys.stdout', new=StringIO()) as stdout:
+            with sf_paging.collecting_pages():
+                result = sf_paging.list_nodes(self.client, all_pages=True)
+            self.assertIsNone(sf_paging.list_nodes(self.client, all_pages=True))
+
+        self.assertEqual(['node1', 'node2', 'node3'], [item.name for item in result])
+        self.assertEqual(3, len(stdout.getvalue().splitlines()))
+
+    def test_all_argument(self):
+        """The --all argument is accepted by the list commands"""
+        # A function rather than a mock, since command groups deep copy the client factory
+        with patch('sfctl.commands.client_create', new=lambda _: self.client), \
+                patch('sfctl.entry.check_cluster_version_deferred'), \
+                patch('sys.stdout', new=StringIO()) as stdout:
+            exit_code = run_command(['node', 'list', '--all'])
+
+        self.assertEqual(0, exit_code)
+        self.assertEqual([None, 'page2', 'page3'], self.requested_tokens())
+        self.assertEqual(3, len(stdout.getvalue().splitlines()))
+
+    def test_all_pages_written_to_out_file(self):
+        """With --all, the items are written to the output file of the invocation"""
+        out_file = StringIO()
+        with patch('sfctl.commands.client_create', new=lambda _: self.client), \
+                patch('sfctl.entry.check_cluster_version_deferred'), \
+                patch('sys.stdout', new=StringIO()) as stdout:
+            exit_code = run_command(['node', 'list', '--all'], out_file=out_file)
+
+        self.assertEqual(0, exit_code)
+        self.assertEqual(3, len(out_file.getvalue().splitlines()))
+        self.assertEqual('', stdout.getvalue())
+
+    def test_prefetch_pages(self):
+        """Prefetched pages are returned in order, for any prefetch depth"""
+        get_page = lambda token: self.client.get_node_info_list(continuation_token=token)
+
+        for depth in (0, 1, 2, 5):
+            self.client.get_node_info_list.reset_mock()
+            pages = list(sf_paging.prefetch_pages(get_page, depth=depth))
+
+            self.assertEqual(['page2', 'page3', ''],
+                             [page.continuation_token for page in pages])
+            self.assertEqual([None, 'page2', 'page3'], self.requested_tokens())
+
+    def test_prefetch_depth_bounded(self):
+        """No more than depth pages are fetched ahead of the page being consumed"""
+        pages = sf_paging.prefetch_pages(
+            lambda token: self.client.get_node_info_list(continuation_token=token), depth=1)
+
+        next(pages)
+        time.sleep(0.3)
+        # The page being consumed, and one more in the queue
+        self.assertEqual(2, self.client.get_node_info_list.call_count)
+        pages.close()
+
+    def test_prefetch_error_raised(self):
+        """Errors while fetching a page are raised when the consumer reaches that page"""
+
+        def get_page(token):
+            if token == 'page2':
+                raise ValueError('page2 failed')
+            return node_pages()[token]
+
+        pages = sf_paging.prefetch_pages(get_page)
+        self.assertEqual('page2', next(pages).continuation_token)
+        with self.assertRaises(ValueError):
+            next(pages)
@@ -68,6 +68,7 @@ class ServiceFabricRequestTests(ScenarioTest):
         set_mock_endpoint(self.old_endpoint)
 
     @patch('sfctl.config.CLIConfig', new=MOCK_CONFIG)
+    @patch.dict('sfctl.config._SNAPSHOTS', clear=True)
     def validate_command_succeeds(self, command):
         """
         Validate that the given command runs and returns with success
@@ -81,6 +82,7 @@ class ServiceFabricRequestTests(ScenarioTest):
                 'ERROR while running command "{0}". Error: "{1}"'.format(command, str(exception)))
 
     @patch('sfctl.config.CLIConfig', new=MOCK_CONFIG)
+    @patch.dict('sfctl.config._SNAPSHOTS', clear=True)
     def validate_command(self, command, method, url_path, query, body=None,  # pylint: disable=too-many-locals, too-many-arguments
                          body_verifier=None, command_as_func=False, command_args=None):
         """
@@ -0,0 +1,132 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for the response cache of query commands"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock, patch
+from azure.servicefabric.models import (PagedApplicationTypeInfoList, ApplicationTypeInfo,
+                                        ClusterManifest)
+import sfctl.response_cache as sf_cache
+import sfctl.custom_cache as sf_custom_cache
+from sfctl.custom_paging import list_application_types
+
+
+class ResponseCacheTests(unittest.TestCase):
+    """Response cache tests"""
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(self.config_dir))
+
+        for target, value in (('SF_CLI_CONFIG_DIR', self.config_dir),
+                              ('client_endpoint', lambda: 'http://cache-test:19080'),
+                              ('response_cache_enabled', lambda: True)):
+            config_patch = patch('sfctl.response_cache.' + target, new=value)
+            config_patch.start()
+            self.addCleanup(config_patch.stop)
+
+        self.client = MagicMock()
+        self.client.get_cluster_manifest.return_value = ClusterManifest(manifest='<manifest/>')
+
+    @staticmethod
+    def manifest(response):
+        """The manifest of a cached response"""
+        return response['manifest']
+
+    def test_response_reused(self):
+        """A cached response is returned without a request, and timeout is not in the key"""
+        first = sf_custom_cache.cluster_manifest(self.client)
+        second = sf_custom_cache.cluster_manifest(self.client, timeout=5)
+
+        self.assertEqual('<manifest/>', self.manifest(first))
+        self.assertEqual(first, second)
+        self.assertEqual(1, self.client.get_cluster_manifest.call_count)
+
+    def test_parameters_in_key(self):
+        """Responses to the same operation with other parameters are cached separately"""
+        self.client.get_application_manifest.side_effect = \
+            lambda name, version, **_: ClusterManifest(manifest=name + version)
+
+        get_manifest = lambda version: self.manifest(
+            sf_custom_cache.application_manifest(self.client, 'app', version))
+
+        self.assertEqual('app1.0', get_manifest('1.0'))
+        self.assertEqual('app2.0', get_manifest('2.0'))
+        self.assertEqual('app1.0', get_manifest('1.0'))
+        self.assertEqual(2, self.client.get_application_manifest.call_count)
+
+    def test_no_cache_refreshes(self):
+        """--no-cache sends the request, and the fresh response replaces the cached one"""
+        sf_custom_cache.cluster_manifest(self.client)
+        self.client.get_cluster_manifest.return_value = ClusterManifest(manifest='<new/>')
+
+        self.assertEqual('<new/>',
+                         self.manifest(sf_custom_cache.cluster_manifest(self.client, no_cache=True)))
+        self.assertEqual('<new/>', self.manifest(sf_custom_cache.cluster_manifest(self.client)))
+        self.assertEqual(2, self.client.get_cluster_manifest.call_count)
+
+    def test_disabled(self):
+        """With the cache turned off, the SDK response is returned and nothing is written"""
+        with patch('sfctl.response_cache.response_cache_enabled', new=lambda: False):
+            result = sf_custom_cache.cluster_manifest(self.client)
+            sf_custom_cache.cluster_manifest(self.client)
+
+        self.assertIsInstance(result, ClusterManifest)
+        self.assertEqual(2, self.client.get_cluster_manifest.call_count)
+        self.assertFalse(os.path.exists(sf_cache.get_response_cache_dir()))
+
+    def test_expired_entry(self):
+        """Entries are not returned once their TTL has passed"""
+        key = sf_cache.get_cache_key('http://cache-test:19080', 'get_cluster_manifest', {})
+        sf_cache.write_entry(key, 'value', ttl=10, max_size=1024, now=1000)
+
+        self.assertEqual((True, 'value'), sf_cache.read_entry(key, now=1009))
+        self.assertEqual((False, None), sf_cache.read_entry(key, now=1010))
+        self.assertEqual([], os.listdir(sf_cache.get_response_cache_dir()))
+
+    def test_least_recently_used_evicted(self):
+        """Once the cache is larger than its maximum size, the least recently used go first"""
+        keys = ['key{0}'.format(i) for i in range(3)]
+        sf_cache.write_entry(keys[0], 'x' * 100, ttl=100, max_size=1024, now=1000)
+        sf_cache.write_entry(keys[1], 'x' * 100, ttl=100, max_size=1024, now=1001)
+        sf_cache.read_entry(keys[0], now=1002)
+
+        cache_dir = sf_cache.get_response_cache_dir()
+        entry_size = os.path.getsize(os.path.join(cache_dir, os.listdir(cache_dir)[0]))
+        sf_cache.write_entry(keys[2], 'x' * 100, ttl=100, max_size=2 * entry_size, now=1003)
+
+        self.assertTrue(sf_cache.read_entry(keys[0], now=1004)[0])
+        self.assertFalse(sf_cache.read_entry(keys[1], now=1004)[0])
+        self.assertTrue(sf_cache.read_entry(keys[2], now=1004)[0])
+
+    def test_application_type_list(self):
+        """Single pages of application types are cached, but streaming all pages is not"""
+        self.client.get_application_type_info_list.return_value = PagedApplicationTypeInfoList(
+            continuation_token='', items=[ApplicationTypeInfo(name='app')])
+
+        list_application_types(self.client)
+        result = list_application_types(self.client)
+        self.assertEqual(['app'], [item['name'] for item in result['items']])
+        self.assertEqual(1, self.client.get_application_type_info_list.call_count)
+
+        list_application_types(self.client, continuation_token='next')
+        self.assertEqual(2, self.client.get_application_type_info_list.call_count)
+
+        with patch('sys.stdout'):
+            list_application_types(self.client, all_pages=True)
+        self.assertEqual(3, self.client.get_application_type_info_list.call_count)
+
+    def test_clear(self):
+        """Clearing removes all entries"""
+        sf_custom_cache.cluster_manifest(self.client)
+        sf_cache.clear_response_cache()
+        sf_custom_cache.cluster_manifest(self.client)
+
+        self.assertEqual(2, self.client.get_cluster_manifest.call_count)
@@ -0,0 +1,163 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for the cluster snapshot command"""
+
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from io import StringIO
+from mock import MagicMock, patch
+from knack.util import CLIError
+from azure.servicefabric.models import (PagedNodeInfoList, NodeInfo, PagedApplicationInfoList,
+                                        ApplicationInfo, PagedServiceInfoList,
+                                        StatelessServiceInfo, PagedServicePartitionInfoList,
+                                        StatelessServicePartitionInfo,
+                                        SingletonPartitionInformation, PagedReplicaInfoList,
+                                        StatelessServiceInstanceInfo)
+import sfctl.custom_snapshot as sf_snapshot
+
+
+def fake_client(applications=3, services=2, partitions=2, replicas=3, latency=0):
+    """A client serving a cluster of the given shape. Applications are split over two pages."""
+
+    client = MagicMock()
+    client.get_node_info_list.return_value = PagedNodeInfoList(
+        continuation_token='', items=[NodeInfo(name='node1')])
+
+    app_items = [ApplicationInfo(id='app{0}'.format(i)) for i in range(applications)]
+    app_pages = {None: PagedApplicationInfoList(continuation_token='next',
+                                                items=app_items[:1]),
+                 'next': PagedApplicationInfoList(continuation_token='',
+                                                  items=app_items[1:])}
+    client.get_application_info_list.side_effect = \
+        lambda continuation_token=None, **_: app_pages[continuation_token]
+
+    def get_services(app_id, **_):
+        time.sleep(latency)
+        return PagedServiceInfoList(continuation_token='', items=[
+            StatelessServiceInfo(id='{0}~svc{1}'.format(app_id, i)) for i in range(services)])
+
+    def get_partitions(service_id, **_):
+        time.sleep(latency)
+        return PagedServicePartitionInfoList(continuation_token='', items=[
+            StatelessServicePartitionInfo(partition_information=SingletonPartitionInformation(
+                id='{0}~p{1}'.format(service_id, i))) for i in range(partitions)])
+
+    def get_replicas(partition_id, **_):
+        time.sleep(latency)
+        return PagedReplicaInfoList(continuation_token='', items=[
+            StatelessServiceInstanceInfo(instance_id='{0}~r{1}'.format(partition_id, i))
+            for i in range(replicas)])
+
+    client.get_service_info_list.side_effect = get_services
+    client.get_partition_info_list.side_effect = get_partitions
+    client.get_replica_info_list.side_effect = get_replicas
+    return client
+
+
+class SnapshotTests(unittest.TestCase):
+    """Cluster snapshot tests"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_snapshot_to_stdout(self):
+        """The whole hierarchy is written as one JSON document"""
+        with patch('sys.stdout', new=StringIO()) as stdout:
+            sf_snapshot.snapshot(fake_client())
+
+        document = json.loads(stdout.getvalue())
+        self.assertEqual(['node1'], [node['name'] for node in document['nodes']])
+
+        applications = sorted(document['applications'], key=lambda app: app['id'])
+        self.assertEqual(['app0', 'app1', 'app2'], [app['id'] for app in applications])
+        service = applications[1]['services'][1]
+        self.assertEqual('app1~svc1', service['id'])
+        partition = service['partitions'][0]
+        self.assertEqual('app1~svc1~p0', partition['partitionInformation']['id'])
+        self.assertEqual(['app1~svc1~p0~r0', 'app1~svc1~p0~r1', 'app1~svc1~p0~r2'],
+                         [replica['instanceId'] for replica in partition['replicas']])
+
+    def test_snapshot_gzip(self):
+        """Output files ending with .gz are compressed"""
+        output_file = os.path.join(self.temp_dir, 'snapshot.json.gz')
+        sf_snapshot.snapshot(fake_client(applications=0), output_file=output_file)
+
+        with gzip.open(output_file, 'rt') as snapshot_file:
+            document = json.load(snapshot_file)
+        self.assertEqual([], document['applications'])
+
+    def test_walker_forgets_completed_work(self):
+        """The walker keeps no futures once the applications have been yielded"""
+        walker = sf_snapshot.SnapshotWalker(fake_client(applications=4), 2, 2, 2)
+        try:
+            applications = list(walker.walk())
+        finally:
+            walker.close()
+
+        self.assertEqual(4, len(applications))
+        self.assertEqual(set(), walker.futures)
+
+    def test_snapshot_concurrency_limits(self):
+        """No more replica lists are requested at the same time than the replica concurrency"""
+        client = fake_client(applications=4, latency=0.02)
+        running = [0, 0]
+        lock = threading.Lock()
+        get_replicas = client.get_replica_info_list.side_effect
+
+        def counting_get_replicas(partition_id, **kwargs):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            try:
+                return get_replicas(partition_id, **kwargs)
+            finally:
+                with lock:
+                    running[0] -= 1
+
+        client.get_replica_info_list.side_effect = counting_get_replicas
+        output_file = os.path.join(self.temp_dir, 'snapshot.json')
+        sf_snapshot.snapshot(client, output_file=output_file, replica_concurrency=2)
+
+        self.assertLessEqual(running[1], 2)
+        self.assertEqual(4 * 2 * 2, client.get_replica_info_list.call_count)
+
+    def test_snapshot_error(self):
+        """Errors while listing any level are raised"""
+        client = fake_client()
+        client.get_partition_info_list.side_effect = ValueError('partition list failed')
+
+        with patch('sys.stdout', new=StringIO()):
+            with self.assertRaises(ValueError):
+                sf_snapshot.snapshot(client)
+
+        with self.assertRaises(CLIError):
+            sf_snapshot.snapshot(client, service_concurrency=0)
+
+    def test_snapshot_error_cancels_queued_work(self):
+        """Once listing fails, the work queued for the other entities is not started"""
+        client = fake_client(applications=1, services=1, partitions=20)
+
+        def failing_get_replicas(partition_id, **_):
+            time.sleep(0.01)
+            raise ValueError('replica list of {0} failed'.format(partition_id))
+
+        client.get_replica_info_list.side_effect = failing_get_replicas
+
+        with patch('sys.stdout', new=StringIO()):
+            with self.assertRaises(ValueError):
+                sf_snapshot.snapshot(client, replica_concurrency=1)
+
+        self.assertLess(client.get_replica_info_list.call_count, 20)
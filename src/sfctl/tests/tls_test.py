@@ -0,0 +1,163 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for the SSL contexts shared by connections, and TLS session resumption"""
+
+import os
+import ssl
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from mock import patch
+from msrest.universal_http.requests import RequestHTTPSenderConfiguration
+from sfctl import tls
+from sfctl.apiclient import pooled_session_callback
+from sfctl.auth import ClientCertAuthentication
+from sfctl.tests.helpers import write_self_signed_cert
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    """Answer every request with the common name of the client certificate, closing the
+    connection afterwards so that the next request opens a new one"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer with the client certificate subject"""
+        peer_cert = self.connection.getpeercert()
+        body = dict(item[0] for item in peer_cert['subject'])['commonName'].encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        pass
+
+
+class GatewayServer(ThreadingMixIn, HTTPServer):
+    """HTTPS server requiring a client certificate, which records for each connection
+    whether its TLS session was resumed"""
+    daemon_threads = True
+
+    def __init__(self, cert_path, key_path, client_ca, maximum_version):
+        HTTPServer.__init__(self, ('localhost', 0), GatewayHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.maximum_version = maximum_version
+        context.load_cert_chain(cert_path, key_path)
+        context.load_verify_locations(cafile=client_ca)
+        context.verify_mode = ssl.CERT_REQUIRED
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.resumed = []
+
+    def finish_request(self, request, client_address):
+        self.resumed.append(request.session_reused)
+        HTTPServer.finish_request(self, request, client_address)
+
+    @property
+    def endpoint(self):
+        """The HTTPS endpoint of the server"""
+        return 'https://localhost:{0}'.format(self.server_address[1])
+
+
+class TlsTests(unittest.TestCase):
+    """Shared SSL context tests"""
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(temp_dir))
+        for name in ('server', 'client'):
+            os.mkdir(os.path.join(temp_dir, name))
+        self.server_cert, self.server_key = write_self_signed_cert(
+            os.path.join(temp_dir, 'server'))
+        self.client_cert = write_self_signed_cert(os.path.join(temp_dir, 'client'),
+                                                  host='sfctl-client')
+
+        contexts_patch = patch('sfctl.tls._CONTEXTS', new={})
+        contexts_patch.start()
+        self.addCleanup(contexts_patch.stop)
+
+        # requests would verify against these bundles rather than the CA of the session
+        env_patch = patch.dict(os.environ)
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        for name in ('REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE'):
+            os.environ.pop(name, None)
+
+    def start_server(self, maximum_version=ssl.TLSVersion.MAXIMUM_SUPPORTED):
+        """Start a gateway accepting the client certificate"""
+        server = GatewayServer(self.server_cert, self.server_key, self.client_cert[0],
+                               maximum_version)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def signed_session(self):
+        """A session configured as for a Service Fabric client with certificate auth"""
+        auth = ClientCertAuthentication(self.client_cert, self.server_cert)
+        session = auth.signed_session()
+        pooled_session_callback(1, 10)(session, RequestHTTPSenderConfiguration(), {})
+        return session
+
+    def test_sessions_resumed(self):
+        """Only the first connection to a server does a full handshake, over TLS 1.2 and
+        TLS 1.3, including connections of other sessions with the same certificates"""
+        for version in (ssl.TLSVersion.TLSv1_2, ssl.TLSVersion.TLSv1_3):
+            server = self.start_server(version)
+            for _ in range(2):
+                with self.signed_session() as session:
+                    for _ in range(3):
+                        response = session.get(server.endpoint)
+                        self.assertEqual('sfctl-client', response.text)
+
+            self.assertEqual([False] + [True] * 5, server.resumed, msg=version)
+
+    def test_sessions_resumed_across_threads(self):
+        """Connections opened by other threads resume the session of the first one"""
+        server = self.start_server()
+        session = self.signed_session()
+        self.addCleanup(session.close)
+        session.get(server.endpoint)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(lambda _: session.get(server.endpoint), range(8)))
+
+        self.assertEqual(['sfctl-client'] * 8, [response.text for response in responses])
+        self.assertEqual([False] + [True] * 8, server.resumed)
+
+    def test_context_shared(self):
+        """Contexts are shared by settings, and created again when a certificate changes"""
+        context = tls.get_ssl_context(self.server_cert, self.client_cert)
+
+        self.assertIs(context, tls.get_ssl_context(self.server_cert, list(self.client_cert)))
+        self.assertIsNot(context, tls.get_ssl_context(True, self.client_cert))
+        no_verify = tls.get_ssl_context(False, None)
+        self.assertEqual(ssl.CERT_NONE, no_verify.verify_mode)
+        self.assertFalse(no_verify.check_hostname)
+
+        stat = os.stat(self.client_cert[0])
+        os.utime(self.client_cert[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        renewed = tls.get_ssl_context(self.server_cert, self.client_cert)
+        self.assertIsNot(context, renewed)
+        self.assertIs(renewed, tls.get_ssl_context(self.server_cert, self.client_cert))
+
+    def test_missing_certificate(self):
+        """A missing certificate file fails the request, as requests does"""
+        server = self.start_server()
+        auth = ClientCertAuthentication(os.path.join(os.path.dirname(self.server_cert),
+                                                     'missing.pem'), self.server_cert)
+        session = auth.signed_session()
+        self.addCleanup(session.close)
+        pooled_session_callback(1, 10)(session, RequestHTTPSenderConfiguration(), {})
+
+        with self.assertRaises(OSError):
+            session.get(server.endpoint)
@@ -0,0 +1,86 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for uploading application packages from an asyncio event loop"""
+
+import asyncio
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+import requests
+from mock import MagicMock, patch
+import sfctl.config as sf_config
+from sfctl.async_transport import AsyncGatewayClient
+from sfctl.custom_app import upload
+from sfctl.upload_async import upload_to_native_imagestore_async
+from sfctl.tests.mock_server import (find_localhost_free_port, start_mock_server,
+                                     COMMITTED_UPLOADS, UPLOAD_SESSIONS)
+
+
+@unittest.skipUnless(importlib.util.find_spec('aiohttp'), 'aiohttp is not installed')
+class UploadAsyncTests(unittest.TestCase):
+    """Asyncio upload tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """A class method called before tests in an individual class are run"""
+        cls.port = find_localhost_free_port()
+
+        # Start mock server
+        start_mock_server(cls.port)
+
+    def make_package(self, contents):
+        """Write an application package with the given file contents, and return its path"""
+        src_dir = os.path.join(tempfile.mkdtemp(), 'AsyncApp')
+        self.addCleanup(shutil.rmtree, os.path.dirname(src_dir))
+        os.makedirs(os.path.join(src_dir, 'Code'))
+        for name, content in contents.items():
+            with open(os.path.join(src_dir, name), 'wb') as src_file:
+                src_file.write(content)
+        return src_dir
+
+    def test_upload_async_transport(self):
+        """The asyncio transport uploads whole files, chunks of large files and folder
+        markers"""
+
+        contents = {'ApplicationManifest.xml': b'<app/>', 'Code/empty.txt': b'',
+                    'Code/large.bin': os.urandom(5000)}
+        src_dir = self.make_package(contents)
+
+        with requests.Session() as sesh:
+            asyncio.run(upload_to_native_imagestore_async(
+                AsyncGatewayClient(sesh, 4), 'http://localhost:' + str(self.port), src_dir,
+                'AsyncApp', False, 60, chunk_size=2000, chunk_concurrency=2, concurrency=4))
+
+        for name, content in contents.items():
+            self.assertEqual(content, COMMITTED_UPLOADS['AsyncApp/' + name])
+        self.assertIn('AsyncApp/_.dir', COMMITTED_UPLOADS)
+        self.assertIn('AsyncApp/Code/_.dir', COMMITTED_UPLOADS)
+        self.assertEqual({}, UPLOAD_SESSIONS)
+
+    def test_upload_async_transport_aad(self):
+        """Uploads to clusters secured with AAD send the AAD token"""
+        src_dir = self.make_package({'ApplicationManifest.xml': b'<app/>'})
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        token_manager = MagicMock()
+        token_manager.get_access_token.return_value = 'aad-token'
+        sent_headers = []
+
+        async def record_headers(client, *_, **__):
+            sent_headers.append(client.headers)
+
+        with patch('sfctl.config.SF_CLI_CONFIG_DIR', new=config_dir), \
+                patch('sfctl.config._SNAPSHOTS', new={}), \
+                patch('sfctl.aad_token.get_token_manager', return_value=token_manager), \
+                patch('sfctl.custom_app.upload_to_native_imagestore_async', new=record_headers):
+            sf_config.set_cluster_endpoint('http://localhost:' + str(self.port))
+            sf_config.set_auth(aad=True)
+            upload(src_dir, show_progress=False, async_transport=True)
+
+        self.assertEqual([{'Authorization': 'Bearer aad-token'}], sent_headers)
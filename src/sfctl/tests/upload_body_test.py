@@ -0,0 +1,64 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for reading package files as upload request bodies"""
+
+import mmap
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from mock import patch
+from sfctl.upload_body import open_upload_body
+
+
+class UploadBodyTests(unittest.TestCase):
+    """Upload body tests"""
+
+    def setUp(self):
+        (test_fd, self.test_path) = tempfile.mkstemp()
+        self.addCleanup(os.remove, self.test_path)
+        self.content = os.urandom(3 * mmap.ALLOCATIONGRANULARITY + 5)
+        with os.fdopen(test_fd, 'wb') as test_file:
+            test_file.write(self.content)
+
+    def test_mapped_body(self):
+        """Files and ranges of files are mapped as upload bodies"""
+        with open_upload_body(self.test_path) as body:
+            self.assertIsInstance(body, memoryview)
+            self.assertEqual(len(self.content), len(body))
+            self.assertEqual(self.content, bytes(body))
+
+        offset = mmap.ALLOCATIONGRANULARITY + 3
+        with open_upload_body(self.test_path, offset, 100) as body:
+            self.assertEqual(100, len(body))
+            self.assertEqual(self.content[offset:offset + 100], bytes(body))
+
+    def test_block_body(self):
+        """Files which cannot be mapped are read in blocks into a reused buffer"""
+        offset = mmap.ALLOCATIONGRANULARITY + 3
+
+        def read_blocks():
+            with open_upload_body(self.test_path, offset, 2500) as body:
+                return len(body), [bytes(block) for block in body]
+
+        # The block buffer is kept per thread, so the blocks are read on a new thread, which
+        # allocates a buffer of the patched size
+        with patch('sfctl.upload_body.mmap.mmap', side_effect=OSError()), \
+                patch('sfctl.upload_body.BLOCK_SIZE', new=1000), \
+                ThreadPoolExecutor(max_workers=1) as executor:
+            length, blocks = executor.submit(read_blocks).result()
+
+        self.assertEqual(2500, length)
+        self.assertEqual([1000, 1000, 500], [len(block) for block in blocks])
+        self.assertEqual(self.content[offset:offset + 2500], b''.join(blocks))
+
+    def test_empty_body(self):
+        """Empty files are sent as an empty body"""
+        with open(self.test_path, 'wb'):
+            pass
+        with open_upload_body(self.test_path) as body:
+            self.assertEqual(b'', body)
@@ -0,0 +1,40 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for listing the files already uploaded to an image store"""
+
+import unittest
+from time import time
+from urllib import parse
+from mock import MagicMock
+from sfctl.upload_manifest import get_native_imagestore_file_sizes
+
+
+class UploadManifestTests(unittest.TestCase):
+    """Upload manifest tests"""
+
+    def test_native_imagestore_file_sizes(self):
+        """The content of the image store is listed recursively, relative to the package"""
+
+        contents = {
+            '/ImageStore/App': {'StoreFiles': [{'StoreRelativePath': 'App\\ApplicationManifest.xml',
+                                                'FileSize': '10'}],
+                                'StoreFolders': [{'StoreRelativePath': 'App\\Code'}]},
+            '/ImageStore/App/Code': {'StoreFiles': [{'StoreRelativePath': 'App\\Code\\a.dll',
+                                                     'FileSize': '20'}]}
+        }
+
+        def get(url, **_):
+            response = MagicMock()
+            response.status_code = 200
+            response.json.return_value = contents[parse.urlparse(url).path]
+            return response
+
+        sesh = MagicMock()
+        sesh.get.side_effect = get
+        self.assertEqual({'ApplicationManifest.xml': 10, 'Code/a.dll': 20},
+                         get_native_imagestore_file_sizes(sesh, 'http://localhost', 'App',
+                                                          int(time()) + 60))
@@ -0,0 +1,68 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Tests for tracking the progress of application package uploads"""
+
+import json
+import unittest
+from io import StringIO
+from mock import patch
+from sfctl.upload_progress import UploadProgress
+
+
+class UploadProgressTests(unittest.TestCase):
+    """Upload progress tests"""
+
+    def test_upload_progress(self):
+        """Bytes are counted as tracked bodies are sent, the ETA uses the recent throughput,
+        and JSON progress lines are throttled"""
+        now = [100.0]
+        stream = StringIO()
+        progress = UploadProgress(json_stream=stream, clock=lambda: now[0])
+        progress.add_total(30 * 1024 * 1024, 2)
+
+        with patch('sfctl.upload_progress.TRACK_BLOCK_SIZE', new=4 * 1024 * 1024):
+            body = progress.track(memoryview(bytearray(10 * 1024 * 1024)))
+            blocks = []
+            for block in body:
+                blocks.append(len(block))
+                now[0] += 1
+        self.assertEqual([4 * 1024 * 1024, 4 * 1024 * 1024, 2 * 1024 * 1024], blocks)
+        self.assertEqual(10 * 1024 * 1024, progress.snapshot()['bytes'])
+
+        # A retried body is counted once
+        body.rewind()
+        self.assertEqual(0, progress.snapshot()['bytes'])
+        progress.file_done(worker='worker-0', size=10 * 1024 * 1024)
+
+        # After a stall longer than the window, the ETA only uses the bytes sent since
+        now[0] += 100
+        progress.add_bytes(1024 * 1024, 'worker-1')
+        now[0] += 1
+        progress.add_bytes(1024 * 1024, 'worker-1')
+        snapshot = progress.snapshot()
+        self.assertEqual(12 * 1024 * 1024, snapshot['bytes'])
+        self.assertEqual(1, snapshot['files'])
+        self.assertEqual(1024 * 1024, snapshot['bytes_per_second'])
+        self.assertEqual(18, snapshot['eta'])
+        self.assertEqual(2 * 1024 * 1024, snapshot['workers']['worker-1']['bytes'])
+        self.assertEqual(1, snapshot['workers']['worker-0']['files'])
+
+        progress.add_bytes(1, 'worker-1')
+        progress.close()
+        progress.close()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        # One progress line per second at most, then a single last line
+        elapsed = [line['elapsed'] for line in lines[:-1]]
+        self.assertTrue(all(later - earlier >= 1 for earlier, later in zip(elapsed,
+                                                                            elapsed[1:])))
+        self.assertEqual(['progress'] * len(elapsed), [line['event'] for line in lines[:-1]])
+        self.assertEqual('complete', lines[-1]['event'])
+        self.assertEqual(12 * 1024 * 1024 + 1, lines[-1]['bytes'])
+
+        # Bodies are not tracked when progress is not shown
+        body = memoryview(b'content')
+        self.assertIs(body, UploadProgress().track(body))
@@ -0,0 +1,213 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""TLS contexts shared by all connections of this process to a cluster.
+
+requests hands the certificate paths of a session to urllib3, which loads the CA bundle and
+client certificate into an SSL context again for every new connection, and does a full TLS
+handshake each time. Instead, one SSL context is built for each combination of CA and client
+certificate, loading the certificates once, and the TLS session of the last connection to a
+server is resumed by the next one. This skips the certificate exchange and verification,
+including the client certificate signature, when a connection is opened again, for example
+by another thread of a batch, by a command run in the daemon after the idle connections were
+closed, or for each cluster of a fan out command run repeatedly.
+
+TLS sessions can only be resumed within the process which created them, so a command run in
+a new sfctl process still does a full handshake for its first connection."""
+
+import os
+import ssl
+import threading
+from requests.adapters import HTTPAdapter
+
+# Contexts of this process, keyed by verify and cert settings. Each value is a tuple of the
+# signatures of the certificate files the context was built from, and the context.
+_CONTEXTS = {}
+_CONTEXTS_LOCK = threading.Lock()
+
+
+class _ResumingSSLSocket(ssl.SSLSocket):  # pylint: disable=abstract-method
+    """SSL socket which saves its TLS session in its context once it can be resumed.
+
+    With TLS 1.3, the server sends the session tickets after the handshake, and they are
+    only processed when data is first read, so the session is saved from recv_into as well
+    as after the handshake."""
+
+    session_key = None
+    session_saved = False
+
+    def recv_into(self, buffer, nbytes=None, flags=0):
+        received = super(_ResumingSSLSocket, self).recv_into(buffer, nbytes, flags)
+        if not self.session_saved:
+            self.context.save_session(self)
+        return received
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    Client SSL context which resumes the last TLS session of each server it connected to.
+
+    Sessions are kept by server hostname and address, and may be resumed by any thread.
+    """
+
+    sslsocket_class = _ResumingSSLSocket
+
+    def __init__(self, *args, **kwargs):  # pylint: disable=unused-argument
+        # SSLContext is initialized by __new__, taking the same arguments
+        super(ResumingSSLContext, self).__init__()
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+
+    def wrap_socket(self, sock, server_side=False,  # pylint: disable=arguments-differ,too-many-arguments
+                    do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        try:
+            key = (server_hostname, sock.getpeername()[:2])
+        except OSError:
+            key = None
+
+        if session is None and key is not None and not server_side:
+            with self.sessions_lock:
+                session = self.sessions.get(key)
+
+        ssl_sock = super(ResumingSSLContext, self).wrap_socket(
+            sock, server_side=server_side, do_handshake_on_connect=do_handshake_on_connect,
+            suppress_ragged_eofs=suppress_ragged_eofs, server_hostname=server_hostname,
+            session=session)
+
+        if not server_side:
+            ssl_sock.session_key = key
+            self.save_session(ssl_sock)
+        return ssl_sock
+
+    def save_session(self, ssl_sock):
+        """Keep the TLS session of a socket for the next connection to the same server,
+        once the session can be resumed"""
+
+        if ssl_sock.session_key is None:
+            return
+
+        session = ssl_sock.session
+        if session is None:
+            return
+        # A TLS 1.3 session can only be resumed once the server sent a ticket for it
+        if ssl_sock.version() == 'TLSv1.3' and not session.has_ticket:
+            return
+
+        with self.sessions_lock:
+            self.sessions[ssl_sock.session_key] = session
+        ssl_sock.session_saved = True
+
+
+def create_ssl_context(verify, cert):
+    """
+    Return an SSL context which verifies the server and presents a client certificate the
+    same way as a requests session with the given settings.
+
+    :param verify: The verify setting of a requests session. False, True for the certifi
+        bundle, or the path of a CA bundle file or directory.
+    :param cert: The cert setting of a requests session. None, the path of a pem file, or a
+        tuple of the paths of the certificate and key.
+    :return: ResumingSSLContext
+    """
+
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    # As urllib3 does for the contexts it creates
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.options |= ssl.OP_NO_COMPRESSION
+
+    if verify is False:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif isinstance(verify, str):
+        if os.path.isdir(verify):
+            context.load_verify_locations(capath=verify)
+        else:
+            context.load_verify_locations(cafile=verify)
+    else:
+        # requests verifies certificates against the certifi bundle by default
+        import certifi
+        context.load_verify_locations(cafile=certifi.where())
+
+    if isinstance(cert, (tuple, list)):
+        context.load_cert_chain(cert[0], cert[1])
+    elif cert:
+        context.load_cert_chain(cert)
+
+    return context
+
+
+def _file_signature(path):
+    """The modification time and size of a file, or None if it cannot be read"""
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_ssl_context(verify, cert):
+    """
+    Return the SSL context for the given verify and cert settings, creating it on first use.
+    The context is created again if any of the certificate files changed, for example when a
+    certificate is renewed.
+
+    :param verify: The verify setting of a requests session
+    :param cert: The cert setting of a requests session
+    :return: ResumingSSLContext
+    """
+
+    if isinstance(cert, list):
+        cert = tuple(cert)
+    paths = list(cert) if isinstance(cert, tuple) else [cert] if cert else []
+    if isinstance(verify, str):
+        paths.append(verify)
+    signature = tuple(_file_signature(path) for path in paths)
+
+    key = (verify, cert)
+    with _CONTEXTS_LOCK:
+        cached = _CONTEXTS.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    context = create_ssl_context(verify, cert)
+
+    with _CONTEXTS_LOCK:
+        _CONTEXTS[key] = (signature, context)
+    return context
+
+
+def clear_ssl_contexts():
+    """Forget the SSL contexts, and so the TLS sessions, kept by this process"""
+
+    with _CONTEXTS_LOCK:
+        _CONTEXTS.clear()
+
+
+class SharedContextAdapter(HTTPAdapter):
+    """
+    HTTP adapter which connects to HTTPS servers with the shared SSL context of the verify
+    and cert settings of the request, rather than passing the certificate paths to urllib3.
+    """
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super(
+            SharedContextAdapter, self).build_connection_pool_key_attributes(
+                request, verify, cert)
+
+        if host_params['scheme'] == 'https':
+            # The certificates are loaded in the context, so they are left out of the pool
+            # settings, which urllib3 would otherwise load for every connection
+            pool_kwargs = {'cert_reqs': pool_kwargs['cert_reqs'],
+                           'ssl_context': get_ssl_context(verify, cert)}
+
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url, verify, cert):
+        # Connection pools of HTTPS servers get the certificates from their SSL context
+        if not url.lower().startswith('https'):
+            super(SharedContextAdapter, self).cert_verify(conn, url, verify, cert)
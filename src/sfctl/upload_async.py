@@ -0,0 +1,219 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Upload application packages to the native image store from an asyncio event loop"""
+
+import os
+import sys
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from time import time
+from sfctl.custom_exceptions import SFCTLInternalException
+from sfctl.upload_body import FileBody, open_upload_body
+from sfctl.upload_progress import UploadProgress
+from sfctl.upload_util import (check_timeout_left, get_imagestore_url, get_lesser,
+                               get_timeout_left, get_upload_concurrency,
+                               queue_native_imagestore_upload)
+
+
+@asynccontextmanager
+async def open_upload_body_async(file_path, offset=0, length=None):
+    """
+    Async version of open_upload_body, which opens and maps the file on the default executor.
+    aiohttp sends a memoryview as is, but not a FileBody, so a range which cannot be mapped
+    is read into bytes instead.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    context = open_upload_body(file_path, offset, length)
+    body = await loop.run_in_executor(None, context.__enter__)
+    try:
+        if isinstance(body, FileBody):
+            body = await loop.run_in_executor(None, lambda: b''.join(bytes(block)
+                                                                     for block in body))
+        yield body
+    finally:
+        context.__exit__(None, None, None)
+
+
+async def upload_file_chunks_native_imagestore_async(gateway, endpoint, content_path,  #pylint: disable=too-many-arguments,too-many-locals
+                                                     file_path, target_timeout, chunk_size,
+                                                     chunk_concurrency, chunk_retries=3,
+                                                     progress=None, worker=None):
+    """
+    Async version of upload_file_chunks_native_imagestore, using an AsyncGatewayClient.
+    The bytes of each chunk are counted in progress by worker once the chunk is uploaded.
+
+    :param gateway: sfctl.async_transport.AsyncGatewayClient
+    """
+    import asyncio
+    from sfctl.async_transport import import_aiohttp
+
+    aiohttp = import_aiohttp()
+    file_size = os.path.getsize(file_path)
+    session_id = str(uuid.uuid4())
+    semaphore = asyncio.Semaphore(chunk_concurrency)
+
+    async def upload_chunk(first, last):
+        async with semaphore, open_upload_body_async(file_path, first,
+                                                     last - first + 1) as chunk:
+            attempt = 0
+            while True:
+                current_time_left = check_timeout_left(target_timeout)
+                url = get_imagestore_url(endpoint, content_path + '/$/UploadChunk',
+                                         {'api-version': '6.0',
+                                          'session-id': session_id,
+                                          'timeout': current_time_left})
+                headers = {'Content-Range': 'bytes {0}-{1}/{2}'.format(first, last, file_size)}
+                try:
+                    await gateway.request('PUT', url, data=chunk, headers=headers,
+                                          timeout=current_time_left)
+                    if progress is not None:
+                        progress.add_bytes(len(chunk), worker)
+                    return
+                except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                    status = getattr(ex, 'status', None)
+                    retriable = status is None or status == 429 or status >= 500
+                    if attempt >= chunk_retries or not retriable:
+                        raise
+                    attempt += 1
+                    await asyncio.sleep(get_lesser(2 ** attempt, get_timeout_left(target_timeout)))
+
+    try:
+        await asyncio.gather(*[upload_chunk(first, min(first + chunk_size, file_size) - 1)
+                               for first in range(0, file_size, chunk_size)])
+
+        current_time_left = check_timeout_left(target_timeout)
+        url = get_imagestore_url(endpoint, 'ImageStore/$/CommitUploadSession',
+                                 {'api-version': '6.0',
+                                  'session-id': session_id,
+                                  'timeout': current_time_left})
+        await gateway.request('POST', url, timeout=current_time_left)
+    except BaseException:
+        url = get_imagestore_url(endpoint, 'ImageStore/$/DeleteUploadSession',
+                                 {'api-version': '6.0', 'session-id': session_id})
+        try:
+            await gateway.request('DELETE', url, timeout=10, raise_for_status=False)
+        except Exception:  # pylint: disable=broad-except
+            # Deleting is best effort. The image store removes expired sessions regardless.
+            pass
+        raise
+
+
+async def upload_to_native_imagestore_async(gateway, endpoint, abspath, basename, #pylint: disable=too-many-locals,too-many-arguments,too-many-statements
+                                            show_progress, timeout, chunk_size=None,
+                                            chunk_concurrency=1, manifest=None, concurrency=None,
+                                            progress_json=False):
+    """
+    Upload the application package to cluster from an asyncio event loop
+
+    Same as upload_to_native_imagestore, with concurrency coroutines taking files and folder
+    markers from the same queues, rather than a pool of threads.
+
+    :param gateway: sfctl.async_transport.AsyncGatewayClient, not yet entered
+    :param progress_json: (bool) Write progress to stderr as JSON lines rather than showing
+        a progress bar
+    """
+    import asyncio
+
+    target_timeout = int(time()) + timeout
+    concurrency = concurrency or get_upload_concurrency()
+    folders, file_queue, _ = queue_native_imagestore_upload(abspath, manifest)
+    marker_queue = deque(folder for folder in folders if folder[2] == 0)
+    progress = UploadProgress(show_progress, sys.stderr if progress_json else None)
+    progress.add_total(sum(os.path.getsize(os.path.join(abspath, rel_file_path))
+                           for _, _, rel_file_path in file_queue), len(file_queue))
+
+    async def upload_file(folder, single_file, worker_name):
+        url_path = (
+            os.path.normpath(os.path.join('ImageStore', basename, folder[0], single_file))
+        ).replace('\\', '/')
+        fp_norm = os.path.normpath(os.path.join(folder[1], single_file))
+
+        if chunk_size and os.path.getsize(fp_norm) > chunk_size:
+            await upload_file_chunks_native_imagestore_async(gateway, endpoint, url_path,
+                                                             fp_norm, target_timeout,
+                                                             chunk_size, chunk_concurrency,
+                                                             progress=progress,
+                                                             worker=worker_name)
+            progress.file_done(worker_name)
+            return
+
+        current_time_left = check_timeout_left(target_timeout)
+        async with open_upload_body_async(fp_norm) as body:
+            url = get_imagestore_url(endpoint, url_path,
+                                     {'api-version': '6.1', 'timeout': current_time_left})
+            await gateway.request('PUT', url, data=body, timeout=current_time_left)
+            progress.file_done(worker_name, size=len(body))
+
+    async def upload_marker(folder):
+        current_time_left = check_timeout_left(target_timeout)
+        url_path = (
+            os.path.normpath(os.path.join('ImageStore', basename, folder[0], '_.dir'))
+        ).replace('\\', '/')
+        url = get_imagestore_url(endpoint, url_path,
+                                 {'api-version': '6.1', 'timeout': current_time_left})
+        try:
+            await gateway.request('PUT', url, data=b'', timeout=current_time_left)
+        except asyncio.TimeoutError:
+            raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
+                                         'timeout duration.')
+
+    async def worker(worker_name):
+        while marker_queue or file_queue:
+            if marker_queue:
+                folder = marker_queue.popleft()
+                await upload_marker(folder)
+                continue
+
+            folder, single_file, rel_file_path = file_queue.popleft()
+            try:
+                await upload_file(folder, single_file, worker_name)
+            except Exception as e:
+                print(e)
+                raise SFCTLInternalException('Upload has timed out. Consider passing a '
+                                             'longer timeout duration.')
+            if manifest is not None:
+                manifest.mark_uploaded([rel_file_path])
+
+            folder[2] -= 1
+            if folder[2] == 0:
+                if manifest is not None:
+                    manifest.save()
+                marker_queue.append(folder)
+
+    async with gateway:
+        if manifest is not None:
+            for rel_file_path in manifest.files_to_delete():
+                current_time_left = check_timeout_left(target_timeout)
+                url = get_imagestore_url(endpoint,
+                                         '/'.join(['ImageStore', basename, rel_file_path]),
+                                         {'api-version': '6.0', 'timeout': current_time_left})
+                status, _ = await gateway.request('DELETE', url, timeout=current_time_left,
+                                                  raise_for_status=False)
+                if status >= 400 and status != 404:
+                    raise SFCTLInternalException('Deleting {0} from the image store failed '
+                                                 'with status {1}'.format(rel_file_path, status))
+                manifest.mark_deleted([rel_file_path])
+            manifest.save()
+
+        workers = [asyncio.ensure_future(worker('worker-{0}'.format(index)))
+                   for index in range(concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            # Do not start the uploads still queued, but keep what was uploaded
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if manifest is not None:
+                manifest.save()
+            progress.close(failed=True)
+            raise
+
+    progress.close(show_progress)
@@ -0,0 +1,112 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Read the files of application packages as the bodies of upload requests.
+
+A file, or the range of a file sent as one chunk, is mapped in memory rather than read, and
+the body is a memoryview of the mapping. requests and aiohttp pass a memoryview as is to the
+socket, so the pages of the file go from the page cache to the socket without being read
+through Python file buffers or copied into bytes objects.
+
+Files which cannot be mapped, such as files on some network file systems, are read in blocks
+into a buffer of BLOCK_SIZE bytes kept per thread, and reused for every block."""
+
+import os
+import mmap
+import threading
+from contextlib import contextmanager
+
+BLOCK_SIZE = 1024 * 1024
+
+_buffers = threading.local()
+
+
+def _get_block_buffer():
+    """Return the block buffer of the current thread"""
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _buffers.buffer = bytearray(BLOCK_SIZE)
+    return buffer
+
+
+class FileBody:  # pylint: disable=too-few-public-methods
+    """
+    A range of a file sent as a request body in blocks, when the file cannot be mapped.
+
+    Each block is read into the buffer of the current thread, and yielded as a memoryview of
+    it, so each block must be sent before the next one is read. The length is known, so that
+    the request has a Content-Length rather than being sent in chunked encoding.
+
+    :param file_opened: A file object opened in binary mode
+    :param offset: (int) Position of the first byte to send
+    :param length: (int) Number of bytes to send
+    """
+
+    def __init__(self, file_opened, offset, length):
+        self.file_opened = file_opened
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        buffer = memoryview(_get_block_buffer())
+        self.file_opened.seek(self.offset)
+        left = self.length
+        while left > 0:
+            read = self.file_opened.readinto(buffer[:min(left, BLOCK_SIZE)])
+            if not read:
+                raise IOError('{0} is shorter than expected'.format(self.file_opened.name))
+            left -= read
+            yield buffer[:read]
+
+
+@contextmanager
+def open_upload_body(file_path, offset=0, length=None):
+    """
+    Open a file, or a range of it, as a request body. The body may only be used until the
+    context is exited.
+
+    :param file_path: (str) Path of the file
+    :param offset: (int) Position of the first byte of the range
+    :param length: (int) Number of bytes of the range. Defaults to the rest of the file.
+    :return: A memoryview of the mapped range, or a FileBody if the file cannot be mapped.
+        Both have the length of the range.
+    """
+
+    with open(file_path, 'rb') as file_opened:
+        if length is None:
+            length = os.fstat(file_opened.fileno()).st_size - offset
+
+        if length == 0:
+            yield b''
+            return
+
+        # Mappings start at a multiple of the allocation granularity
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        try:
+            mapped = mmap.mmap(file_opened.fileno(), offset - start + length,
+                               access=mmap.ACCESS_READ, offset=start)
+        except (OSError, ValueError):
+            yield FileBody(file_opened, offset, length)
+            return
+
+        view = memoryview(mapped)
+        body = view[offset - start:]
+        try:
+            yield body
+        finally:
+            # The client may keep a reference to the body, for example in the request of a
+            # response, so the views are released for the mapping to be closed
+            try:
+                body.release()
+                view.release()
+                mapped.close()
+            except BufferError:
+                # Another view of the body is still in use. The mapping is closed once it
+                # is no longer referenced.
+                pass
@@ -0,0 +1,257 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Read and write the manifests of application packages uploaded incrementally.
+
+An upload manifest records the size, modification time and SHA-256 hash of every file of
+an application package which was uploaded to an image store. It is keyed by the cluster
+endpoint, the image store and the destination path, and is stored under the sfctl config
+directory. The next incremental upload of the package only sends the files whose hash
+changed, and files are recorded as soon as they are uploaded, so that an interrupted upload
+resumes where it stopped. Hashes are only recomputed for files whose size or modification
+time changed since they were recorded."""
+
+import os
+import json
+import hashlib
+import posixpath
+from knack.log import get_logger
+from sfctl.config import SF_CLI_CONFIG_DIR
+from sfctl.custom_exceptions import SFCTLInternalException
+from sfctl.upload_util import get_imagestore_url, get_lesser, get_timeout_left
+
+UPLOAD_MANIFEST_DIR_NAME = 'upload_manifests'
+
+logger = get_logger(__name__)  # pylint: disable=invalid-name
+
+
+def get_upload_manifest_path(endpoint, imagestore_string, basename):
+    """
+    Returns the path of the manifest of a package uploaded to the given destination.
+
+    :param endpoint: (str) The cluster endpoint
+    :param imagestore_string: (str) The image store connection string
+    :param basename: (str) The destination path of the package in the image store
+    :return: str
+    """
+    key = json.dumps([endpoint, imagestore_string, basename])
+    return os.path.join(SF_CLI_CONFIG_DIR, UPLOAD_MANIFEST_DIR_NAME,
+                        hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+
+def hash_file(file_path):
+    """
+    Return the SHA-256 hash of the content of a file.
+
+    :param file_path: (str) Path of the file
+    :return: (str) hex digest
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file_opened:
+        for block in iter(lambda: file_opened.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_package_files(abspath, known_files=None):
+    """
+    Describe every file of a package.
+
+    :param abspath: (str) The package folder
+    :param known_files: dict returned by an earlier call. The hash of a file with the same
+        size and modification time as in known_files is reused rather than computed again.
+    :return: dict mapping the path of each file relative to abspath, with / separators,
+        to a dict with the keys size, mtime and sha256
+    """
+
+    known_files = known_files or {}
+    package_files = {}
+
+    for root, _, files in os.walk(abspath):
+        for single_file in files:
+            file_path = os.path.join(root, single_file)
+            rel_file_path = os.path.relpath(file_path, abspath).replace(os.sep, '/')
+            stat = os.stat(file_path)
+
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+            known_entry = known_files.get(rel_file_path) or {}
+            if known_entry.get('size') == entry['size'] and \
+                    known_entry.get('mtime') == entry['mtime'] and known_entry.get('sha256'):
+                entry['sha256'] = known_entry['sha256']
+            else:
+                entry['sha256'] = hash_file(file_path)
+
+            package_files[rel_file_path] = entry
+
+    return package_files
+
+
+def get_fileshare_file_sizes(dest):
+    """
+    Return the size of every file under a folder of the file share image store
+
+    :param dest: The folder of the package in the file share.
+    :return: dict mapping paths relative to dest, with / separators, to sizes in bytes
+    """
+    sizes = {}
+    for root, _, files in os.walk(dest):
+        for single_file in files:
+            file_path = os.path.join(root, single_file)
+            sizes[os.path.relpath(file_path, dest).replace(os.sep, '/')] = \
+                os.path.getsize(file_path)
+    return sizes
+
+
+def get_native_imagestore_file_sizes(sesh, endpoint, basename, target_timeout):
+    """
+    Return the size of every file under a folder of the native image store
+
+    :param sesh: A requests (module) session object.
+    :param endpoint: Connection url endpoint for upload requests.
+    :param basename: Image store path of the folder.
+    :param target_timeout: Time at which timeout would be reached.
+    :return: dict mapping paths relative to basename, with / separators, to sizes in bytes
+    """
+    sizes = {}
+    folders = [basename]
+
+    while folders:
+        folder = folders.pop()
+        current_time_left = get_timeout_left(target_timeout)
+
+        if current_time_left == 0:
+            raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
+                                         'timeout duration.')
+
+        url = get_imagestore_url(endpoint, 'ImageStore/' + folder,
+                                 {'api-version': '6.2', 'timeout': current_time_left})
+        res = sesh.get(url, timeout=(get_lesser(60, current_time_left), current_time_left))
+        if res.status_code == 404:
+            continue
+        res.raise_for_status()
+        content = res.json() if res.content else {}
+
+        for store_file in content.get('StoreFiles') or []:
+            store_path = store_file['StoreRelativePath'].replace('\\', '/')
+            sizes[posixpath.relpath(store_path, basename)] = int(store_file['FileSize'])
+        for store_folder in content.get('StoreFolders') or []:
+            folders.append(store_folder['StoreRelativePath'].replace('\\', '/'))
+
+    return sizes
+
+
+def delete_native_imagestore_file(sesh, endpoint, content_path, target_timeout):
+    """
+    Delete a file from the native image store. Files which do not exist are ignored.
+
+    :param sesh: A requests (module) session object.
+    :param endpoint: Connection url endpoint for upload requests.
+    :param content_path: Image store relative path of the file, for example
+        ImageStore/App/Pkg/Code/service.exe
+    :param target_timeout: Time at which timeout would be reached.
+    """
+    current_time_left = get_timeout_left(target_timeout)
+
+    if current_time_left == 0:
+        raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
+                                     'timeout duration.')
+
+    url = get_imagestore_url(endpoint, content_path,
+                             {'api-version': '6.0', 'timeout': current_time_left})
+    res = sesh.delete(url, timeout=(get_lesser(60, current_time_left), current_time_left))
+    if res.status_code != 404:
+        res.raise_for_status()
+
+
+class UploadManifest:
+    """
+    The files of a package already uploaded to a destination, and the files of the package
+    as it is now.
+
+    :param manifest_path: (str) Path returned by get_upload_manifest_path
+    :param abspath: (str) The package folder
+    """
+
+    def __init__(self, manifest_path, abspath):
+        self.manifest_path = manifest_path
+        self.uploaded_files = self._load()
+        self.package_files = get_package_files(abspath, self.uploaded_files)
+
+    def _load(self):
+        """Read the files recorded by the last upload. Returns an empty dict if there is
+        no manifest, or it cannot be read."""
+
+        try:
+            with open(self.manifest_path, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}
+
+        files = manifest.get('files') if isinstance(manifest, dict) else None
+        return files if isinstance(files, dict) else {}
+
+    def needs_upload(self, rel_file_path):
+        """
+        Return True if the file is not in the destination, or has changed since it was
+        uploaded.
+
+        :param rel_file_path: (str) Path relative to the package folder, with / separators
+        :return: bool
+        """
+        uploaded = self.uploaded_files.get(rel_file_path) or {}
+        return uploaded.get('sha256') != self.package_files[rel_file_path]['sha256']
+
+    def files_to_delete(self):
+        """
+        Return the files which were uploaded but are no longer part of the package.
+
+        :return: sorted list of paths relative to the package folder, with / separators
+        """
+        return sorted(set(self.uploaded_files) - set(self.package_files))
+
+    def verify(self, destination_sizes):
+        """
+        Forget the uploaded files which are missing from the destination, or whose size there
+        is different, so that they are uploaded again.
+
+        :param destination_sizes: dict mapping paths relative to the package folder, with
+            / separators, to the size of the file in the destination
+        :return: None
+        """
+        for rel_file_path, uploaded in list(self.uploaded_files.items()):
+            if destination_sizes.get(rel_file_path) != uploaded.get('size'):
+                del self.uploaded_files[rel_file_path]
+
+    def mark_uploaded(self, rel_file_paths):
+        """Record that the given files of the package were uploaded"""
+        for rel_file_path in rel_file_paths:
+            self.uploaded_files[rel_file_path] = self.package_files[rel_file_path]
+
+    def mark_deleted(self, rel_file_paths):
+        """Record that the given files were deleted from the destination"""
+        for rel_file_path in rel_file_paths:
+            self.uploaded_files.pop(rel_file_path, None)
+
+    def save(self):
+        """
+        Write the uploaded files to the manifest. The manifest is written to a temporary
+        file first and then renamed, so that an interrupted upload never leaves a partially
+        written manifest. Failures are logged and otherwise ignored, since the next upload
+        then only sends more files than needed.
+        """
+
+        manifest_dir = os.path.dirname(self.manifest_path)
+        temp_path = '{0}.{1}.tmp'.format(self.manifest_path, os.getpid())
+
+        try:
+            if not os.path.isdir(manifest_dir):
+                os.makedirs(manifest_dir)
+            with open(temp_path, 'w') as manifest_file:
+                json.dump({'files': self.uploaded_files}, manifest_file)
+            os.replace(temp_path, self.manifest_path)
+        except OSError as ex:
+            logger.debug('Unable to write upload manifest to %s: %s', self.manifest_path,
+                         str(ex))
@@ -0,0 +1,268 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Track the progress of application package uploads in bytes.
+
+UploadProgress counts the bytes sent by all the threads or coroutines of an upload, and
+the bytes sent by each of them. Bodies sent through requests are wrapped with track, and
+counted as each block is handed to the socket. The ETA is computed from the throughput
+over the last RATE_WINDOW seconds, rather than from the throughput since the start.
+
+Progress is shown on stderr as a progress bar, or written to stderr as one JSON object per
+line, at most every JSON_INTERVAL seconds and once the upload completes."""
+
+from __future__ import print_function
+
+import sys
+import json
+import threading
+from collections import deque
+from time import time
+from tqdm import tqdm
+from sfctl.upload_body import FileBody
+
+# Seconds over which the throughput is averaged to compute the ETA
+RATE_WINDOW = 10
+
+# Minimum number of seconds between two JSON progress lines
+JSON_INTERVAL = 1
+
+# Size in bytes of the blocks in which tracked bodies are sent and counted
+TRACK_BLOCK_SIZE = 1024 * 1024
+
+
+class ProgressBody:  # pylint: disable=too-few-public-methods
+    """
+    A request body which counts its bytes as they are sent. The blocks of a memoryview are
+    slices of it, so wrapping a body does not copy it.
+
+    :param body: A memoryview or FileBody, as returned by open_upload_body
+    :param progress: UploadProgress
+    """
+
+    def __init__(self, body, progress):
+        self.body = body
+        self.progress = progress
+        self.sent = 0
+
+    def __len__(self):
+        return len(self.body)
+
+    def __iter__(self):
+        self.sent = 0
+        if isinstance(self.body, FileBody):
+            blocks = iter(self.body)
+        else:
+            blocks = (self.body[first:first + TRACK_BLOCK_SIZE]
+                      for first in range(0, len(self.body), TRACK_BLOCK_SIZE))
+        for block in blocks:
+            yield block
+            # The block was sent once the next one is asked for
+            self.sent += len(block)
+            self.progress.add_bytes(len(block))
+
+    def rewind(self):
+        """Stop counting the bytes sent so far, before the body is sent again"""
+        self.progress.add_bytes(-self.sent)
+        self.sent = 0
+
+
+class UploadCounts:  # pylint: disable=too-few-public-methods
+    """
+    The bytes and files of an upload, in total and by each worker.
+
+    :param start: Time at which the upload started
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.total_bytes = 0
+        self.total_files = 0
+        self.sent_bytes = 0
+        self.done_files = 0
+        # Worker name to a dict of its bytes, files and last activity time
+        self.workers = {}
+        # (time, sent bytes) samples over the last RATE_WINDOW seconds
+        self.samples = deque([(start, 0)])
+
+    def worker(self, name, now):
+        """Return the stats of a worker, by default the current thread"""
+        name = name or threading.current_thread().name
+        stats = self.workers.get(name)
+        if stats is None:
+            stats = self.workers[name] = {'bytes': 0, 'files': 0, 'last': now}
+        return stats
+
+
+class UploadProgress:
+    """
+    The bytes and files uploaded so far, in total and by each worker.
+
+    :param show_progress: (bool) Show a progress bar on stderr
+    :param json_stream: File to write JSON progress lines to instead of the progress bar,
+        such as sys.stderr, or None
+    :param clock: Function returning the current time. For testing only.
+    """
+
+    def __init__(self, show_progress=False, json_stream=None, clock=time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.counts = UploadCounts(clock())
+        self.json_stream = json_stream
+        self.last_json = None
+        self.closed = False
+        self.progress_bar = None
+        if show_progress and json_stream is None:
+            self.progress_bar = tqdm(desc='Uploading', total=0, unit='B', unit_scale=True,
+                                     unit_divisor=1024,
+                                     bar_format='{desc}: {percentage:3.0f}%|{bar}| '
+                                                '{n_fmt}/{total_fmt} '
+                                                '[{elapsed}, {rate_fmt}{postfix}]')
+
+    @property
+    def enabled(self):
+        """True if progress is shown or written, so that bodies are worth tracking"""
+        return self.progress_bar is not None or self.json_stream is not None
+
+    def track(self, body):
+        """
+        Return a body which counts its bytes as they are sent, or body itself if progress is
+        not shown or body is empty.
+        """
+        if not self.enabled or not len(body):  # pylint: disable=len-as-condition
+            return body
+        return ProgressBody(body, self)
+
+    def add_total(self, total_bytes, total_files=1):
+        """Add files to upload, of total_bytes bytes in total"""
+        with self.lock:
+            self.counts.total_bytes += total_bytes
+            self.counts.total_files += total_files
+            if self.progress_bar is not None:
+                self.progress_bar.total = self.counts.total_bytes
+                self._refresh_bar()
+
+    def add_bytes(self, count, worker=None):
+        """Count bytes sent by a worker, or stop counting them if count is negative"""
+        with self.lock:
+            now = self.clock()
+            counts = self.counts
+            stats = counts.worker(worker, now)
+            stats['bytes'] += count
+            stats['last'] = now
+            counts.sent_bytes += count
+            counts.samples.append((now, counts.sent_bytes))
+            while len(counts.samples) > 1 and counts.samples[0][0] < now - RATE_WINDOW:
+                counts.samples.popleft()
+            if self.progress_bar is not None:
+                self.progress_bar.update(count)
+            self._write_json(now)
+
+    def file_done(self, worker=None, size=None):
+        """
+        Count a file uploaded by a worker. size is the size of a file whose bytes were not
+        counted as they were sent.
+        """
+        if size:
+            self.add_bytes(size, worker)
+        with self.lock:
+            now = self.clock()
+            stats = self.counts.worker(worker, now)
+            stats['files'] += 1
+            stats['last'] = now
+            self.counts.done_files += 1
+            self._refresh_bar()
+            self._write_json(now)
+
+    def rate(self):
+        """Return the throughput in bytes per second over the last RATE_WINDOW seconds"""
+        now = self.clock()
+        first_time, first_bytes = self.counts.samples[0]
+        if now <= first_time:
+            return 0.0
+        return (self.counts.sent_bytes - first_bytes) / float(now - first_time)
+
+    def eta(self):
+        """Return the number of seconds left at the current rate, or None if unknown"""
+        rate = self.rate()
+        if rate <= 0:
+            return None
+        return max(self.counts.total_bytes - self.counts.sent_bytes, 0) / rate
+
+    def snapshot(self, event='progress'):
+        """Return the progress as a JSON serializable dict"""
+        now = self.clock()
+        eta = self.eta()
+        return {
+            'event': event,
+            'elapsed': round(now - self.counts.start, 3),
+            'bytes': self.counts.sent_bytes,
+            'total_bytes': self.counts.total_bytes,
+            'files': self.counts.done_files,
+            'total_files': self.counts.total_files,
+            'bytes_per_second': round(self.rate(), 1),
+            'eta': None if eta is None else round(eta, 1),
+            'workers': dict((name, {'bytes': stats['bytes'], 'files': stats['files'],
+                                    'bytes_per_second': round(self._worker_rate(stats), 1)})
+                            for name, stats in sorted(self.counts.workers.items()))
+        }
+
+    def _worker_rate(self, stats):
+        """Return the throughput of a worker, in bytes per second until its last activity"""
+        active = stats['last'] - self.counts.start
+        return stats['bytes'] / active if active > 0 else 0.0
+
+    def _refresh_bar(self):
+        """Show the ETA and the number of files in the progress bar"""
+        if self.progress_bar is None:
+            return
+        eta = self.eta()
+        self.progress_bar.set_postfix_str('ETA {0}, {1}/{2} files'.format(
+            '?' if eta is None else tqdm.format_interval(eta), self.counts.done_files,
+            self.counts.total_files), refresh=False)
+
+    def _write_json(self, now, event='progress'):
+        """Write a JSON progress line, unless one was written less than JSON_INTERVAL ago"""
+        if self.json_stream is None:
+            return
+        if event == 'progress' and self.last_json is not None and \
+                now - self.last_json < JSON_INTERVAL:
+            return
+        self.last_json = now
+        print(json.dumps(self.snapshot(event)), file=self.json_stream)
+        self.json_stream.flush()
+
+    def close(self, show_progress=False, failed=False):
+        """
+        Close the progress bar and print a summary with the stats of each worker if
+        show_progress is set, or write the last JSON progress line. Only the first call
+        has an effect.
+
+        :param show_progress: (bool) Print the summary
+        :param failed: (bool) The upload failed. No summary is printed, and the event of
+            the last JSON progress line is failed rather than complete.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.progress_bar is not None:
+                self._refresh_bar()
+                self.progress_bar.close()
+                self.progress_bar = None
+            if self.json_stream is not None:
+                self._write_json(self.clock(), 'failed' if failed else 'complete')
+                return
+
+        if show_progress and not failed:
+            elapsed = self.clock() - self.counts.start
+            sent_mb = self.counts.sent_bytes / 1024.0 / 1024
+            print('Complete. Uploaded {0:.1f} MB in {1:.1f} s, {2:.1f} MB/s'.format(
+                sent_mb, elapsed, sent_mb / max(elapsed, 0.001)), file=sys.stderr)
+            for name, stats in sorted(self.counts.workers.items()):
+                print('  {0}: {1:.1f} MB, {2} files, {3:.1f} MB/s'.format(
+                    name, stats['bytes'] / 1024.0 / 1024, stats['files'],
+                    self._worker_rate(stats) / 1024 / 1024), file=sys.stderr)
@@ -0,0 +1,139 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# -----------------------------------------------------------------------------
+
+"""Helpers shared by the modules uploading application packages to an image store"""
+
+import os
+from collections import deque
+from multiprocessing import cpu_count
+from time import time
+from sfctl.custom_exceptions import SFCTLInternalException
+
+
+def get_timeout_left(target_timeout):
+    """
+    Return the number of seconds until timeout is reached, given a target_timeout which represents
+      the time at which the timer should stop. If the time left is less than 0, return 0
+    :param target_timeout: time measured as from epoch in seconds
+    :return: int
+    """
+    current_time = int(time())  # time from epoch in seconds
+    time_left = target_timeout - current_time
+
+    if time_left <= 0:
+        return 0
+    return time_left
+
+
+def get_lesser(num_a, num_b):
+    """
+    Return the lesser of int num_a and int num_b. If the lesser number is less than 0, return 0
+    :param num_a: (int)
+    :param num_b: (int)
+    :return: Return the smaller of num_a or num_b.
+    """
+
+    return max(0, min(num_a, num_b))
+
+
+def get_imagestore_url(endpoint, url_path, query):
+    """
+    Return the URL of an image store request
+
+    :param endpoint: Connection url endpoint for upload requests.
+    :param url_path: (str) The path of the request, for example ImageStore/App/file.txt
+    :param query: dict of query parameters
+    :return: str
+    """
+    try:
+        from urllib.parse import urlparse, urlencode, urlunparse
+    except ImportError:
+        from urllib import urlencode
+        from urlparse import urlparse, urlunparse  # pylint: disable=import-error
+
+    url_parsed = list(urlparse(endpoint))
+    url_parsed[2] = url_path
+    url_parsed[4] = urlencode(query)
+    return urlunparse(url_parsed)
+
+
+def check_timeout_left(target_timeout):
+    """
+    Return the number of seconds until target_timeout, or raise an exception if it was reached
+
+    :param target_timeout: Time at which timeout would be reached.
+    :return: int
+    """
+    current_time_left = get_timeout_left(target_timeout)
+
+    if current_time_left == 0:
+        raise SFCTLInternalException('Upload has timed out. Consider passing a longer '
+                                     'timeout duration.')
+    return current_time_left
+
+
+def get_cpu_count():
+    """
+    Test-mockable wrapper for returning cpu count.
+    """
+    try:
+        return cpu_count() or 1
+    except NotImplementedError:
+        return 1
+
+
+def get_upload_concurrency():
+    """
+    Test-mockable wrapper for returning the default number of files uploaded at the same
+    time. Uploads mostly wait on the network, so this does not depend on the number of CPUs.
+    """
+    return 10
+
+
+def queue_native_imagestore_upload(abspath, manifest=None, pending_files=None):
+    """
+    List the folders and files of an application package to upload to the native image store
+
+    :param abspath: Application source path.
+    :param manifest: sfctl.upload_manifest.UploadManifest of an incremental upload, or None
+    :param pending_files: dict mapping the paths of files of the package which are still
+        being written, such as zip files being compressed, to a Future which completes once
+        the file is written
+    :return: (list, deque, dict) The folders, each as a list [rel_path, root, files left to
+        upload], the files to upload, each as a tuple (folder, file name, manifest key), and
+        the files still being written, as a dict mapping each Future to such a tuple
+    """
+
+    pending_files = dict((os.path.normcase(os.path.abspath(path)), future)
+                         for path, future in (pending_files or {}).items())
+    folders = []
+    folders_by_root = {}
+    file_queue = deque()
+    waiting = {}
+
+    for root, _, files in os.walk(abspath):
+        folder = [os.path.normpath(os.path.relpath(root, abspath)), root, 0]
+        folders.append(folder)
+        folders_by_root[os.path.normcase(os.path.abspath(root))] = folder
+        for single_file in files:
+            if os.path.normcase(os.path.abspath(os.path.join(root, single_file))) in \
+                    pending_files:
+                continue
+            rel_file_path = os.path.relpath(os.path.join(root, single_file),
+                                            abspath).replace(os.sep, '/')
+            if manifest is None or manifest.needs_upload(rel_file_path):
+                file_queue.append((folder, single_file, rel_file_path))
+                folder[2] += 1
+
+    for path, future in pending_files.items():
+        folder = folders_by_root.get(os.path.dirname(path))
+        if folder is None:
+            raise SFCTLInternalException('{0} is not in a folder of {1}'.format(path, abspath))
+        rel_file_path = os.path.relpath(path, os.path.normcase(os.path.abspath(abspath)))
+        waiting[future] = (folder, os.path.basename(path), rel_file_path.replace(os.sep, '/'))
+        folder[2] += 1
+
+    return folders, file_queue, waiting